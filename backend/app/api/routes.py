@@ -2,28 +2,45 @@ import logging
 import os
 import json
 import time
+import hmac
 
-import requests
 import shutil
-import zipfile
-import io
-import requests
-import queue
-import threading
 
-from flask import Blueprint, abort, request, jsonify
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from flask import Blueprint, Response, abort, request, jsonify
 from git import Repo, GitCommandError
 from datetime import datetime
+from urllib.parse import urlsplit
 from stat import S_IWUSR, S_IREAD
 
 from services.fake_preprocess import Fake_preprocessor
 from database.database import Database
-from services.preprocess_bug_report import preprocess_bug_report
-from services.preprocess_source_code import preprocess_source_code
+from services.preprocess_bug_report import preprocess_bug_report_text, preprocess_bug_report_with_tokens
+from services.report_archive import ReportArchive
+from services.preprocess_source_code import iter_preprocessed_source_code
+from services.checkpoint import InitializationCheckpoint, PatchStaging
 from services.filter import filter_files
-from experimental_unixcoder.bug_localization import BugLocalization
-
-# Initialize Database
+from services.jobs import JobQueue
+from services.admission import AdmissionController, Overloaded
+from services.cancellation import CancellationRegistry, Cancelled, raise_if_cancelled
+from services.single_flight import SingleFlight, KeyedLock
+from services.debounce import Debouncer
+from services.encoder import get_bug_localizer
+from services.scheduler import get_scheduler, prioritized, INTERACTIVE, INCREMENTAL, BULK
+from services.timing import StageTimer
+from services.metrics import REGISTRY, DB_SECONDS, labeled_by_repo_size, record_repo_size
+from services.notifier import ProbotNotifier
+from services.github_client import get_github_client
+from services.readiness import Readiness
+from services.warmup import Warmup
+from services.profiling import RequestProfiler
+from services.memory import MemoryTracker, rss_bytes, peak_rss_bytes, recent_reports
+from services.bm25 import get_bm25_indexes, hybrid_scores
+from services.batch_localization import encode_bug_reports, rank_bug_reports
+
+# Initialize Database (the client connects on first use)
 db = Database()
 
 # Initialize Blueprint for Routes
@@ -32,8 +49,54 @@ routes = Blueprint('routes', __name__)
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-# Initialize a thread-safe queue for messages
-message_queue = queue.Queue()
+# Initialize the notifier delivering progress messages to Probot
+notifier = ProbotNotifier(os.environ.get("PROBOT_URL", "http://localhost:3000/post-message"),
+                          workers=int(os.environ.get("NOTIFIER_WORKERS", "4")),
+                          min_interval=float(os.environ.get("NOTIFIER_MIN_INTERVAL_SECONDS", "2")))
+# Initialize the worker pool for asynchronous jobs, completion callbacks only go to the CALLBACK_HOSTS (the Probot host)
+job_queue = JobQueue(max_workers=int(os.environ.get("JOB_WORKERS", "2")),
+                     max_queued=int(os.environ.get("JOB_QUEUE_SIZE", "32")),
+                     retry_after=int(os.environ.get("RETRY_AFTER_SECONDS", "30")),
+                     callback_hosts=os.environ.get("CALLBACK_HOSTS", urlsplit(notifier.url).netloc).split(","))
+# Concurrency limits and bounded wait queues for the clone, encode and store stages of indexing
+admission = AdmissionController({
+    'clone': (int(os.environ.get("CLONE_CONCURRENCY", "2")), int(os.environ.get("CLONE_QUEUE_SIZE", "8"))),
+    'encode': (int(os.environ.get("ENCODE_CONCURRENCY", "1")), int(os.environ.get("ENCODE_QUEUE_SIZE", "8"))),
+    'store': (int(os.environ.get("STORE_CONCURRENCY", "4")), int(os.environ.get("STORE_QUEUE_SIZE", "16")))
+}, max_wait=float(os.environ.get("ADMISSION_MAX_WAIT_SECONDS", "600")),
+    default_retry_after=int(os.environ.get("RETRY_AFTER_SECONDS", "30")))
+# Runs the independent steps of a report (query encoding, database reads) concurrently
+report_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("REPORT_WORKERS", "8")),
+                                     thread_name_prefix='ladybug-report')
+# Archives bug reports off the request path when ARCHIVE_REPORTS is enabled
+report_archive = ReportArchive(os.environ.get("REPORT_ARCHIVE_DIR", "reports"))
+# Coordinates index updates so concurrent requests for the same repository don't repeat or race each other
+reindex_flight = SingleFlight()
+repo_locks = KeyedLock()
+# Lets a newer indexing job of a repository cancel the older ones it supersedes
+indexing_jobs = CancellationRegistry()
+# Merges bursts of pushes to a repository into one incremental update job
+push_debouncer = Debouncer(lambda repo_info: job_queue.submit('push', handle_push_update, repo_info),
+                           delay=float(os.environ.get("PUSH_DEBOUNCE_SECONDS", "30")))
+# Components that have to be ready before /readyz reports ready
+readiness = Readiness()
+readiness.require('app', "Waiting for create_app to start the background services")
+# Preloads the model and NLTK resources, /readyz waits for it once it has been started
+warmup = Warmup(readiness)
+# Profiles runs requested with the X-Profile header, and every run of the PROFILE_REPOS repositories
+profiler = RequestProfiler(os.environ.get("PROFILE_DIR", "profiles"),
+                           mode=os.environ.get("PROFILE_MODE", "sampling"),
+                           interval=float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000,
+                           repos=os.environ.get("PROFILE_REPOS", "").split(","))
+# Queue gauges read when /metrics is scraped
+REGISTRY.gauge('ladybug_notifier_queue_depth', "Progress messages waiting for delivery to Probot.",
+               lambda: notifier.stats()['queue_depth'])
+REGISTRY.gauge('ladybug_notifier_oldest_lag_seconds', "Age of the oldest progress message waiting for delivery.",
+               lambda: notifier.stats()['oldest_lag_seconds'])
+REGISTRY.gauge('ladybug_process_rss_bytes', "Resident set size of the process.", rss_bytes)
+REGISTRY.gauge('ladybug_process_peak_rss_bytes', "Highest resident set size of the process.", peak_rss_bytes)
+REGISTRY.gauge('ladybug_jobs_queued', "Asynchronous jobs waiting for a worker.",
+               lambda: job_queue.stats()[JobQueue.QUEUED])
 
 # ======================================================================================================================
 # Routes
@@ -47,6 +110,7 @@ def initialization():
     - Computes embeddings.
     - Stores embeddings along with repository information and SHA.
     - Always performs a fresh setup, overwriting any existing embeddings.
+    - When asynchronous jobs are enabled, enqueues the work and responds with 202 and a job id.
     """
     data = request.get_json()
     if not data:
@@ -58,32 +122,16 @@ def initialization():
     comment_id = data.get('comment_id')
 
     repo_info = extract_and_validate_repo_info(repo_data)
-    send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                          "✅ **Initialization Started**: Validating repository information.")
 
-    try:
-        process_and_store_embeddings(repo_info,comment_id)
-        send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                              "🌀 **Cloning Repository**: Repository cloned successfully.")
-    except Exception as e:
-        logger.error(f"Initialization failed: {e}")
-        send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                              f"❌ **Initialization Failed**: {e}")
-        abort(500, description=str(e))
+    # Turn the request away before cloning anything if the clone stage can't take more work
+    admission.check('clone')
 
-    try:
-        post_process_cleanup(repo_info)
-        send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                              "✅ **Embeddings Stored**: Embeddings computed and stored successfully.")
-    except Exception as e:
-        logger.error(f"Post-processing failed: {e}")
-        send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                              f"⚠️ **Post-Processing Warning**: {e}")
+    handler = with_profiling('initialization', handle_initialization, repo_info)
+    if use_async_jobs(data):
+        return enqueue_job('initialization', handler, data, repo_info, comment_id)
 
-    logger.info('Embeddings stored successfully.')
-    send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                          "🎉 **Initialization Completed**: All embeddings are up to date.")
-    return jsonify({"message": "Embeddings computed and stored"}), 200
+    body, status_code = handler(repo_info, comment_id)
+    return jsonify(body), status_code
 
 
 @routes.route('/report', methods=["POST"])
@@ -91,8 +139,7 @@ def report():
     """
     Report Endpoint:
     - Receives repository information with the latest_commit_sha.
-    - Writes the 'issue' to ./reports/repo_name/report.txt.
-    - Preprocesses the bug report.
+    - Preprocesses the bug report in memory (optionally archiving it to ./reports/owner/repo_name/).
     - Checks if the provided SHA matches the stored SHA.
     - If SHAs do not match:
         - Reclones the repository.
@@ -100,6 +147,8 @@ def report():
         - Updates the stored embeddings and SHA.
     - If SHAs match:
         - Confirms that embeddings are up to date.
+    - In stale-while-revalidate mode, outdated embeddings are ranked right away and updated in the background.
+    - When asynchronous jobs are enabled, enqueues the work and responds with 202 and a job id.
     """
     data = request.get_json()
     if not data:
@@ -116,149 +165,596 @@ def report():
 
     # Extract and validate repository information
     repo_info = extract_and_validate_repo_info(repository)
+
+    stale_ok = use_stale_while_revalidate(data)
+
+    handler = with_profiling('report', handle_report, repo_info)
+    if use_async_jobs(data):
+        return enqueue_job('report', handler, data, repo_info, issue, comment_id, stale_ok)
+
+    body, status_code = handler(repo_info, issue, comment_id, stale_ok)
+    return jsonify(body), status_code
+
+
+@routes.route('/report/batch', methods=["POST"])
+def report_batch():
+    """
+    Batch Report Endpoint:
+    - Receives repository information and many issues, as `{"id": ..., "body": ...}` objects, and an optional top_k.
+    - Brings the embeddings up to the latest_commit_sha if needed (ranking against the stored SHA if the update
+      can't run now).
+    - Fetches the embeddings once, encodes the issues together and ranks them all in one batched computation.
+    - Responds with the top_k ranked files of every issue, without posting progress messages.
+    - When asynchronous jobs are enabled, enqueues the work and responds with 202 and a job id.
+    """
+    data = request.get_json()
+    if not data:
+        abort(400, description="Invalid JSON data")
+
+    repository = data.get('repository')
+    issues = data.get('issues')
+
+    if not repository or not isinstance(issues, list) or not issues:
+        abort(400, description="Missing 'repository' or 'issues' in the data")
+    if not all(isinstance(issue, dict) and issue.get('id') is not None and issue.get('body') for issue in issues):
+        abort(400, description="Every issue needs an 'id' and a 'body'")
+
+    max_issues = int(os.environ.get("REPORT_BATCH_MAX_ISSUES", "500"))
+    if len(issues) > max_issues:
+        abort(400, description=f"At most {max_issues} issues per batch, got {len(issues)}")
+
+    logger.info(f"Received {len(issues)} issues from /report/batch request.")
+
+    # Extract and validate repository information
+    repo_info = extract_and_validate_repo_info(repository)
+    top_k = data.get('top_k', 10)
+    if not isinstance(top_k, int) or top_k < 1:
+        abort(400, description="'top_k' must be a positive integer")
+
+    handler = with_profiling('report_batch', handle_report_batch, repo_info)
+    if use_async_jobs(data):
+        return enqueue_job('report_batch', handler, data, repo_info, issues, top_k)
+
+    body, status_code = handler(repo_info, issues, top_k)
+    return jsonify(body), status_code
+
+
+@routes.route('/push', methods=["POST"])
+def push():
+    """
+    Push Endpoint:
+    - Receives repository information with the latest_commit_sha after a push to the default branch.
+    - Debounces rapid pushes to the same repository into a single update.
+    - Patches the embeddings of the changed files and updates the stored SHA in the background.
+    """
+    data = request.get_json()
+    if not data:
+        abort(400, description="Invalid JSON data")
+
+    repository = data.get('repository')
+    if not repository:
+        abort(400, description="Missing 'repository' in the data")
+
+    logger.info("Received data from /push request.")
+
+    repo_info = extract_and_validate_repo_info(repository)
+
+    ref = data.get('ref')
+    if ref and ref != f"refs/heads/{repo_info['default_branch']}":
+        logger.info(f"Ignoring push to {ref}, only the default branch is indexed.")
+        return jsonify({"message": f"Ignored push to {ref}"}), 200
+
+    merged = push_debouncer.trigger((repo_info['owner'], repo_info['repo_name']), repo_info)
+    return jsonify({"message": "Push accepted", "merged_pushes": merged,
+                    "debounce_seconds": push_debouncer.delay}), 202
+
+
+@routes.route('/stats', methods=["GET"])
+def stats():
+    """
+    Stats Endpoint:
+    - Returns the Probot notifier queue depth, lag and delivery counters.
+    - Returns the number of asynchronous jobs in each status, and the number rejected.
+    - Returns the running and queued work of each indexing stage with its rejection counters.
+    - Returns the encoder waiters and wait times of each priority class.
+    - Returns the running and cancelled indexing jobs.
+    - Returns the process RSS and the memory reports of the last indexing jobs.
+    - Returns the repositories and files in the lexical indexes held for hybrid ranking.
+    """
+    return jsonify({"notifier": notifier.stats(), "jobs": job_queue.stats(), "admission": admission.stats(),
+                    "scheduler": get_scheduler().stats(), "indexing": indexing_jobs.stats(),
+                    "memory": {"rss_bytes": rss_bytes(), "peak_rss_bytes": peak_rss_bytes(),
+                               "jobs": recent_reports()},
+                    "lexical_index": get_bm25_indexes().stats()}), 200
+
+
+@routes.route('/metrics', methods=["GET"])
+def metrics():
+    """
+    Metrics Endpoint:
+    - Returns stage, preprocessing, encoding and database timing histograms, labeled by repository size bucket,
+      in the Prometheus text format.
+    - Returns the encoded chunk counter, the Probot notifier lag and the queue depths.
+    """
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+@routes.route('/healthz', methods=["GET"])
+def healthz():
+    """
+    Liveness Endpoint:
+    - Responds as soon as the process serves requests, without touching the database or the model.
+    """
+    return jsonify({"status": "ok"}), 200
+
+
+@routes.route('/readyz', methods=["GET"])
+def readyz():
+    """
+    Readiness Endpoint:
+    - Responds with 200 once every required component is ready, and 503 until then.
+    - Returns the status of each component.
+    """
+    ready = readiness.is_ready()
+    return jsonify({"ready": ready, "components": readiness.as_dict()}), 200 if ready else 503
+
+
+@routes.route('/admin/warmup', methods=["POST"])
+def admin_warmup():
+    """
+    Warm-up Endpoint:
+    - Loads the model, tokenizer and NLTK resources and runs a dummy encode and rank in the background.
+    - The process reports not ready until the warm-up finishes.
+    - `?force=true` warms up again after a successful warm-up, `?wait=true` responds once it has finished.
+    - Requires the `X-Admin-Token` header when ADMIN_TOKEN is set.
+    """
+    require_admin()
+
+    started = warmup.start(force=request.args.get('force', 'false').lower() == 'true')
+    if request.args.get('wait', 'false').lower() == 'true':
+        warmup.wait()
+        status = warmup.status()
+        return jsonify(status), 200 if status['status'] == Warmup.SUCCEEDED else 500
+
+    return jsonify({"started": started, **warmup.status()}), 202 if started else 200
+
+
+@routes.route('/jobs/<job_id>', methods=["GET"])
+def job_status(job_id):
+    """
+    Job Status Endpoint:
+    - Returns the status of an asynchronous job (queued, running, succeeded, failed).
+    - Includes the job result once the job has finished.
+    """
+    job = job_queue.get(job_id)
+    if not job:
+        abort(404, description=f"Job {job_id} not found")
+
+    return jsonify(job), 200
+
+
+@routes.errorhandler(Overloaded)
+def overloaded(error):
+    """
+    Sheds load: work rejected by admission control is answered with 503 and a Retry-After header.
+    """
+    response = jsonify({"message": str(error), "stage": error.stage, "retry_after": error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+
+# ======================================================================================================================
+# Route Handlers
+# ======================================================================================================================
+
+@prioritized(BULK)
+@labeled_by_repo_size
+def handle_initialization(repo_info, comment_id):
+    """
+    Runs the initialization pipeline for a repository.
+
+    :param repo_info: Dictionary containing repository information.
+    :param comment_id: Comment ID.
+    :return: A tuple of (response body, status code).
+    :raises: Aborts with a 500 error if the initialization fails.
+    """
     send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                          "✅ **Report Processing Started**: Repository information validated.")
+                          "✅ **Initialization Started**: Validating repository information.")
 
-    # Write issue to report file
+    key = (repo_info['owner'], repo_info['repo_name'])
     try:
-        report_file_path = write_file_for_report_processing(repo_info['repo_name'], issue)
+        # A fresh initialization supersedes any initialization or update of the repository that is still running
+        with indexing_jobs.track(key, 'initialization', repo_info['latest_commit_sha'],
+                                 supersedes={'initialization', 'patch'}), repo_locks.hold(key), \
+                track_memory('initialization', repo_info) as memory:
+            process_and_store_embeddings(repo_info, comment_id, memory)
+        send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
+                              "🌀 **Cloning Repository**: Repository cloned successfully.")
+    except Cancelled as e:
+        logger.info(f"Initialization cancelled: {e}")
         send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                              "📝 **Report Written**: Issue has been written to the report file.")
+                              "⏭️ **Initialization Superseded**: A newer request for this repository took over.")
+        return {"message": "Initialization superseded", "reason": str(e)}, 409
+    except Overloaded as e:
+        logger.warning(f"Initialization shed: {e}")
+        send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
+                              f"⏳ **Backend Busy**: Initialization could not start, retry in {e.retry_after}s.")
+        raise
     except Exception as e:
-        logger.error(f"Failed to write issue to file: {e}")
+        logger.error(f"Initialization failed: {e}")
         send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                              f"❌ **Report Writing Failed**: {e}")
-        abort(500, description="Failed to write issue to file")
+                              f"❌ **Initialization Failed**: {e}")
+        abort(500, description=str(e))
 
     try:
-        preprocessed_bug_report = preprocess_bug_report(report_file_path)
+        with repo_locks.hold((repo_info['owner'], repo_info['repo_name'])):
+            post_process_cleanup(repo_info)
         send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                              "🔍 **Bug Report Preprocessed**: Bug report has been successfully preprocessed.")
+                              "✅ **Embeddings Stored**: Embeddings computed and stored successfully.")
     except Exception as e:
-        logger.error(f"Failed to preprocess bug report: {e}")
+        logger.error(f"Post-processing failed: {e}")
         send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                              f"❌ **Preprocessing Failed**: {e}")
-        abort(500, description="Failed to preprocess bug report")
+                              f"⚠️ **Post-Processing Warning**: {e}")
+
+    logger.info('Embeddings stored successfully.')
+    send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
+                          "🎉 **Initialization Completed**: All embeddings are up to date.")
+    return {"message": "Embeddings computed and stored"}, 200
+
+
+@prioritized(INCREMENTAL)
+@labeled_by_repo_size
+def handle_push_update(repo_info):
+    """
+    Runs the incremental update pipeline for the latest pushed commit of a repository.
 
-    # Retrieve the stored SHA
+    :param repo_info: Dictionary containing repository information.
+    :return: A tuple of (response body, status code).
+    """
     stored_commit_sha = retrieve_stored_sha(repo_info['owner'], repo_info['repo_name'])
     if not stored_commit_sha:
-        logger.info("No stored commit SHA found.")
-        send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                              "⚠️ **SHA Retrieval Failed**: No stored commit SHA found.")
-        return jsonify({"message": "Failed because no stored commit SHA"}), 500
+        logger.info("Repository is not initialized, skipping push update.")
+        return {"message": "Repository is not initialized"}, 404
 
-    logger.info(f"Stored commit SHA: {stored_commit_sha}")
-    # Check if embeddings are up to date
     if stored_commit_sha == repo_info['latest_commit_sha']:
-        logger.info('Embeddings are up to date.')
-        send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                              "✅ **Embeddings Status**: Embeddings are up to date.")
-    else:
-        logger.info('Embeddings are outdated. Recomputing embeddings.')
-        send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                              "🔄 **Embeddings Outdated**: Recomputing embeddings due to new commits.")
+        return {"message": "Embeddings are up to date", "indexed_sha": stored_commit_sha}, 200
+
+    try:
+        update_repository_index(repo_info)
+    except Cancelled as e:
+        logger.info(f"Push update cancelled: {e}")
+        return {"message": "Push update superseded", "reason": str(e)}, 409
+    return {"message": "Embeddings updated", "indexed_sha": repo_info['latest_commit_sha']}, 200
+
+
+@prioritized(INTERACTIVE)
+@labeled_by_repo_size
+def handle_report(repo_info, issue, comment_id, stale_ok=False):
+    """
+    Runs the bug localization pipeline for a bug report.
+
+    :param repo_info: Dictionary containing repository information.
+    :param issue: The content of the issue.
+    :param comment_id: Comment ID.
+    :param stale_ok: Rank against the last indexed SHA and bring the index up to date in the background.
+    :return: A tuple of (response body, status code).
+    :raises: Aborts with a 500 error if a pipeline step fails.
+    """
+    timer = StageTimer(pipeline='report')
+    send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
+                          "✅ **Report Processing Started**: Repository information validated.")
+
+    # Keep a copy of the issue if archiving is enabled, the write happens in the background
+    if os.environ.get("ARCHIVE_REPORTS", "False").lower() == "true":
         try:
-            changed_files = partial_clone(stored_commit_sha, repo_info)
-            process_and_patch_embeddings(changed_files, repo_info)
-            post_process_cleanup(repo_info)
+            report_archive.archive(repo_info['owner'], repo_info['repo_name'], comment_id, issue)
+        except ValueError as e:
+            logger.warning(f"Issue not archived: {e}")
+
+    # Encoding the query doesn't depend on the database, so it runs while the SHA and embeddings are fetched.
+    # The embeddings fetch is speculative and is only redone if the index has to be updated first.
+    # Both run in a copy of this context so they keep the report's interactive priority and metric labels.
+    # With hybrid ranking, the lexical index is fetched instead and only the candidates' embeddings are fetched.
+    hybrid = use_hybrid_ranking()
+    preprocess = preprocess_bug_report_with_tokens if hybrid else preprocess_bug_report_text
+    fetch = fetch_lexical_index if hybrid else fetch_repo_embeddings
+    preprocess_future = report_executor.submit(copy_context().run, timer.timed('preprocess', preprocess), issue)
+    embeddings_future = report_executor.submit(copy_context().run, timer.timed('fetch_embeddings', fetch),
+                                               repo_info)
+    futures = [preprocess_future, embeddings_future]
+
+    try:
+        # Retrieve the stored SHA
+        with timer.stage('retrieve_sha'):
+            stored_commit_sha = retrieve_stored_sha(repo_info['owner'], repo_info['repo_name'])
+        if not stored_commit_sha:
+            logger.info("No stored commit SHA found.")
+            send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
+                                  "⚠️ **SHA Retrieval Failed**: No stored commit SHA found.")
+            return {"message": "Failed because no stored commit SHA"}, 500
+
+        logger.info(f"Stored commit SHA: {stored_commit_sha}")
+        indexed_sha = repo_info['latest_commit_sha']
+        # Check if embeddings are up to date
+        if stored_commit_sha == repo_info['latest_commit_sha']:
+            logger.info('Embeddings are up to date.')
+            send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
+                                  "✅ **Embeddings Status**: Embeddings are up to date.")
+        elif stale_ok:
+            logger.info('Embeddings are outdated. Ranking against the last indexed SHA and updating in the background.')
             send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                                  "✅ **Embeddings Updated**: Embeddings have been recomputed and updated.")
+                                  f"⏩ **Embeddings Outdated**: Ranking against `{stored_commit_sha[:7]}` "
+                                  "while embeddings update in the background.")
+            indexed_sha = stored_commit_sha
+        else:
+            logger.info('Embeddings are outdated. Recomputing embeddings.')
+            send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
+                                  "🔄 **Embeddings Outdated**: Recomputing embeddings due to new commits.")
+            try:
+                with timer.stage('update_index'):
+                    update_repository_index(repo_info)
+                send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
+                                      "✅ **Embeddings Updated**: Embeddings have been recomputed and updated.")
+            except Overloaded as e:
+                # Degrade to the last indexed SHA instead of failing the report
+                logger.warning(f"Index update shed, ranking against the last indexed SHA: {e}")
+                send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
+                                      f"⏳ **Backend Busy**: Ranking against `{stored_commit_sha[:7]}` "
+                                      "until the embeddings can be updated.")
+                indexed_sha = stored_commit_sha
+            except Cancelled as e:
+                # A newer commit is being indexed, rank against what is stored until it is done
+                logger.info(f"Index update superseded, ranking against the last indexed SHA: {e}")
+                send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
+                                      f"⏩ **Embeddings Outdated**: A newer commit is being indexed, ranking against "
+                                      f"`{stored_commit_sha[:7]}` for now.")
+                indexed_sha = stored_commit_sha
+            except Exception as e:
+                logger.error(f"Failed to recompute embeddings: {e}")
+                send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
+                                      f"❌ **Embeddings Update Failed**: {e}")
+                abort(500, description=str(e))
+
+            # The speculative fetch read the outdated embeddings
+            if indexed_sha == repo_info['latest_commit_sha']:
+                embeddings_future.cancel()
+                embeddings_future = report_executor.submit(copy_context().run,
+                                                           timer.timed('fetch_embeddings', fetch), repo_info)
+                futures.append(embeddings_future)
+
+        try:
+            preprocessed = preprocess_future.result()
+            preprocessed_bug_report, query_tokens = preprocessed if hybrid else (preprocessed, None)
+            send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
+                                  "🔍 **Bug Report Preprocessed**: Bug report has been successfully preprocessed.")
         except Exception as e:
-            logger.error(f"Failed to recompute embeddings: {e}")
+            logger.error(f"Failed to preprocess bug report: {e}")
             send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                                  f"❌ **Embeddings Update Failed**: {e}")
-            abort(500, description=str(e))
+                                  f"❌ **Preprocessing Failed**: {e}")
+            abort(500, description="Failed to preprocess bug report")
+
+        # FETCH ALL EMBEDDINGS FROM DB, or the lexical index with hybrid ranking
+        try:
+            repo_embeddings = embeddings_future.result()
+            if hybrid:
+                record_repo_size(repo_info['owner'], repo_info['repo_name'], repo_embeddings.file_count)
+                send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
+                                      "📚 **Lexical Index Loaded**: Embeddings are fetched for the best matching "
+                                      "files only.")
+            else:
+                record_repo_size(repo_info['owner'], repo_info['repo_name'], len(repo_embeddings))
+                send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
+                                      "📚 **Embeddings Fetched**: Retrieved all embeddings from the database.")
+        except Exception as e:
+            logger.info('Failed to find repo.')
+            send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
+                                  "❌ **Embeddings Retrieval Failed**: Could not fetch embeddings from the database.")
+            return {"message": "Failed to find repo."}, 405
+
+        with timer.stage('rank'):
+            if hybrid:
+                ranked_list = rank_top_files_hybrid(repo_info, preprocessed_bug_report, query_tokens, repo_embeddings)
+            else:
+                ranked_list = rank_top_files(preprocessed_bug_report, repo_embeddings)
 
-    # FETCH ALL EMBEDDINGS FROM DB
-    try:
-        query = {
-            "repo_name": repo_info['repo_name'],
-            "owner": repo_info['owner']
-        }
-        repo_collection = db.get_repo_collection()
-        query_repo = repo_collection.find_one(query)
-        repo_embeddings = db.get_repo_files_embeddings(query_repo["_id"])
         send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                              "📚 **Embeddings Fetched**: Retrieved all embeddings from the database.")
-    except Exception as e:
-        logger.info('Failed to find repo.')
+                              "🎯 **Bug Localization Completed**: Ranked relevant files identified.")
+
+        if indexed_sha != repo_info['latest_commit_sha']:
+            try:
+                job_queue.submit('revalidation', revalidate_report, repo_info, preprocessed_bug_report, ranked_list,
+                                 comment_id, query_tokens)
+            except Overloaded as e:
+                logger.warning(f"Skipped revalidation of the stale ranking: {e}")
+
+        timings = timer.as_dict()
+        logger.info(f"Report timings (ms): {timings}")
+        return {"message": "Report processed successfully", "ranked_files": ranked_list, "indexed_sha": indexed_sha,
+                "stale": indexed_sha != repo_info['latest_commit_sha'], "timings": timings}, 200
+    finally:
+        # Don't leave the query encoding or an embeddings fetch queued when the report ends early or aborts.
+        # Ones that already started can't be interrupted, they finish and their results are dropped.
+        for future in futures:
+            future.cancel()
+
+
+@prioritized(INCREMENTAL)
+def revalidate_report(repo_info, preprocessed_bug_report, ranked_list, comment_id, query_tokens=None):
+    """
+    Background half of stale-while-revalidate: updates the index to the latest SHA and ranks the bug report again.
+    If the top files changed and POST_REFRESHED_RANKINGS="True" is set, the refreshed ranking is posted to Probot.
+
+    :param repo_info: Dictionary containing repository information.
+    :param preprocessed_bug_report: The encoded bug report.
+    :param ranked_list: The ranking that was returned against the stale index.
+    :param comment_id: Comment ID.
+    :param query_tokens: The bug report tokens, if the ranking was hybrid.
+    :return: A tuple of (refreshed ranking, status code).
+    """
+    update_repository_index(repo_info)
+    if query_tokens is not None:
+        refreshed_list = rank_top_files_hybrid(repo_info, preprocessed_bug_report, query_tokens,
+                                               fetch_lexical_index(repo_info))
+    else:
+        refreshed_list = rank_top_files(preprocessed_bug_report, fetch_repo_embeddings(repo_info))
+
+    changed = [route for route, _ in refreshed_list] != [route for route, _ in ranked_list]
+    if changed and os.environ.get("POST_REFRESHED_RANKINGS", "False").lower() == "true":
         send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                              "❌ **Embeddings Retrieval Failed**: Could not fetch embeddings from the database.")
-        return jsonify({"message": "Failed to find repo."}), 405
+                              format_refreshed_ranking(refreshed_list, repo_info['latest_commit_sha']))
 
-    bug_localizer = BugLocalization()
+    logger.info(f"Revalidated ranking against {repo_info['latest_commit_sha']}, top files changed: {changed}")
+    return {"ranked_files": refreshed_list, "indexed_sha": repo_info['latest_commit_sha'], "changed": changed}, 200
 
-    ranked_files = bug_localizer.rank_files(preprocessed_bug_report, repo_embeddings)
 
-    ranked_list = []
+@prioritized(BULK)
+@labeled_by_repo_size
+def handle_report_batch(repo_info, issues, top_k=10):
+    """
+    Runs the bug localization pipeline for many bug reports of one repository, i.e. a backfill of its open issues.
 
-    for i in range(min(10, len(ranked_files))):
-        ranked_list.append(ranked_files[i])
+    :param repo_info: Dictionary containing repository information.
+    :param issues: A list of `{"id": ..., "body": ...}` issues.
+    :param top_k: The number of files kept per issue.
+    :return: A tuple of (response body, status code).
+    """
+    timer = StageTimer(pipeline='report_batch')
 
-    send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
-                          "🎯 **Bug Localization Completed**: Ranked relevant files identified.")
-    return jsonify({"message": "Report processed successfully", "ranked_files": ranked_list}), 200
+    with timer.stage('retrieve_sha'):
+        stored_commit_sha = retrieve_stored_sha(repo_info['owner'], repo_info['repo_name'])
+    if not stored_commit_sha:
+        logger.info("Repository is not initialized, skipping batch report.")
+        return {"message": "Repository is not initialized"}, 404
+
+    indexed_sha = repo_info['latest_commit_sha']
+    if stored_commit_sha != repo_info['latest_commit_sha']:
+        try:
+            with timer.stage('update_index'):
+                update_repository_index(repo_info)
+        except (Overloaded, Cancelled) as e:
+            logger.warning(f"Index update didn't run, ranking the batch against the last indexed SHA: {e}")
+            indexed_sha = stored_commit_sha
+
+    with timer.stage('fetch_embeddings'):
+        repo_embeddings = fetch_repo_embeddings(repo_info)
+    record_repo_size(repo_info['owner'], repo_info['repo_name'], len(repo_embeddings))
+
+    # Encoding hundreds of reports is bulk encoder work, admitted in the encode stage. Ranking doesn't need a slot.
+    with admission.slot('encode'), timer.stage('encode'):
+        queries = encode_bug_reports([issue['body'] for issue in issues])
+    with timer.stage('rank'):
+        ranked_lists = rank_bug_reports(queries, repo_embeddings, top_k)
+
+    timings = timer.as_dict()
+    logger.info(f"Batch report timings (ms) for {len(issues)} issues: {timings}")
+    return {"message": "Reports processed successfully", "indexed_sha": indexed_sha,
+            "stale": indexed_sha != repo_info['latest_commit_sha'],
+            "results": [{"id": issue['id'], "ranked_files": ranked_list}
+                        for issue, ranked_list in zip(issues, ranked_lists)],
+            "timings": timings}, 200
 
 
 # ======================================================================================================================
 # Helper Functions
 # ======================================================================================================================
 
-def message_worker():
+def use_async_jobs(data):
     """
-    Background worker that sends messages to Probot from the message_queue.
-    Ensures that each message is sent with at least a 5-second interval.
-    """
-    while True:
-        try:
-            # Get the next message from the queue
-            owner, repo, comment_id, message = message_queue.get()
-            if owner and repo and comment_id and message:
-                success = actual_send_update_to_probot(owner, repo, comment_id, message)
-                if success:
-                    logger.info(f"Message sent to Probot: {message}")
-                else:
-                    logger.error(f"Failed to send message to Probot: {message}")
-            # Wait for 5 seconds before sending the next message
-            time.sleep(2)
-        except Exception as e:
-            logger.error(f"Error in message_worker: {e}")
-            # Optional: Add a short sleep to prevent tight loop in case of continuous errors
-            time.sleep(5)
+    Decides whether a request should be executed as an asynchronous job.
+    Requests can opt in with `"async": true`, otherwise ASYNC_JOBS="True" in the .env enables it for all requests.
 
-def actual_send_update_to_probot(owner, repo, comment_id, message):
+    :param data: The JSON data from the request.
+    :return: True if the request should be enqueued on the job queue.
     """
-    Sends an update message to the Probot /post-message endpoint to comment on a GitHub issue or pull request.
+    if 'async' in data:
+        return bool(data.get('async'))
+    return os.environ.get("ASYNC_JOBS", "False").lower() == "true"
 
-    Args:
-        owner (str): The GitHub username or organization name that owns the repository.
-        repo (str): The name of the repository.
-        comment_id (int): The number of the issue or pull request to comment on.
-        message (str): The message to post as a comment.
 
-    Returns:
-        bool: True if the comment was posted successfully, False otherwise.
+def enqueue_job(kind, handler, data, *args):
+    """
+    Enqueues a handler on the job queue and builds the 202 Accepted response.
+
+    :param kind: The kind of job, i.e. 'initialization' or 'report'.
+    :param handler: The handler method to run, returning a tuple of (response body, status code).
+    :param data: The JSON data from the request, may contain a 'callback_url' on one of the CALLBACK_HOSTS.
+    :param args: Arguments passed to the handler.
+    :return: A Flask response with the job id and its status URL.
+    :raises: Aborts the request with a 400 error if the callback URL isn't allowed.
     """
-    payload = {
-        'owner': owner,
-        'repo': repo,
-        'comment_id': comment_id,
-        'message': message
-    }
     try:
-        response = requests.post('http://localhost:3000/post-message', json=payload)
-        response.raise_for_status()  # Raises stored HTTPError, if one occurred.
+        job_id = job_queue.submit(kind, handler, *args, callback_url=data.get('callback_url'))
+    except ValueError as e:
+        abort(400, description=str(e))
+    status_url = f"/jobs/{job_id}"
+
+    response = jsonify({"message": f"{kind.capitalize()} job accepted", "job_id": job_id, "status_url": status_url})
+    response.headers['Location'] = status_url
+    return response, 202
+
+
+def require_admin():
+    """
+    Guards admin endpoints: when ADMIN_TOKEN is set in the .env, requests must send it in the `X-Admin-Token` header.
+
+    :raises: Aborts the request with a 403 error if the token is missing or wrong.
+    """
+    admin_token = os.environ.get("ADMIN_TOKEN")
+    if admin_token and not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token):
+        abort(403, description="Invalid admin token")
+
+
+def with_profiling(kind, handler, repo_info):
+    """
+    Wraps a handler in the profiler when the request asks for it with the `X-Profile` header (`sampling`,
+    `cprofile`, or any other value for the default mode), or when the repository is listed in PROFILE_REPOS.
+    The header is refused unless ADMIN_TOKEN is set and sent, since profiles are written to disk.
+    The response body of a profiled run carries the `profile` directory.
+
+    :param kind: The kind of run, i.e. 'initialization' or 'report'.
+    :param handler: The handler method, returning a tuple of (response body, status code).
+    :param repo_info: Dictionary containing repository information.
+    :return: The handler, wrapped if the run is profiled.
+    :raises: Aborts the request with a 403 error if the header is sent without a configured and valid admin token.
+    """
+    requested = request.headers.get('X-Profile')
+    if requested:
+        if not os.environ.get("ADMIN_TOKEN"):
+            abort(403, description="Profiling on request requires ADMIN_TOKEN to be set")
+        require_admin()
+        mode = requested.lower() if requested.lower() in RequestProfiler.MODES else profiler.mode
+    elif profiler.is_profiled_repo(repo_info['owner'], repo_info['repo_name']):
+        mode = profiler.mode
+    else:
+        return handler
+
+    @wraps(handler)
+    def profiled_handler(*args, **kwargs):
+        with profiler.profile(f"{kind}-{repo_info['owner']}-{repo_info['repo_name']}", mode) as run:
+            body, status_code = handler(*args, **kwargs)
+        return {**body, "profile": run.path}, status_code
+
+    return profiled_handler
+
+
+def track_memory(kind, repo_info):
+    """
+    Creates the memory tracker of an indexing job. JOB_MEMORY_BUDGET_MB sets the budget (defaults to none) and
+    MEMORY_TRACE_TOP the number of top allocators recorded at each stage (defaults to 0, tracemalloc off).
+
+    :param kind: The kind of job, i.e. 'initialization' or 'patch'.
+    :param repo_info: Dictionary containing repository information.
+    :return: A `MemoryTracker`, to be used as a context manager around the job.
+    """
+    budget_mb = float(os.environ.get("JOB_MEMORY_BUDGET_MB", "0"))
+    return MemoryTracker(f"{kind} {repo_info['owner']}/{repo_info['repo_name']}",
+                         budget_bytes=int(budget_mb * 2 ** 20) or None,
+                         trace_top=int(os.environ.get("MEMORY_TRACE_TOP", "0")))
 
-        logger.info(f"Successfully posted message to {owner}/{repo} Issue #{comment_id}: {message}")
-        return True
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to post message to Probot: {e}")
-        return False
 
 def send_update_to_probot(owner, repo, comment_id, message):
     """
-    Enqueues a message to be sent to Probot.
+    Enqueues a message to be sent to Probot. Messages still queued for the same comment are replaced by this one.
 
     Args:
         owner (str): The GitHub username or organization name that owns the repository.
@@ -266,9 +762,213 @@ def send_update_to_probot(owner, repo, comment_id, message):
         comment_id (int): The number of the issue or pull request to comment on.
         message (str): The message to post as a comment.
     """
-    message_queue.put((owner, repo, comment_id, message))
+    notifier.notify(owner, repo, comment_id, message)
     logger.debug(f"Enqueued message for Probot: {message}")
 
+def use_stale_while_revalidate(data):
+    """
+    Decides whether a report may be ranked against outdated embeddings while they update in the background.
+    Requests can opt in with `"stale_ok": true`, otherwise STALE_WHILE_REVALIDATE="True" in the .env enables it.
+
+    :param data: The JSON data from the request.
+    :return: True if stale-while-revalidate ranking is enabled.
+    """
+    if 'stale_ok' in data:
+        return bool(data.get('stale_ok'))
+    return os.environ.get("STALE_WHILE_REVALIDATE", "False").lower() == "true"
+
+
+def use_hybrid_ranking():
+    """
+    Decides whether reports are ranked in two stages: BM25 over the stored term counts picks the candidate files,
+    then only the candidates' embeddings are fetched and ranked. HYBRID_RANKING="True" in the .env enables it.
+
+    :return: True if hybrid ranking is enabled.
+    """
+    return os.environ.get("HYBRID_RANKING", "False").lower() == "true"
+
+
+def fetch_repo_embeddings(repo_info):
+    """
+    Fetches the embeddings of every file of a repository from the database.
+
+    :param repo_info: Dictionary containing repository information.
+    :return: A list of tuples with (route, embedding).
+    :raises: Exception if the repository is not found.
+    """
+    query = {
+        "repo_name": repo_info['repo_name'],
+        "owner": repo_info['owner']
+    }
+    repo_collection = db.get_repo_collection()
+    with DB_SECONDS.time(operation='fetch_embeddings'):
+        query_repo = repo_collection.find_one(query)
+        return db.get_repo_files_embeddings(db.get_embeddings_id(query_repo))
+
+
+def rank_top_files(preprocessed_bug_report, repo_embeddings, top_k=10):
+    """
+    Ranks the repository files against the bug report and keeps the most similar ones.
+
+    :param preprocessed_bug_report: The encoded bug report.
+    :param repo_embeddings: A list of tuples with (route, embedding).
+    :param top_k: The number of files to keep.
+    :return: A list of (route, score) tuples in descending order of similarity.
+    """
+    bug_localizer = get_bug_localizer()
+
+    with get_scheduler().slot():
+        ranked_files = bug_localizer.rank_files(preprocessed_bug_report, repo_embeddings)
+
+    return ranked_files[:top_k]
+
+
+def fetch_lexical_index(repo_info):
+    """
+    Gets the BM25 index of a repository at its stored commit SHA, loading it from the stored term counts
+    unless this process already holds it.
+
+    :param repo_info: Dictionary containing repository information.
+    :return: The `BM25Index` of the repository.
+    :raises: Exception if the repository is not found.
+    """
+    query = {
+        "repo_name": repo_info['repo_name'],
+        "owner": repo_info['owner']
+    }
+    query_repo = db.get_repo_collection().find_one(query)
+
+    def load():
+        with DB_SECONDS.time(operation='fetch_terms'):
+            return db.get_repo_files_terms(db.get_embeddings_id(query_repo))
+
+    return get_bm25_indexes().get((repo_info['owner'], repo_info['repo_name']), query_repo.get('commit_sha'), load)
+
+
+def rank_top_files_hybrid(repo_info, preprocessed_bug_report, query_tokens, lexical_index, top_k=10):
+    """
+    Ranks the repository files in two stages: the HYBRID_CANDIDATES (defaults to 200) best BM25 matches of the
+    bug report tokens are ranked by embedding similarity, and both scores are combined (see `hybrid_scores`).
+    Falls back to ranking every file when the bug report matches no indexed term, or when some files are stored
+    without term counts (i.e. repositories indexed before term counts were stored), since BM25 can never pick those.
+
+    :param repo_info: Dictionary containing repository information.
+    :param preprocessed_bug_report: The encoded bug report.
+    :param query_tokens: The preprocessed tokens of the bug report.
+    :param lexical_index: The `BM25Index` of the repository.
+    :param top_k: The number of files to keep.
+    :return: A list of (route, score) tuples in descending order of score.
+    """
+    if lexical_index.missing_terms:
+        logger.info(f"{lexical_index.missing_terms} file(s) have no term counts, ranking every file.")
+        return rank_top_files(preprocessed_bug_report, fetch_repo_embeddings(repo_info), top_k)
+
+    candidates = lexical_index.top(query_tokens or [], int(os.environ.get("HYBRID_CANDIDATES", "200")))
+    if not candidates:
+        logger.info("No lexical candidates, ranking every file.")
+        return rank_top_files(preprocessed_bug_report, fetch_repo_embeddings(repo_info), top_k)
+
+    repo_id = db.get_embeddings_id(db.get_repo_collection().find_one(
+        {"repo_name": repo_info['repo_name'], "owner": repo_info['owner']}))
+    with DB_SECONDS.time(operation='fetch_candidate_embeddings'):
+        candidate_embeddings = db.get_repo_files_embeddings(repo_id, [route for route, _ in candidates])
+
+    semantic = rank_top_files(preprocessed_bug_report, candidate_embeddings, top_k=len(candidate_embeddings))
+    return hybrid_scores(candidates, semantic)[:top_k]
+
+
+def format_refreshed_ranking(ranked_list, commit_sha):
+    """
+    Builds the Probot message for a ranking that changed after the index was brought up to date.
+
+    :param ranked_list: A list of (route, score) tuples.
+    :param commit_sha: The commit SHA the ranking was computed against.
+    :return: The markdown message.
+    """
+    message = f"🔁 **Ranking Refreshed**: Embeddings are now up to date with `{commit_sha[:7]}`.\n"
+    message += "\n| Rank | File Path | Score |\n"
+    message += "|------|-----------|-------|\n"
+    for position, (route, score) in enumerate(ranked_list, start=1):
+        message += f"| {position} | {route} | {score} |\n"
+    return message
+
+
+def update_repository_index(repo_info):
+    """
+    Brings the stored embeddings of a repository up to the latest commit SHA.
+    Concurrent requests for the same (repository, target SHA) share a single update, every other
+    request waits for the first one to finish and then ranks against the updated index.
+
+    :param repo_info: Dictionary containing repository information.
+    :return: True if this request waited on an update started by another request.
+    :raises: Exception if the update fails, for every request sharing it.
+    """
+    key = (repo_info['owner'], repo_info['repo_name'], repo_info['latest_commit_sha'])
+    if reindex_flight.in_flight(key):
+        logger.info(f"Waiting on in-flight index update of {key[0]}/{key[1]} to {key[2]}.")
+
+    _, shared = reindex_flight.do(key, reindex_repository, repo_info)
+    return shared
+
+
+def reindex_repository(repo_info):
+    """
+    Patches the embeddings of a repository with the files changed since the stored SHA.
+    Holds the repository lock so no other update or initialization uses the working directory at the same time.
+    An update to a descendant of this update's SHA cancels this one, as does a new initialization. An update
+    of a commit the stored SHA is already past (i.e. a delayed or retried push) does nothing.
+
+    :param repo_info: Dictionary containing repository information.
+    :raises Cancelled: If the update was superseded.
+    """
+    key = (repo_info['owner'], repo_info['repo_name'])
+    target_sha = repo_info['latest_commit_sha']
+
+    def is_newer(other):
+        return compare_commits(repo_info, other.target_sha, target_sha) == 'ahead'
+
+    with indexing_jobs.track(key, 'patch', target_sha, supersedes={'patch'}, is_newer=is_newer), \
+            repo_locks.hold(key), track_memory('patch', repo_info) as memory:
+        # Superseded while waiting on the lock
+        raise_if_cancelled()
+
+        # Another update may have finished while this one waited on the lock
+        stored_commit_sha = retrieve_stored_sha(repo_info['owner'], repo_info['repo_name'])
+        if stored_commit_sha == target_sha:
+            logger.info('Embeddings were updated by another request.')
+            return
+        if compare_commits(repo_info, stored_commit_sha, target_sha) == 'behind':
+            logger.info(f"Embeddings are already past {target_sha}, at its descendant {stored_commit_sha}.")
+            return
+
+        timer = StageTimer(pipeline='patch')
+        with admission.slot('clone'), timer.stage('clone'):
+            changed_files = partial_clone(stored_commit_sha, repo_info)
+        memory.checkpoint('clone')
+        process_and_patch_embeddings(changed_files, repo_info, stored_commit_sha, timer, memory)
+        post_process_cleanup(repo_info)
+        logger.info(f"Patch timings (ms): {timer.as_dict()}")
+
+
+def compare_commits(repo_info, base_sha, head_sha):
+    """
+    Finds out how two commits of a repository relate, from the GitHub comparison (cached, since comparisons
+    of two SHAs never change, and reused to get the changed files of a patch).
+
+    :param repo_info: Dictionary containing repository info
+    :param base_sha: The base commit SHA.
+    :param head_sha: The head commit SHA.
+    :return: 'ahead' if head_sha descends from base_sha, 'behind' if it is an ancestor of it, 'identical' or
+             'diverged', or None if the comparison failed.
+    """
+    try:
+        data = get_github_client().compare(repo_info['owner'], repo_info['repo_name'], base_sha, head_sha)
+    except Exception as e:
+        logger.warning(f"Failed to compare {base_sha}...{head_sha}: {e}")
+        return None
+    return (data or {}).get('status')
+
+
 def partial_clone(old_sha, repo_info):
     """
     Clones the diff between two commits, applying pre-MVP filtering. Files are saved to the repos directory.
@@ -280,9 +980,15 @@ def partial_clone(old_sha, repo_info):
     repo_dir = os.path.join('repos', repo_info['owner'], repo_info['repo_name'])
     new_sha = repo_info['latest_commit_sha']
     changed_files = get_changed_files(repo_info, old_sha, new_sha, repo_dir)
+    if changed_files is None:
+        raise ValueError("Failed to fetch diff from GitHub.")
+
     zip_archive = get_zip_archive(repo_info)
+    if zip_archive is None:
+        raise ValueError("Failed to download zip archive.")
 
-    extract_files(changed_files, zip_archive, repo_dir)
+    with zip_archive:
+        extract_files(changed_files, zip_archive, repo_dir)
 
     return changed_files
 
@@ -296,13 +1002,10 @@ def get_changed_files(repo_info, old_sha, new_sha, repo_dir):
     :param repo_info: Dictionary containing repository info
     :return changed_files: Dictionary of changed files and their change type (added, modified, removed)
     """
-    url = f"https://api.github.com/repos/{repo_info['owner']}/{repo_info['repo_name']}/compare/{old_sha}...{new_sha}"
-    logger.info(url)
-    response = requests.get(url)
-
-    if response.status_code == 200:
-        data = response.json()
+    logger.info(f"Comparing {repo_info['owner']}/{repo_info['repo_name']} {old_sha}...{new_sha}")
+    data = get_github_client().compare(repo_info['owner'], repo_info['repo_name'], old_sha, new_sha)
 
+    if data is not None:
         # Check if 'files' key is present in response data
         if 'files' in data:
             files = data['files']
@@ -321,29 +1024,28 @@ def get_changed_files(repo_info, old_sha, new_sha, repo_dir):
 
             return changed_files
         else:
-            print("Error: 'files' key not found in response data.")
+            logger.error("'files' key not found in response data.")
             return None
     else:
-        print(f"Failed to fetch diff from GitHub. Status Code: {response.status_code}")
+        logger.error("Failed to fetch diff from GitHub.")
         return None
 
 
 def get_zip_archive(repo_info):
     """
-    Fetches the zipfile of the repository at the latest commit
+    Fetches the zipfile of the repository at the latest commit. The archive is streamed to a temporary file.
 
     :param repo_info: Dictionary containing repository info
     :return zip_archive: The zipfile of the repository at the latest commit
     """
     # Download repo at the latest commit
-    url = f"https://api.github.com/repos/{repo_info['owner']}/{repo_info['repo_name']}/zipball/{repo_info['latest_commit_sha']}"
-    response = requests.get(url)
+    zip_archive = get_github_client().download_zipball(repo_info['owner'], repo_info['repo_name'],
+                                                       repo_info['latest_commit_sha'])
 
-    if response.status_code == 200:
-        zip_archive = zipfile.ZipFile(io.BytesIO(response.content))
+    if zip_archive is not None:
         return zip_archive
     else:
-        print("Failed to download zip archive.")
+        logger.error("Failed to download zip archive.")
 
 
 def extract_files(changed_files, zip_archive, repo_dir):
@@ -372,7 +1074,7 @@ def extract_files(changed_files, zip_archive, repo_dir):
                         with open(output_path, "w", encoding="utf-8") as out_file:
                             out_file.write(file_content)
             except KeyError:
-                print(f"File {file_path} not found in archive.")
+                logger.warning(f"File {file_path} not found in archive.")
 
 
 def post_process_cleanup(repo_info):
@@ -386,26 +1088,73 @@ def post_process_cleanup(repo_info):
         logger.error(f"An error occurred while deleting the directory: {e}")
 
 
-def process_and_patch_embeddings(changed_files, repo_info):
+def process_and_patch_embeddings(changed_files, repo_info, base_sha, timer=None, memory=None):
     """
     Processes the repository by cloning, computing embeddings, and storing them. Always performs a fresh setup.
+    When the job comes close to its memory budget, the embeddings encoded so far are staged right away
+    instead of being held until every changed file is encoded, then in batches of at most as many files, halved
+    (down to 1 file) at most once per batch staged while the job stays close to its budget. Staged embeddings
+    are only copied into the repository's embeddings once every file is encoded, right before the commit SHA
+    is updated, and are deleted if the update fails or is cancelled (see `PatchStaging`).
 
     :param repo_info: Dictionary containing repository information.
+    :param base_sha: The stored commit SHA the changed files were compared against.
+    :param timer: The `StageTimer` the preprocess and store stages are recorded in.
+    :param memory: The `MemoryTracker` of the job.
     """
     repo_dir = os.path.join('repos', repo_info['owner'], repo_info['repo_name'])
+    timer = timer or StageTimer()
+    memory = memory or MemoryTracker('patch')
 
     # Preprocess the changed source code files
-    preprocessed_files = preprocess_source_code(repo_dir)
-
-    for file in preprocessed_files:
-        logger.info(f"Preprocessed changed file: {file}")
-
-    clean_files = clean_embedding_paths_for_db(preprocessed_files, repo_dir)
-    update_embeddings_in_db(changed_files, clean_files, repo_info)
-    update_sha(repo_info)
+    clean_files = []
+    # Files held before staging early, unbounded until the job comes close to its memory budget
+    batch_size = None
+    halved = False
+    staging = None
+    try:
+        # Each file waits for the encoder scheduler, where updates come before initializations
+        with timer.stage('preprocess'):
+            for preprocessed_file in iter_preprocessed_source_code(repo_dir, with_terms=True):
+                logger.info(f"Preprocessed changed file: {preprocessed_file[:3]}")
+                clean_files += clean_embedding_paths_for_db([preprocessed_file], repo_dir)
+
+                if not halved and batch_size != 1 and memory.under_pressure():
+                    # The first time, the files held so far are staged as one batch, later batches are halved
+                    batch_size = max(1, batch_size // 2) if batch_size else len(clean_files)
+                    halved = True
+                    logger.warning(f"Close to the memory budget, staging batches of {batch_size} embedding(s).")
+                if batch_size is not None and len(clean_files) >= batch_size:
+                    raise_if_cancelled()
+                    staging = staging or PatchStaging(db.get_repo_collection(), db.get_embeddings_collection(),
+                                                      repo_info['owner'], repo_info['repo_name'])
+                    with admission.slot('store'), timer.stage('store'):
+                        staging.add(clean_files)
+                    clean_files = []
+                    halved = False
+        memory.checkpoint('preprocess')
+
+        # Don't overwrite the results of a newer job
+        raise_if_cancelled()
+        with admission.slot('store'), timer.stage('store'):
+            if staging is not None and staging.apply():
+                # The staged term counts aren't in the lexical index this process holds, it is loaded again
+                get_bm25_indexes().discard((repo_info['owner'], repo_info['repo_name']))
+            update_embeddings_in_db(changed_files, clean_files, repo_info, base_sha)
+            update_sha(repo_info, base_sha)
+    except BaseException:
+        if staging is not None:
+            try:
+                staging.discard()
+            except Exception as e:
+                # The next update that stages embeddings deletes them
+                logger.error(f"Failed to discard the staged embeddings of the update: {e}")
+        raise
+    memory.checkpoint('store')
 
 
-def update_sha(repo_info):
+@DB_SECONDS.time(operation='write_sha')
+def update_sha(repo_info, base_sha):
     db.get_repo_collection().update_one(
         {'repo_name': repo_info['repo_name'], 'owner': repo_info['owner']},
         {
@@ -415,12 +1164,14 @@ def update_sha(repo_info):
         },
         upsert=False
     )
+    get_bm25_indexes().advance((repo_info['owner'], repo_info['repo_name']), base_sha, repo_info['latest_commit_sha'])
     logger.info(f"Updated commit SHA to {repo_info['latest_commit_sha']} in the database.")
 
 
-def update_embeddings_in_db(changed_files, clean_files, repo_info):
-    repo_id = db.get_repo_collection().find_one({'repo_name': repo_info['repo_name'], 'owner': repo_info['owner']})[
-        '_id']
+@DB_SECONDS.time(operation='update_embeddings')
+def update_embeddings_in_db(changed_files, clean_files, repo_info, base_sha):
+    repo_id = db.get_embeddings_id(
+        db.get_repo_collection().find_one({'repo_name': repo_info['repo_name'], 'owner': repo_info['owner']}))
     logger.info(f"Retrieved repo id : {repo_id}")
 
     # Add and update embeddings
@@ -428,15 +1179,16 @@ def update_embeddings_in_db(changed_files, clean_files, repo_info):
         file_path = clean_file['path']
         embedding = clean_file['embedding_text']
 
-        # Upsert the document in the embeddings collection
+        # Upsert the document in the embeddings collection, with the term counts of the lexical index
+        document = {
+            "embedding": embedding,
+            "last_updated": datetime.utcnow().isoformat() + 'Z'
+        }
+        if clean_file.get('terms') is not None:
+            document["terms"] = clean_file['terms']
         db.get_embeddings_collection().update_one(
             {"repo_id": repo_id, "route": file_path},
-            {
-                "$set": {
-                    "embedding": embedding,
-                    "last_updated": datetime.utcnow().isoformat() + 'Z'
-                }
-            },
+            {"$set": document},
             upsert=True
         )
         logger.info(f"Upserted embedding for file: {file_path}")
@@ -446,25 +1198,48 @@ def update_embeddings_in_db(changed_files, clean_files, repo_info):
         db.get_embeddings_collection().delete_one({"repo_id": repo_id, "route": file_path})
         logger.info(f"Removed embedding for file: {file_path}")
 
+    # Keep the lexical index this process holds in step with the stored term counts, if it is at the base commit
+    get_bm25_indexes().update((repo_info['owner'], repo_info['repo_name']), base_sha,
+                              {clean_file['path']: clean_file.get('terms') for clean_file in clean_files},
+                              changed_files.get("removed", []))
+
     logger.info("Database updated with added, modified, and removed files.")
 
 
-def process_and_store_embeddings(repo_info,comment_id):
+def process_and_store_embeddings(repo_info, comment_id, memory=None):
     """
     Processes the repository by cloning, computing embeddings, and storing them. Always performs a fresh setup.
+    Embeddings are stored in checkpointed batches, so an interrupted initialization of the same commit resumes
+    with the files that were not stored yet. The repository is only marked ready once every file is stored.
+    When the job comes close to its memory budget, the batch size is halved (down to 1 file), at most once per
+    batch stored, so a pending batch already past the new size is stored right away.
 
     :param repo_info: Dictionary containing repository information.
     :param comment_id: Comment ID.
+    :param memory: The `MemoryTracker` of the job.
     """
     repo_dir = os.path.join('repos', repo_info['owner'], repo_info['repo_name'])
-
-    clone_repo(repo_info['repo_url'], repo_dir)
+    timer = StageTimer(pipeline='initialization')
+    memory = memory or MemoryTracker('initialization')
+
+    # Superseded while waiting on the repository lock
+    raise_if_cancelled()
+    checkpoint = InitializationCheckpoint(db.get_repo_collection(), db.get_embeddings_collection(),
+                                          repo_info['owner'], repo_info['repo_name'], repo_info['latest_commit_sha'],
+                                          batch_size=int(os.environ.get("INITIALIZATION_BATCH_SIZE", "100")))
+
+    with admission.slot('clone'), timer.stage('clone'):
+        clone_repo(repo_info['repo_url'], repo_dir)
+    memory.checkpoint('clone')
     send_update_to_probot(repo_info['owner'], repo_info['repo_name'], repo_info.get('comment_id'),
                           "🌀 **Cloning Completed**: Repository cloned successfully.")
 
-    filtered_files = filter_files(repo_dir)
+    with timer.stage('filter'):
+        filtered_files = filter_files(repo_dir)
     for file in filtered_files:
         logger.info(f"Filtered file: {file}")
+    record_repo_size(repo_info['owner'], repo_info['repo_name'], len(filtered_files))
+    memory.checkpoint('filter')
 
     if not filtered_files:
         logger.error("No Java files found in repository.")
@@ -472,38 +1247,46 @@ def process_and_store_embeddings(repo_info,comment_id):
                               "⚠️ **No Java Files Found**: No `.java` files detected in the repository.")
         raise ValueError("No Java files found in repository.")
 
-    # Preprocess the source code files
-    preprocessed_files = preprocess_source_code(repo_dir)
+    completed_routes = checkpoint.begin(total_files=len(filtered_files))
+    if completed_routes:
+        send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
+                              f"⏯️ **Resuming Initialization**: {len(completed_routes)} of {len(filtered_files)} "
+                              "files were already stored.")
+
+    # Preprocess the source code files, storing them in batches as they are encoded.
+    # The index stage includes the batched writes, which are also recorded on their own as the store stage.
+    # Encoding isn't admitted for the whole job: each file waits for the encoder scheduler, which serves reports
+    # and updates first and lets the initializations of different owners take turns.
+    halved = False
+    with timer.stage('index'):
+        for preprocessed_file in iter_preprocessed_source_code(repo_dir, skip=completed_routes, with_terms=True):
+            logger.info(f"Preprocessed file: {preprocessed_file[:3]}")
+            clean_file = clean_embedding_paths_for_db([preprocessed_file], repo_dir)[0]
+            checkpoint.add(clean_file['path'], clean_file['embedding_text'], clean_file.get('terms'), flush=False)
+            # RSS rarely drops once it has grown, so the batch size is only halved again after a batch is stored
+            if not halved and checkpoint.batch_size > 1 and memory.under_pressure():
+                checkpoint.batch_size //= 2
+                halved = True
+                logger.warning(f"Close to the memory budget, storing batches of {checkpoint.batch_size} files.")
+            if checkpoint.full:
+                # Don't overwrite the results of a newer job
+                raise_if_cancelled()
+                with admission.slot('store'), timer.stage('store'):
+                    checkpoint.flush()
+                halved = False
+    memory.checkpoint('index')
     send_update_to_probot(repo_info['owner'], repo_info['repo_name'], comment_id,
                           "📝 **Embeddings Calculated**: Wow that took a while huh.")
-    for file in preprocessed_files:
-        logger.info(f"Preprocessed file: {file}")
 
-    # Clean data
-    clean_paths = clean_embedding_paths_for_db(preprocessed_files, repo_dir)
-
-    # Create repo document
-    repo_document = {
-        'repo_name': repo_info['repo_name'],
-        'owner': repo_info['owner'],
-        'commit_sha': repo_info['latest_commit_sha'],
-        'stored_at': datetime.utcnow().isoformat() + 'Z'
-    }
-
-    # Create embedddings documents
-    code_file_documents = [
-        {
-            'route': file['path'],
-            'embedding': file['embedding_text'],
-            'last_updated': datetime.utcnow().isoformat() + 'Z'
-        }
-        for file in clean_paths
-    ]
-
-    # Store repo and embeddings
+    # Store the last batch and mark the repository ready
     send_update_to_probot(repo_info['owner'], repo_info['repo_name'], repo_info.get('comment_id'),
                           "📚 **Storing Embeddings**: Storing repository information and embeddings in the database.")
-    send_initialized_data_to_db(repo_document, code_file_documents)
+    raise_if_cancelled()
+    with admission.slot('store'), timer.stage('store'):
+        checkpoint.complete()
+    get_bm25_indexes().discard((repo_info['owner'], repo_info['repo_name']))
+    memory.checkpoint('store')
+    logger.info(f"Initialization timings (ms): {timer.as_dict()}")
 
 
 def clean_embedding_paths_for_db(preprocessed_files, repo_dir):
@@ -522,6 +1305,9 @@ def clean_embedding_paths_for_db(preprocessed_files, repo_dir):
             'name': file[1],
             'embedding_text': file[2]
         }
+        # Term counts of the lexical index, when preprocessed with them
+        if len(file) > 3:
+            clean_file['terms'] = file[3]
         clean_files.append(clean_file)
     return clean_files
 
@@ -549,29 +1335,6 @@ def clone_repo(repo_url, repo_dir):
         raise
 
 
-def write_file_for_report_processing(repo_name, issue_content):
-    """
-    Writes the issue content to a report file in the specified repository's report directory.
-
-    :param repo_name: The name of the repository.
-    :param issue_content: The content of the issue to write.
-    :return: The path to the report file.
-    :raises: Exception if writing to the file fails.
-    """
-    reports_dir = os.path.join('reports', repo_name)
-    os.makedirs(reports_dir, exist_ok=True)  # Create the directory if it doesn't exist
-
-    report_file_path = os.path.join(reports_dir, 'report.txt')
-    try:
-        with open(report_file_path, 'w', encoding='utf-8') as report_file:
-            report_file.write(issue_content)
-        logger.info(f"Issue written to {report_file_path}.")
-        return report_file_path
-    except Exception as e:
-        logger.error(f"Failed to write issue to file: {e}")
-        raise
-
-
 def change_repository_file_permissions(repo_dir):
     """
     Changes the file permissions for all of the files in the repository directory, so that deletion can occur.
@@ -627,43 +1390,6 @@ def extract_and_validate_repo_info(data):
 # ======================================================================================================================
 # Handler Methods
 # ======================================================================================================================
-def send_initialized_data_to_db(repo_info, code_files):
-    """
-    Stores the repo document in the 'repos' collection and each code file document in the 'code_files' collection.
-
-    :param repo_info: Repository metadata to store in 'repos' collection.
-    :param code_files: List of code files with embeddings to store in 'code_files' collection.
-    :raises: Exception if storage fails.
-    """
-    logger.debug("Storing repo information and embeddings in MongoDB.")
-    try:
-        # Insert or update the repository information in 'repos' collection
-        repo = db.get_repo_collection().find_one_and_replace(
-            {'repo_name': repo_info['repo_name'], 'owner': repo_info['owner']},
-            repo_info,
-            upsert=True,
-            return_document=True  # Retrieve the updated document
-        )
-        repo_id = repo['_id']  # Get the `_id` field of the repository document
-
-        # Use the repository `_id` (repo_id) as a foreign key in `code_files` collection
-        for file_info in code_files:
-            file_info['repo_id'] = repo_id  # Add the repo_id reference to each code file document
-
-            # Insert or update each code file's embedding in 'code_files' collection
-            db.get_embeddings_collection().replace_one(
-                {'repo_id': repo_id, 'route': file_info['route']},
-                file_info,
-                upsert=True
-            )
-            logger.info(f"Stored embedding for file: {file_info['route']}")
-
-        logger.info('Repo and code file embeddings stored in database successfully.')
-    except Exception as e:
-        logger.error(f"Failed to store embeddings in database: {e}")
-        raise
-
-
 def retrieve_stored_sha(owner, repo_name):
     """
     Retrieves the stored commit SHA for the specified repository.
@@ -676,7 +1402,8 @@ def retrieve_stored_sha(owner, repo_name):
     logger.debug(f"Retrieving stored SHA for {owner}/{repo_name}.")
     try:
         if db.USE_DATABASE:
-            stored_commit_sha = retrieve_sha_from_db(owner, repo_name)
+            with DB_SECONDS.time(operation='read_sha'):
+                stored_commit_sha = retrieve_sha_from_db(owner, repo_name)
         else:
             stored_commit_sha = get_latest_sha_from_file_database(owner, repo_name)
     except Exception:
@@ -801,7 +1528,14 @@ def store_embeddings_in_file_database(embeddings_document):
         raise
 
 
-# Start the background worker thread
-worker_thread = threading.Thread(target=message_worker, daemon=True)
-worker_thread.start()
+def start_services(warm_up=True):
+    """
+    Starts the background services of the routes (the Probot notifier threads and the warm-up) and marks the app ready.
+    Called by `create_app`, so importing this module has no side effects.
 
+    :param warm_up: Start warming up the model and NLTK resources in the background.
+    """
+    notifier.start()
+    if warm_up:
+        warmup.start()
+    readiness.mark_ready('app')
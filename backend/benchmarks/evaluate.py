@@ -0,0 +1,294 @@
+"""
+Evaluates retrieval quality against latency on a labeled bug dataset:
+
+    python -m benchmarks.evaluate --dataset bugs.jsonl --engine unixcoder --engine unixcoder:precision=float16
+
+The dataset is a JSON lines file with one bug per line:
+
+    {"bug_id": "42", "repo": "snapshots/app-1.2", "report": "...", "fixed_files": ["src/main/java/.../Entry.java"]}
+
+`repo` is a directory holding the repository at the commit the bug was reported against (relative to the dataset
+file), `report` the bug report text (or `report_path`, a file relative to the dataset file). A fixed file matches a
+ranked route when it is the route or a path suffix of it, i.e. `org/app/Entry.java`.
+
+Each engine indexes every snapshot the way the pipeline does (`Preprocessor.preprocess_text` of every Java file),
+then ranks every bug report against it (`Preprocessor.preprocess_text` of the report, then `rank_files`). Hybrid
+engines also index the preprocessed tokens with BM25 and only rank the best lexical candidates by embedding.
+"""
+import argparse
+import json
+import logging
+import math
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STOP_WORDS_PATH = Path(__file__).parent / "../data/stop_words/java-keywords-bugs.txt"
+TOP_K = (1, 5, 10)
+PRECISIONS = {'float32': np.float32, 'float16': np.float16}
+
+
+class Engine:
+    """
+    An engine configuration, parsed from `<encoder>[:option=value,...]`, i.e. `hashed:ranking=numpy`.
+
+    - encoder: `unixcoder`, `hashed` or `sidecar` (see `services.encoder.create_bug_localizer`).
+    - ranking: `encoder` (the encoder's own `rank_files`, the default), `numpy` (`services.ranking.rank_files`) or
+      `hybrid` (BM25 candidates ranked with `services.ranking.rank_files`, scores combined with `hybrid_scores`).
+    - candidates: the number of BM25 candidates of `hybrid` ranking. Defaults to `200`.
+    - precision: `float32` (the default) or `float16`, the precision the index is stored with.
+
+    :param spec: The configuration string, also the engine's name in the results.
+    """
+    RANKINGS = ('encoder', 'numpy', 'hybrid')
+
+    def __init__(self, spec):
+        self.spec = spec
+        encoder, _, options = spec.partition(':')
+        self.encoder = encoder
+        self.ranking = 'encoder'
+        self.candidates = 200
+        self.precision = 'float32'
+        for option in filter(None, options.split(',')):
+            key, _, value = option.partition('=')
+            if key == 'ranking' and value in Engine.RANKINGS:
+                self.ranking = value
+            elif key == 'candidates' and value.isdigit() and int(value) > 0:
+                self.candidates = int(value)
+            elif key == 'precision' and value in PRECISIONS:
+                self.precision = value
+            else:
+                raise ValueError(f"Invalid engine option {option!r} in {spec!r}")
+        self.__bug_localizer = None
+
+    @property
+    def bug_localizer(self):
+        if self.__bug_localizer is None:
+            from services.encoder import create_bug_localizer
+            self.__bug_localizer = create_bug_localizer(self.encoder)
+        return self.__bug_localizer
+
+    def store(self, embedding):
+        """
+        Rounds an embedding through the index precision, like storing it would.
+        """
+        if self.precision == 'float32':
+            return embedding
+        return np.asarray(embedding, dtype=PRECISIONS[self.precision]).astype(np.float32).tolist()
+
+    def rank_files(self, query_embeddings, db_embeddings, query_tokens=None, lexical_index=None):
+        if self.ranking == 'hybrid':
+            from services.bm25 import hybrid_scores
+            from services.ranking import rank_files
+            candidates = lexical_index.top(query_tokens or [], self.candidates)
+            if not candidates:
+                return rank_files(query_embeddings, db_embeddings)
+            routes = {route for route, _ in candidates}
+            semantic = rank_files(query_embeddings, [(route, embedding) for route, embedding in db_embeddings
+                                                     if route in routes])
+            return hybrid_scores(candidates, semantic)
+        if self.ranking == 'numpy':
+            from services.ranking import rank_files
+            return rank_files(query_embeddings, db_embeddings)
+        return self.bug_localizer.rank_files(query_embeddings, db_embeddings)
+
+    def preprocess(self, preprocessor, text):
+        """
+        Preprocesses a text like the pipeline does, keeping its tokens for hybrid ranking.
+
+        Returns:
+            tuple: the chunk embeddings and the tokens (None unless the ranking is hybrid)
+        """
+        if self.ranking != 'hybrid':
+            return preprocessor.preprocess_text(text, STOP_WORDS_PATH) or [], None
+        tokens = preprocessor.preprocess_tokens(text, STOP_WORDS_PATH) or []
+        return preprocessor.encode_tokens(tokens), tokens
+
+
+def load_dataset(path):
+    """
+    Reads a dataset file, resolving the repository and report paths against its directory.
+
+    Returns:
+        list: dicts with bug_id, repo (Path), report (str) and fixed_files (list)
+    """
+    base = Path(path).parent
+    cases = []
+    with open(path) as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            report = case.get('report')
+            if report is None:
+                report = (base / case['report_path']).read_text(encoding='utf-8')
+            cases.append({'bug_id': str(case.get('bug_id', number)), 'repo': base / case['repo'], 'report': report,
+                          'fixed_files': list(case['fixed_files'])})
+    return cases
+
+
+def is_match(route, fixed_file):
+    return route == fixed_file or route.endswith('/' + fixed_file.lstrip('/'))
+
+
+def relevant_ranks(ranked_routes, fixed_files):
+    """
+    Returns:
+        list: the 1-based ranks of the routes that match a fixed file
+    """
+    return [rank for rank, route in enumerate(ranked_routes, start=1)
+            if any(is_match(route, fixed_file) for fixed_file in fixed_files)]
+
+
+def average_precision(ranks, relevant_count):
+    """
+    Args:
+        ranks (list): the sorted 1-based ranks of the relevant files found
+        relevant_count (int): the number of relevant files, found or not
+
+    Returns:
+        float: the average of the precision at each relevant file
+    """
+    if not relevant_count:
+        return 0.0
+    return sum((hit / rank) for hit, rank in enumerate(ranks, start=1)) / relevant_count
+
+
+def summarize(per_bug, latencies, index):
+    """
+    Aggregates the per-bug ranks into Top-k accuracy, MAP and MRR, next to the latency and the index size.
+
+    Args:
+        per_bug (list): dicts with the bug's `ranks` and `relevant` count
+        latencies (list): seconds per query (preprocessing the report and ranking)
+        index (dict): files, chunks and bytes of the indexes built
+
+    Returns:
+        dict: the metrics
+    """
+    count = len(per_bug)
+    latencies = sorted(latencies)
+
+    def percentile(fraction):
+        if not latencies:
+            return None
+        return round(latencies[min(math.ceil(fraction * len(latencies)) - 1, len(latencies) - 1)] * 1000, 2)
+
+    metrics = {'bugs': count}
+    for k in TOP_K:
+        metrics[f'top_{k}'] = round(sum(1 for bug in per_bug if bug['ranks'] and bug['ranks'][0] <= k) / count, 4) \
+            if count else 0.0
+    metrics['map'] = round(statistics.fmean(average_precision(bug['ranks'], bug['relevant']) for bug in per_bug), 4) \
+        if count else 0.0
+    metrics['mrr'] = round(statistics.fmean(1 / bug['ranks'][0] if bug['ranks'] else 0.0 for bug in per_bug), 4) \
+        if count else 0.0
+    metrics['latency_p50_ms'] = percentile(0.5)
+    metrics['latency_p95_ms'] = percentile(0.95)
+    metrics.update(index)
+    return metrics
+
+
+def build_index(engine, preprocessor, repo_dir):
+    """
+    Encodes every Java file of a repository snapshot, without modifying it (unlike `filter_files`).
+
+    Returns:
+        tuple: a list of (route, chunk embeddings) tuples and the BM25 index of the files (None unless the
+            ranking is hybrid)
+    """
+    from services.bm25 import BM25Index, term_counts
+
+    embeddings = []
+    lexical_index = BM25Index() if engine.ranking == 'hybrid' else None
+    for file_path in sorted(Path(repo_dir).rglob("*.java")):
+        if not file_path.is_file() or any(part.startswith('.') for part in file_path.relative_to(repo_dir).parts):
+            continue
+        route = file_path.relative_to(repo_dir).as_posix()
+        embedding, tokens = engine.preprocess(preprocessor, file_path.read_text(encoding='utf-8', errors='replace'))
+        embeddings.append((route, engine.store(embedding or [])))
+        if lexical_index is not None and tokens:
+            lexical_index.add(route, term_counts(tokens))
+    return embeddings, lexical_index
+
+
+def evaluate_engine(engine, cases, preprocessor=None):
+    """
+    Indexes every snapshot of the dataset once with the engine and ranks each bug report against its snapshot.
+
+    Args:
+        engine (Engine): the engine configuration
+        cases (list): the output of `load_dataset`
+        preprocessor (Preprocessor): defaults to a Preprocessor encoding with the engine's encoder
+
+    Returns:
+        dict: the metrics (see `summarize`), with the time spent indexing
+    """
+    if preprocessor is None:
+        from services.preprocess import Preprocessor
+        preprocessor = Preprocessor(engine.bug_localizer)
+
+    indexes, lexical_indexes = {}, {}
+    index_seconds = 0.0
+    per_bug, latencies = [], []
+    for case in cases:
+        repo = Path(case['repo']).resolve()
+        if repo not in indexes:
+            start = time.perf_counter()
+            indexes[repo], lexical_indexes[repo] = build_index(engine, preprocessor, repo)
+            index_seconds += time.perf_counter() - start
+            logger.info(f"{engine.spec}: indexed {len(indexes[repo])} files of {repo}")
+
+        start = time.perf_counter()
+        query, query_tokens = engine.preprocess(preprocessor, case['report'])
+        ranked = engine.rank_files(query, indexes[repo], query_tokens, lexical_indexes[repo])
+        latencies.append(time.perf_counter() - start)
+
+        ranks = relevant_ranks([route for route, _ in ranked], case['fixed_files'])
+        per_bug.append({'bug_id': case['bug_id'], 'ranks': ranks, 'relevant': len(case['fixed_files'])})
+
+    chunks = sum(len(embedding) for index in indexes.values() for _, embedding in index)
+    dim = next((len(np.ravel(embedding[0])) for index in indexes.values() for _, embedding in index if embedding), 0)
+    index = {'index_files': sum(len(index) for index in indexes.values()), 'index_chunks': chunks,
+             'index_bytes': chunks * dim * np.dtype(PRECISIONS[engine.precision]).itemsize,
+             'index_seconds': round(index_seconds, 3)}
+    return summarize(per_bug, latencies, index)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluates localization quality and latency of engine "
+                                                 "configurations on a labeled bug dataset.")
+    parser.add_argument('--dataset', required=True, help="JSON lines file of bugs")
+    parser.add_argument('--engine', action='append', default=None,
+                        help="engine configuration, i.e. 'unixcoder' or 'hashed:precision=float16' (repeatable)")
+    parser.add_argument('--output', default=None, help="file to write the results to (JSON)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+    cases = load_dataset(args.dataset)
+    engines = [Engine(spec) for spec in (args.engine or ['unixcoder'])]
+
+    results = {}
+    for engine in engines:
+        results[engine.spec] = evaluate_engine(engine, cases)
+
+    columns = ['top_1', 'top_5', 'top_10', 'map', 'mrr', 'latency_p50_ms', 'latency_p95_ms', 'index_bytes']
+    print(f"{'engine':<32}" + "".join(f"{column:>16}" for column in columns))
+    for spec, metrics in results.items():
+        print(f"{spec:<32}" + "".join(f"{metrics[column]:>16}" for column in columns))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'dataset': args.dataset, 'engines': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+Load test for a running backend, with the stub server standing in for Probot and GitHub:
+
+    PROBOT_URL=http://127.0.0.1:3000/post-message GITHUB_API_URL=http://127.0.0.1:3000 python index.py
+    python -m benchmarks.loadtest --fixtures-out fixtures --repos 4 --files 300 --scenario report --rate 5 \
+        --concurrency 8 --requests 200
+
+The load is synthetic installations (`/initialization`) and issues (`/report`) against the fixture repositories,
+or the recorded payloads of `--replay` (JSON lines of `{"endpoint": "/report", "payload": {...}}`). Requests are
+sent on an open-loop schedule of `--rate` requests per second (as fast as `--concurrency` allows with `--rate 0`).
+"""
+import argparse
+import itertools
+import json
+import logging
+import math
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from git import Repo
+
+from benchmarks.stub_server import StubServer
+from benchmarks.synthetic_repo import generate_bug_report, generate_repo
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ('initialization', 'report', 'mixed')
+FIXTURE_OWNER = "ladybug-load"
+
+
+def prepare_fixtures(fixtures_dir, repos=2, files=100, lines_per_file=150, seed=0):
+    """
+    Generates synthetic fixture repositories with two commits each, so reports against the second commit
+    exercise the incremental update (compare and zipball) path.
+
+    Returns:
+        list: dicts of owner, repo_name, initial_sha and latest_sha
+    """
+    fixtures = []
+    for i in range(repos):
+        repo_dir = Path(fixtures_dir) / FIXTURE_OWNER / f"repo-{i}"
+        routes, initial_sha = generate_repo(repo_dir, files=files, lines_per_file=lines_per_file, seed=seed + i)
+
+        # The second commit edits a tenth of the files
+        repo = Repo(repo_dir)
+        for route in routes[::10]:
+            with open(repo_dir / route, 'a', encoding='utf-8') as f:
+                f.write("// Changed by the second commit\n")
+        repo.git.add(A=True)
+        repo.index.commit("Edit a tenth of the files")
+        fixtures.append({'owner': FIXTURE_OWNER, 'repo_name': f"repo-{i}", 'initial_sha': initial_sha,
+                         'latest_sha': repo.head.commit.hexsha})
+    return fixtures
+
+
+def discover_fixtures(fixtures_dir):
+    """
+    Returns:
+        list: dicts of owner, repo_name, initial_sha and latest_sha of the fixtures in a directory
+    """
+    fixtures = []
+    for repo_dir in sorted(Path(fixtures_dir).glob("*/*")):
+        if not (repo_dir / ".git").is_dir():
+            continue
+        commits = list(Repo(repo_dir).iter_commits())
+        fixtures.append({'owner': repo_dir.parent.name, 'repo_name': repo_dir.name,
+                         'initial_sha': commits[-1].hexsha, 'latest_sha': commits[0].hexsha})
+    return fixtures
+
+
+def synthetic_requests(scenario, fixtures, stub, count):
+    """
+    Builds the requests of a synthetic scenario, cycling through the fixtures. `/report` requests carry the
+    latest commit, `/initialization` requests the first one.
+
+    Returns:
+        list: (endpoint, payload) tuples
+    """
+    if scenario not in SCENARIOS:
+        raise ValueError(f"Unknown scenario {scenario}, expected one of {SCENARIOS}")
+
+    built = []
+    for i, fixture in zip(range(count), itertools.cycle(fixtures)):
+        endpoint = scenario if scenario != 'mixed' else ('initialization' if i % 10 == 0 else 'report')
+        repo_data = {
+            'repo_url': stub.clone_url(fixture['owner'], fixture['repo_name']),
+            'owner': fixture['owner'],
+            'repo_name': fixture['repo_name'],
+            'default_branch': 'master',
+            'latest_commit_sha': fixture['initial_sha'] if endpoint == 'initialization' else fixture['latest_sha'],
+        }
+        if endpoint == 'initialization':
+            built.append(('/initialization', {'repoData': repo_data, 'comment_id': 10_000 + i}))
+        else:
+            built.append(('/report', {'repository': repo_data, 'issue': generate_bug_report(i),
+                                      'comment_id': 10_000 + i}))
+    return built
+
+
+def replayed_requests(path):
+    """
+    Returns:
+        list: (endpoint, payload) tuples of a recording
+    """
+    with open(path) as f:
+        return [(record['endpoint'], record['payload']) for record in map(json.loads, f) if record]
+
+
+def run_load(base_url, load, rate=0, concurrency=4, timeout=600):
+    """
+    Sends the requests on an open-loop schedule and measures them.
+
+    Args:
+        base_url (str): the backend, i.e. 'http://localhost:5000'
+        load (list): (endpoint, payload) tuples, sent in order
+        rate (float): requests per second, 0 to send as fast as the concurrency allows
+        concurrency (int): the most requests in flight
+        timeout (float): seconds before a request counts as failed
+
+    Returns:
+        dict: per endpoint and overall: requests, errors, error rate, status codes, throughput and latency percentiles
+    """
+    session = requests.Session()
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+    lock = threading.Lock()
+    outcomes = defaultdict(list)
+    start = time.perf_counter()
+
+    def send(i, endpoint, payload):
+        if rate > 0:
+            time.sleep(max(start + i / rate - time.perf_counter(), 0))
+        sent = time.perf_counter()
+        try:
+            status = session.post(base_url.rstrip('/') + endpoint, json=payload, timeout=timeout).status_code
+        except requests.RequestException as e:
+            logger.warning(f"{endpoint} failed: {e}")
+            status = 'exception'
+        with lock:
+            outcomes[endpoint].append((status, time.perf_counter() - sent))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i, (endpoint, payload) in enumerate(load):
+            executor.submit(send, i, endpoint, payload)
+    elapsed = time.perf_counter() - start
+
+    results = {endpoint: summarize(samples, elapsed) for endpoint, samples in outcomes.items()}
+    results['overall'] = summarize([sample for samples in outcomes.values() for sample in samples], elapsed)
+    return results
+
+
+def summarize(samples, elapsed):
+    """
+    Args:
+        samples (list): (status code or 'exception', seconds) tuples
+        elapsed (float): the duration of the whole run in seconds
+
+    Returns:
+        dict: the metrics of the samples
+    """
+    latencies = sorted(seconds for _, seconds in samples)
+    errors = sum(1 for status, _ in samples if status == 'exception' or status >= 400)
+
+    def percentile(fraction):
+        if not latencies:
+            return None
+        return round(latencies[min(math.ceil(fraction * len(latencies)) - 1, len(latencies) - 1)] * 1000, 1)
+
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'statuses': dict(Counter(str(status) for status, _ in samples)),
+        'throughput_per_second': round(len(samples) / elapsed, 3) if elapsed > 0 else None,
+        'latency_p50_ms': percentile(0.5),
+        'latency_p90_ms': percentile(0.9),
+        'latency_p99_ms': percentile(0.99),
+        'latency_max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load tests a backend with the stub server in place of Probot "
+                                                 "and GitHub.")
+    parser.add_argument('--backend', default='http://localhost:5000', help="backend base URL")
+    parser.add_argument('--fixtures', default=None, help="existing fixture directory")
+    parser.add_argument('--fixtures-out', default=None, help="directory to generate fixtures in")
+    parser.add_argument('--repos', type=int, default=2, help="fixture repositories to generate")
+    parser.add_argument('--files', type=int, default=100, help="Java files per generated fixture")
+    parser.add_argument('--stub-host', default='127.0.0.1')
+    parser.add_argument('--stub-port', type=int, default=3000)
+    parser.add_argument('--scenario', default='report', choices=SCENARIOS)
+    parser.add_argument('--replay', default=None, help="JSON lines of recorded {endpoint, payload} requests")
+    parser.add_argument('--requests', type=int, default=50, help="synthetic requests to send")
+    parser.add_argument('--rate', type=float, default=0, help="requests per second, 0 for as fast as possible")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--output', default=None, help="file to write the results to (JSON)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+    fixtures_dir = args.fixtures or args.fixtures_out
+    if not fixtures_dir:
+        print("Either --fixtures or --fixtures-out is required.")
+        return 2
+
+    fixtures = (prepare_fixtures(fixtures_dir, args.repos, args.files) if args.fixtures_out
+                else discover_fixtures(fixtures_dir))
+    stub = StubServer(fixtures_dir, args.stub_host, args.stub_port).start()
+    print(f"Stub serving {len(fixtures)} fixture(s): PROBOT_URL={stub.url}/post-message GITHUB_API_URL={stub.url}")
+
+    try:
+        load = (replayed_requests(args.replay) if args.replay
+                else synthetic_requests(args.scenario, fixtures, stub, args.requests))
+        results = run_load(args.backend, load, args.rate, args.concurrency, args.timeout)
+        results['stub'] = stub.stats()
+    finally:
+        stub.stop()
+
+    for endpoint, metrics in results.items():
+        if endpoint == 'stub':
+            continue
+        print(f"{endpoint:<16} {metrics['requests']:>6} requests  {metrics['error_rate']:>7.1%} errors  "
+              f"{metrics['throughput_per_second']:>8.2f}/s  p50 {metrics['latency_p50_ms']} ms  "
+              f"p90 {metrics['latency_p90_ms']} ms  p99 {metrics['latency_p99_ms']} ms")
+    print(f"Probot messages received: {results['stub']['messages']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 1 if results['overall']['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
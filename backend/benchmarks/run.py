@@ -0,0 +1,426 @@
+"""
+Benchmark suite for the pipeline, run against a synthetic Java repository:
+
+    python -m benchmarks.run --files 500 --output results.json
+    python -m benchmarks.run --files 500 --baseline results.json
+
+Results are written as JSON. Against a baseline, the median of every benchmark is compared and the command exits
+with status 1 if one is slower by more than the tolerance. The embedding cache is off unless EMBEDDING_CACHE_SIZE
+is set, so repeated runs of the flows encode every file again.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic_repo import generate_repo, generate_bug_report
+
+logger = logging.getLogger(__name__)
+
+STOP_WORDS_PATH = Path(__file__).parent / "../data/stop_words/java-keywords-bugs.txt"
+BENCHMARK_OWNER = "ladybug-benchmarks"
+EMBEDDING_DIM = 768
+CHUNK_SIZE = 500
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """
+    Registers a benchmark. It is called with the `BenchmarkContext` and returns the result of `measure`.
+    """
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+class BenchmarkContext:
+    """
+    The synthetic repository and parameters shared by the benchmarks of a run.
+
+    :param repo_dir: The generated repository (a git repository).
+    :param routes: The Java files of the repository, relative to repo_dir.
+    :param commit_sha: The commit of the generated repository.
+    :param parameters: The run parameters (see `parse_args`).
+    :param work_dir: A scratch directory, removed after the run.
+    """
+
+    def __init__(self, repo_dir, routes, commit_sha, parameters, work_dir):
+        self.repo_dir = Path(repo_dir)
+        self.routes = routes
+        self.commit_sha = commit_sha
+        self.parameters = parameters
+        self.work_dir = Path(work_dir)
+        self.repo_name = f"synthetic-{parameters['files']}-{parameters['seed']}"
+
+    @property
+    def repeat(self):
+        return self.parameters['repeat']
+
+    def sample_texts(self):
+        """
+        Returns:
+            list: the contents of the first `sample` Java files
+        """
+        return [(self.repo_dir / route).read_text(encoding="utf-8")
+                for route in self.routes[:self.parameters['sample']]]
+
+    def synthetic_embeddings(self):
+        """
+        Builds deterministic embeddings with the shape the encoder produces: one [vector] per 500-character chunk.
+
+        Returns:
+            list: tuples of (route, chunk embeddings as lists)
+        """
+        rng = np.random.default_rng(self.parameters['seed'])
+        embeddings = []
+        for route in self.routes:
+            chunks = max(math.ceil((self.repo_dir / route).stat().st_size / CHUNK_SIZE), 1)
+            vectors = rng.standard_normal((chunks, EMBEDDING_DIM)).astype(np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            embeddings.append((route, [[vector.tolist()] for vector in vectors]))
+        return embeddings
+
+
+def measure(func, repeat, setup=None, items=1):
+    """
+    Times `func` `repeat` times after one untimed warm-up call.
+
+    Args:
+        func (callable): the code to time, called with the return value of `setup` as arguments
+        repeat (int): the number of timed calls
+        setup (callable): builds the arguments of each call, untimed (i.e. a fresh copy of a directory)
+        items (int): the number of items (files, chunks) one call processes, for the throughput
+
+    Returns:
+        dict: runs, min, median, p95 and mean in ms, items and items per second at the median
+    """
+    func(*(setup() if setup else ()))
+
+    samples = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+
+    samples.sort()
+    median = statistics.median(samples)
+    return {
+        'runs': len(samples),
+        'min_ms': round(samples[0] * 1000, 3),
+        'median_ms': round(median * 1000, 3),
+        'p95_ms': round(samples[min(math.ceil(0.95 * len(samples)) - 1, len(samples) - 1)] * 1000, 3),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+        'items': items,
+        'items_per_second': round(items / median, 2) if median > 0 else None,
+    }
+
+
+# ======================================================================================================================
+# Benchmarks
+# ======================================================================================================================
+
+@benchmark('filter_files')
+def bench_filter_files(context):
+    from services.filter import filter_files
+
+    copies = iter(range(context.repeat + 1))
+
+    def fresh_clone():
+        target = context.work_dir / f"filter-{next(copies)}"
+        shutil.copytree(context.repo_dir, target)
+        return (str(target),)
+
+    return measure(filter_files, context.repeat, setup=fresh_clone, items=len(context.routes))
+
+
+@benchmark('preprocess_text')
+def bench_preprocess_text(context):
+    from services.preprocess import Preprocessor
+
+    preprocessor = Preprocessor()
+    texts = context.sample_texts()
+
+    def preprocess_all():
+        for text in texts:
+            preprocessor.preprocess_text(text, STOP_WORDS_PATH)
+
+    return measure(preprocess_all, context.repeat, items=len(texts))
+
+
+@benchmark('encode_text')
+def bench_encode_text(context):
+    from services.encoder import get_bug_localizer
+
+    bug_localizer = get_bug_localizer()
+    texts = [text.lower() for text in context.sample_texts()]
+    chunks = sum(math.ceil(len(text) / CHUNK_SIZE) for text in texts)
+
+    def encode_all():
+        for text in texts:
+            bug_localizer.encode_text(text)
+
+    return measure(encode_all, context.repeat, items=chunks)
+
+
+@benchmark('rank_files')
+def bench_rank_files(context):
+    from services.encoder import get_bug_localizer
+
+    bug_localizer = get_bug_localizer()
+    db_embeddings = context.synthetic_embeddings()
+    query = db_embeddings[0][1][:2]
+
+    return measure(lambda: bug_localizer.rank_files(query, db_embeddings), context.repeat, items=len(db_embeddings))
+
+
+@benchmark('rank_files_batch')
+def bench_rank_files_batch(context):
+    from services.ranking import rank_files_batch
+
+    db_embeddings = context.synthetic_embeddings()
+    queries = [embedding[:2] for _, embedding in db_embeddings[:100]]
+
+    return measure(lambda: rank_files_batch(queries, db_embeddings, top_k=10), context.repeat, items=len(queries))
+
+
+@benchmark('storage_write')
+def bench_storage_write(context):
+    from database.database import Database
+    from services.checkpoint import InitializationCheckpoint
+
+    db = Database()
+    embeddings = context.synthetic_embeddings()
+
+    def store_all():
+        checkpoint = InitializationCheckpoint(db.get_repo_collection(), db.get_embeddings_collection(),
+                                              BENCHMARK_OWNER, context.repo_name, context.commit_sha)
+        checkpoint.begin(total_files=len(embeddings))
+        for route, embedding in embeddings:
+            checkpoint.add(route, embedding)
+        checkpoint.complete()
+
+    return measure(store_all, context.repeat, items=len(embeddings))
+
+
+@benchmark('storage_read')
+def bench_storage_read(context):
+    from database.database import Database
+
+    db = Database()
+    repo = db.get_repo_collection().find_one({'owner': BENCHMARK_OWNER, 'repo_name': context.repo_name})
+    if repo is None:
+        raise RuntimeError("storage_read reads what storage_write stored, run them together")
+
+    return measure(lambda: db.get_repo_files_embeddings(db.get_embeddings_id(repo)), context.repeat, items=len(context.routes))
+
+
+@benchmark('initialization_flow')
+def bench_initialization_flow(context):
+    client = _test_client()
+    payload = {'repoData': _repo_data(context), 'comment_id': None}
+
+    def initialize():
+        response = client.post('/initialization', json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"/initialization responded {response.status_code}: {response.get_data(as_text=True)}")
+
+    with _working_directory(context.work_dir):
+        return measure(initialize, context.repeat, items=len(context.routes))
+
+
+@benchmark('report_flow')
+def bench_report_flow(context):
+    client = _test_client()
+    payload = {'repository': _repo_data(context), 'issue': generate_bug_report(context.parameters['seed']),
+               'comment_id': 1, 'stale_ok': True}
+
+    def report():
+        response = client.post('/report', json=payload)
+        if response.status_code != 200:
+            raise RuntimeError(f"/report responded {response.status_code}: {response.get_data(as_text=True)}")
+
+    with _working_directory(context.work_dir):
+        return measure(report, context.repeat)
+
+
+def _test_client():
+    from index import create_app
+
+    return create_app({'TESTING': True}).test_client()
+
+
+def _repo_data(context):
+    return {'repo_url': str(context.repo_dir.resolve()), 'owner': BENCHMARK_OWNER, 'repo_name': context.repo_name,
+            'default_branch': 'master', 'latest_commit_sha': context.commit_sha}
+
+
+@contextmanager
+def _working_directory(path):
+    # The routes clone into ./repos
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+# ======================================================================================================================
+# Runner
+# ======================================================================================================================
+
+def run_benchmarks(parameters, names=None):
+    """
+    Generates the synthetic repository and runs the selected benchmarks in registration order.
+    A benchmark that fails (i.e. without a database) is recorded with its error and the run continues.
+
+    Args:
+        parameters (dict): files, lines, depth, seed, repeat and sample
+        names (list): the benchmarks to run, defaults to all of them
+
+    Returns:
+        dict: the environment, the parameters and the result of each benchmark
+    """
+    names = names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {', '.join(unknown)}")
+
+    results = {'environment': environment(), 'parameters': parameters, 'benchmarks': {}}
+    with tempfile.TemporaryDirectory(prefix='ladybug-bench-') as work_dir:
+        repo_dir = Path(work_dir) / 'repo'
+        start = time.perf_counter()
+        routes, commit_sha = generate_repo(repo_dir, files=parameters['files'], lines_per_file=parameters['lines'],
+                                           package_depth=parameters['depth'], seed=parameters['seed'])
+        logger.info(f"Generated {len(routes)} files in {time.perf_counter() - start:.1f}s")
+        context = BenchmarkContext(repo_dir, routes, commit_sha, parameters, work_dir)
+
+        for name in BENCHMARKS:
+            if name not in names:
+                continue
+            logger.info(f"Running {name}")
+            try:
+                results['benchmarks'][name] = BENCHMARKS[name](context)
+            except Exception as e:
+                logger.error(f"Benchmark {name} failed: {e}")
+                results['benchmarks'][name] = {'error': str(e)}
+
+    return results
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Compares the medians of a run against a baseline run.
+
+    Args:
+        results (dict): the output of `run_benchmarks`
+        baseline (dict): an earlier output of `run_benchmarks`
+        tolerance (float): the relative slowdown still accepted, i.e. 0.25 for 25%
+
+    Returns:
+        list: one dict per benchmark that succeeded in both runs, with the medians, the relative change
+        and whether it is a regression
+    """
+    rows = []
+    for name, result in results['benchmarks'].items():
+        previous = baseline.get('benchmarks', {}).get(name)
+        if not previous or 'error' in previous or 'error' in result:
+            continue
+
+        change = (result['median_ms'] - previous['median_ms']) / previous['median_ms'] if previous['median_ms'] else 0
+        rows.append({'name': name, 'baseline_ms': previous['median_ms'], 'median_ms': result['median_ms'],
+                     'change': round(change, 4), 'regression': change > tolerance})
+    return rows
+
+
+def environment():
+    """
+    Returns:
+        dict: what the timings depend on besides the code: the machine, Python and the encoder configuration
+    """
+    try:
+        revision = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                  cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        revision = None
+
+    return {
+        'revision': revision,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'encoder_backend': os.environ.get("ENCODER_BACKEND", "unixcoder"),
+        'model_path': os.environ.get("MODEL_PATH"),
+        'inference_socket': os.environ.get("INFERENCE_SOCKET"),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the pipeline against a synthetic Java repository.")
+    parser.add_argument('--files', type=int, default=200, help="number of Java files")
+    parser.add_argument('--lines', type=int, default=200, help="approximate lines per Java file")
+    parser.add_argument('--depth', type=int, default=3, help="package depth")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the repository generator")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument('--sample', type=int, default=20, help="files preprocessed and encoded per run")
+    parser.add_argument('--only', default=None, help=f"comma separated benchmarks, of: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--output', default=None, help="file to write the results to (JSON)")
+    parser.add_argument('--baseline', default=None, help="results of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="accepted slowdown against the baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    os.environ.setdefault("EMBEDDING_CACHE_SIZE", "0")
+    args = parse_args(argv)
+    parameters = {'files': args.files, 'lines': args.lines, 'depth': args.depth, 'seed': args.seed,
+                  'repeat': args.repeat, 'sample': args.sample}
+
+    results = run_benchmarks(parameters, args.only.split(',') if args.only else None)
+
+    for name, result in results['benchmarks'].items():
+        if 'error' in result:
+            print(f"{name:<22} error: {result['error']}")
+        else:
+            print(f"{name:<22} median {result['median_ms']:>10.1f} ms  p95 {result['p95_ms']:>10.1f} ms  "
+                  f"{result['items_per_second'] or 0:>10.1f} items/s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('parameters') != parameters:
+        print(f"Warning: the baseline was run with other parameters: {baseline.get('parameters')}")
+
+    regressions = 0
+    for row in compare(results, baseline, args.tolerance):
+        regressions += row['regression']
+        print(f"{row['name']:<22} {row['baseline_ms']:>10.1f} -> {row['median_ms']:>10.1f} ms "
+              f"({row['change']:+.1%}){'  REGRESSION' if row['regression'] else ''}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""
+Local stand-in for Probot and GitHub, so the backend can be load tested without the network:
+
+    python -m benchmarks.stub_server --fixtures fixtures --port 3000
+
+Fixtures are git working trees at `<fixtures>/<owner>/<repo>`. The server answers:
+
+- `POST /post-message`: Probot's progress message endpoint, counts the messages.
+- `GET /repos/<owner>/<repo>/compare/<base>...<head>`: the changed files between two commits of a fixture.
+- `GET /repos/<owner>/<repo>/zipball/<ref>`: a fixture at a commit, as a zip archive.
+- `GET /git/<owner>/<repo>.git/...`: the fixture's repository over the dumb HTTP protocol, for `git clone`.
+
+Point the backend at it with `PROBOT_URL=<url>/post-message` and `GITHUB_API_URL=<url>`.
+"""
+import argparse
+import json
+import logging
+import re
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+STATUSES = {'A': 'added', 'M': 'modified', 'D': 'removed'}
+COMPARE = re.compile(r"^/repos/([^/]+)/([^/]+)/compare/([0-9A-Za-z_.-]+)\.\.\.([0-9A-Za-z_.-]+)$")
+ZIPBALL = re.compile(r"^/repos/([^/]+)/([^/]+)/zipball/([0-9A-Za-z_.-]+)$")
+GIT = re.compile(r"^/git/([^/]+)/([^/]+)\.git/(.+)$")
+
+
+class StubServer:
+    """
+    Serves the fixtures from a background thread.
+
+    :param fixtures_dir: The directory holding the fixture repositories as `<owner>/<repo>`.
+    :param host: The interface to listen on. Defaults to `'127.0.0.1'`.
+    :param port: The port to listen on. Defaults to `0`, any free port.
+    """
+
+    def __init__(self, fixtures_dir, host='127.0.0.1', port=0):
+        self.fixtures_dir = Path(fixtures_dir)
+        self.__lock = threading.Lock()
+        self.__stats = {'messages': 0, 'compares': 0, 'zipballs': 0, 'git_requests': 0, 'not_found': 0}
+        self.__server = ThreadingHTTPServer((host, port), _handler(self))
+        self.__server.daemon_threads = True
+        self.__thread = None
+
+    @property
+    def url(self):
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def clone_url(self, owner, repo_name):
+        return f"{self.url}/git/{owner}/{repo_name}.git"
+
+    def start(self):
+        # The dumb HTTP protocol needs the refs and packs listed in info/refs and objects/info/packs
+        for fixture in self.fixtures_dir.glob("*/*"):
+            if (fixture / ".git").is_dir():
+                subprocess.run(['git', 'update-server-info'], cwd=fixture, check=True)
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name='ladybug-stub', daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def stats(self):
+        with self.__lock:
+            return dict(self.__stats)
+
+    def count(self, name):
+        with self.__lock:
+            self.__stats[name] += 1
+
+    def fixture(self, owner, repo_name):
+        path = (self.fixtures_dir / owner / repo_name).resolve()
+        if self.fixtures_dir.resolve() not in path.parents or not (path / ".git").is_dir():
+            return None
+        return path
+
+    def compare(self, owner, repo_name, base, head):
+        fixture = self.fixture(owner, repo_name)
+        if fixture is None:
+            return None
+        diff = _git(fixture, 'diff', '--no-renames', '--name-status', base, head)
+        if diff is None:
+            return None
+
+        files = []
+        for line in diff.decode().splitlines():
+            status, filename = line.split('\t', 1)
+            files.append({'filename': filename, 'status': STATUSES.get(status[0], 'modified')})
+        return {'status': 'ahead', 'files': files}
+
+    def zipball(self, owner, repo_name, ref):
+        fixture = self.fixture(owner, repo_name)
+        if fixture is None:
+            return None
+        return _git(fixture, 'archive', '--format=zip', f'--prefix={owner}-{repo_name}-{ref[:7]}/', ref)
+
+    def git_file(self, owner, repo_name, path):
+        fixture = self.fixture(owner, repo_name)
+        if fixture is None:
+            return None
+        git_dir = (fixture / ".git").resolve()
+        file_path = (git_dir / path).resolve()
+        if git_dir not in file_path.parents or not file_path.is_file():
+            return None
+        return file_path.read_bytes()
+
+
+def _git(cwd, *args):
+    result = subprocess.run(['git', *args], cwd=cwd, capture_output=True)
+    return result.stdout if result.returncode == 0 else None
+
+
+def _handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length)
+            if self.path != '/post-message':
+                return self.__respond(404, {'error': 'Not found'})
+            try:
+                message = json.loads(body)
+            except ValueError:
+                return self.__respond(400, {'error': 'Invalid JSON'})
+            if not all(message.get(field) for field in ('owner', 'repo', 'comment_id', 'message')):
+                return self.__respond(400, {'error': 'Missing required fields: owner, repo, comment_id, message'})
+            stub.count('messages')
+            self.__respond(200, {'success': True})
+
+        def do_GET(self):
+            path = self.path.split('?', 1)[0]
+            if match := COMPARE.match(path):
+                stub.count('compares')
+                return self.__respond_or_404(stub.compare(*match.groups()), 'application/json')
+            if match := ZIPBALL.match(path):
+                stub.count('zipballs')
+                return self.__respond_or_404(stub.zipball(*match.groups()), 'application/zip')
+            if match := GIT.match(path):
+                stub.count('git_requests')
+                return self.__respond_or_404(stub.git_file(*match.groups()), 'application/octet-stream')
+            self.__respond_or_404(None, None)
+
+        def __respond_or_404(self, body, content_type):
+            if body is None:
+                stub.count('not_found')
+                return self.__respond(404, {'message': 'Not Found'})
+            if isinstance(body, dict):
+                return self.__respond(200, body)
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def __respond(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serves fixture repositories in place of Probot and GitHub.")
+    parser.add_argument('--fixtures', required=True, help="directory of <owner>/<repo> git working trees")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3000)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    stub = StubServer(args.fixtures, args.host, args.port).start()
+    print(f"PROBOT_URL={stub.url}/post-message GITHUB_API_URL={stub.url}")
+    try:
+        while True:
+            time.sleep(60)
+            logger.info(f"Stub stats: {stub.stats()}")
+    except KeyboardInterrupt:
+        stub.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
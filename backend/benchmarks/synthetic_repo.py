@@ -0,0 +1,140 @@
+"""
+Generates synthetic Java repositories of a configurable size for benchmarking.
+The same parameters and seed always produce the same repository.
+"""
+import random
+from pathlib import Path
+
+from git import Repo
+
+WORDS = (
+    "account", "adapter", "address", "audit", "balance", "buffer", "cache", "cart", "channel", "client", "config",
+    "connection", "context", "customer", "date", "event", "factory", "file", "handler", "index", "invoice", "item",
+    "job", "key", "listener", "loader", "manager", "message", "node", "order", "parser", "payment", "profile",
+    "provider", "queue", "record", "registry", "report", "request", "resolver", "response", "schedule", "session",
+    "settings", "state", "stream", "task", "token", "user", "validator", "value", "worker",
+)
+VERBS = ("add", "build", "check", "close", "compute", "create", "find", "get", "handle", "load", "merge", "open",
+         "parse", "process", "remove", "reset", "save", "send", "set", "update", "validate")
+TYPES = ("int", "long", "String", "boolean", "double", "List<String>", "Map<String, Integer>")
+
+# Files a real repository has besides its sources, removed by filter_files
+EXTRA_FILES = {
+    "README.md": "# Synthetic repository\n\nGenerated for benchmarking.\n",
+    ".gitignore": "build/\n*.class\n",
+    "build.gradle": "plugins {\n    id 'java'\n}\n",
+}
+
+
+def _identifier(rng, parts=2):
+    words = [rng.choice(WORDS) for _ in range(parts)]
+    return words[0] + "".join(word.capitalize() for word in words[1:])
+
+
+def _class_name(rng):
+    return "".join(rng.choice(WORDS).capitalize() for _ in range(2))
+
+
+def generate_java_file(rng, package, class_name, lines):
+    """
+    Generates the source of a Java class with roughly `lines` lines of fields, comments and methods.
+
+    Args:
+        rng (random.Random): source of randomness
+        package (str): the package of the class, i.e. 'com.example.order'
+        class_name (str): the name of the class
+        lines (int): the approximate number of lines
+
+    Returns:
+        str: the Java source
+    """
+    source = [f"package {package};", "", "import java.util.List;", "import java.util.Map;", "",
+              "/**", f" * Handles the {rng.choice(WORDS)} {rng.choice(WORDS)} of a {rng.choice(WORDS)}.", " */",
+              f"public class {class_name} {{"]
+
+    for _ in range(rng.randint(2, 5)):
+        source.append(f"    private {rng.choice(TYPES)} {_identifier(rng)};")
+    source.append("")
+
+    while len(source) < lines - 1:
+        method = rng.choice(VERBS) + _class_name(rng)
+        parameter = _identifier(rng)
+        source.append(f"    // {rng.choice(VERBS).capitalize()} the {rng.choice(WORDS)} before the {rng.choice(WORDS)}")
+        source.append(f"    public {rng.choice(TYPES)} {method}({rng.choice(TYPES)} {parameter}) {{")
+        for _ in range(rng.randint(3, 12)):
+            if len(source) >= lines - 4:
+                break
+            target = _identifier(rng)
+            if rng.random() < 0.3:
+                source.append(f"        if ({parameter} == null) {{")
+                source.append(f"            throw new IllegalStateException(\"Missing {rng.choice(WORDS)} {target}\");")
+                source.append("        }")
+            else:
+                source.append(f"        var {target} = {rng.choice(VERBS)}{_class_name(rng)}({parameter});")
+        source.append("        return null;")
+        source.append("    }")
+        source.append("")
+
+    source.append("}")
+    return "\n".join(source) + "\n"
+
+
+def generate_repo(root, files=100, lines_per_file=200, package_depth=3, seed=0, init_git=True):
+    """
+    Writes a synthetic Java repository, optionally committed to a git repository so it can be cloned.
+
+    Args:
+        root (str): directory to write the repository to (created if missing)
+        files (int): number of Java files
+        lines_per_file (int): approximate number of lines of each Java file
+        package_depth (int): number of directories below `src/main/java` (at least 1)
+        seed (int): seed of the generator
+
+    Returns:
+        tuple: (list of the Java file paths relative to root, commit SHA or None)
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+
+    packages = [["com"] + [rng.choice(WORDS) for _ in range(max(package_depth, 1) - 1)]
+                for _ in range(max(files // 10, 1))]
+
+    routes = []
+    for i in range(files):
+        package = rng.choice(packages)
+        class_name = f"{_class_name(rng)}{i}"
+        route = Path("src", "main", "java", *package, f"{class_name}.java")
+        (root / route).parent.mkdir(parents=True, exist_ok=True)
+        (root / route).write_text(generate_java_file(rng, ".".join(package), class_name, lines_per_file),
+                                  encoding="utf-8")
+        routes.append(route.as_posix())
+
+    for name, content in EXTRA_FILES.items():
+        (root / name).write_text(content, encoding="utf-8")
+
+    if not init_git:
+        return routes, None
+
+    repo = Repo.init(root)
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "Ladybug Benchmarks")
+        config.set_value("user", "email", "benchmarks@example.com")
+    repo.git.add(A=True)
+    repo.index.commit(f"Synthetic repository ({files} files, seed {seed})")
+    return routes, repo.head.commit.hexsha
+
+
+def generate_bug_report(seed=0):
+    """
+    Generates a bug report mentioning identifiers of the kind the synthetic repository uses.
+
+    Returns:
+        str: the bug report
+    """
+    rng = random.Random(seed)
+    return (f"{rng.choice(VERBS).capitalize()}{_class_name(rng)} throws IllegalStateException\n\n"
+            f"When the {rng.choice(WORDS)} {rng.choice(WORDS)} is saved, {_identifier(rng)} is missing and "
+            f"{rng.choice(VERBS)}{_class_name(rng)} fails with \"Missing {rng.choice(WORDS)}\".\n"
+            f"Steps: open the {rng.choice(WORDS)} settings, {rng.choice(VERBS)} the {rng.choice(WORDS)}, "
+            f"then {rng.choice(VERBS)} it again.\n")
@@ -7,11 +7,11 @@ except ImportError:
 
 
 class BugLocalization:
-    def __init__(self):
-        # Set up device and initialize the UniXcoder model
+    def __init__(self, model_name="microsoft/unixcoder-base"):
+        # Set up device and initialize the UniXcoder model (a Hugging Face id or a local directory)
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         print("CUDA is available" if torch.cuda.is_available() else "CUDA is not available")
-        self.model = UniXcoder("microsoft/unixcoder-base")
+        self.model = UniXcoder(model_name)
         self.model.to(self.device)
 
         # Encoding for Long Texts
@@ -44,6 +44,35 @@ class BugLocalization:
         # print(embeddings)
         return embeddings
 
+    # Encoding for many Long Texts
+    def encode_texts(self, texts, batch_size=16):
+        """
+        Encodes many long texts together. The roughly 500-character chunks of every text are tokenized and
+        encoded in padded batches of `batch_size` chunks, instead of one forward pass per chunk.
+        Returns a list per text, each like the result of `encode_text`.
+        """
+        chunk_size = 500
+        chunks = []
+        for index, text in enumerate(texts):
+            for i in range(0, len(text), chunk_size):
+                chunks.append((index, text[i:i + chunk_size]))
+
+        embeddings = [[] for _ in texts]
+        pad_id = self.model.config.pad_token_id
+        for start in range(0, len(chunks), batch_size):
+            batch = chunks[start:start + batch_size]
+            tokens = self.model.tokenize([text_chunk for _, text_chunk in batch], mode="<encoder-only>")
+            longest = max(len(ids) for ids in tokens)
+            source_ids = torch.tensor([ids + [pad_id] * (longest - len(ids)) for ids in tokens]).to(self.device)
+
+            # Padding is masked out by the model, so each chunk gets the embedding it would get on its own
+            with torch.no_grad():
+                _, embedding = self.model(source_ids)
+                norm_embedding = torch.nn.functional.normalize(embedding, p=2, dim=1)
+            for (index, _), vector in zip(batch, norm_embedding.tolist()):
+                embeddings[index].append([vector])
+        return embeddings
+
 
     # File Ranking for Bug Localization
     def rank_files(self, query_embeddings, db_embeddings):
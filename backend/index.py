@@ -4,7 +4,7 @@ import logging
 from flask import Flask, jsonify
 from dotenv import find_dotenv, load_dotenv
 
-from app.api.routes import routes
+from app.api.routes import routes, start_services
 from database.database import Database
 
 # Load environment variables
@@ -15,11 +15,9 @@ def create_app(test_config=None):
     app = Flask(__name__)
     app.register_blueprint(routes)
 
-    # Initializes the client
-    db = Database()
-
+    # Initializes the client (it connects on first use).
     # Configuration Flag: Add USE_DATABASE="False" to your .env to use local file database
-    db.USE_DATABASE = os.environ.get("USE_DATABASE", "True").lower() == "true"
+    Database()
 
     # Initialize logging
     logging.basicConfig(level=logging.INFO)
@@ -33,6 +31,10 @@ def create_app(test_config=None):
     if test_config:
         app.config.update(test_config)
 
+    # Start background services last, once the app is fully configured.
+    # Add WARMUP_ON_START="False" to your .env to skip the warm-up (it can be started with POST /admin/warmup)
+    start_services(warm_up=os.environ.get("WARMUP_ON_START", "True").lower() == "true" and not app.testing)
+
     return app
 
 if __name__ == "__main__":
@@ -0,0 +1,173 @@
+"""
+Production launcher: serves the backend from several pre-forked worker processes.
+
+The parent process builds the app and loads the UniXcoder weights and NLTK resources once, then forks the workers.
+Workers share the weight pages copy-on-write instead of each holding its own copy of the model,
+and each worker gets its share of the CPU cores for torch so workers don't oversubscribe them.
+The parent never runs the model: forking after torch has started its thread pools can hang the workers,
+so each worker runs the first forward pass of the warm-up itself.
+The workers share the metrics registry through a directory, so `/metrics` reports the totals of every worker
+whichever one serves it.
+
+    python serve.py --workers 4 --port 5000
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+from dotenv import find_dotenv, load_dotenv
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the Ladybug backend with pre-forked workers.")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "5000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_WORKERS", os.cpu_count() or 1)),
+                        help="Number of worker processes (WEB_WORKERS).")
+    parser.add_argument("--torch-threads", type=int, default=int(os.environ.get("TORCH_THREADS_PER_WORKER", "0")),
+                        help="Torch threads per worker (TORCH_THREADS_PER_WORKER), defaults to cores / workers.")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="Load the model in each worker instead of once in the parent.")
+    parser.add_argument("--metrics-dir", default=os.environ.get("METRICS_DIR"),
+                        help="Directory the workers share their metrics through (METRICS_DIR), "
+                             "defaults to a new temporary directory.")
+    return parser.parse_args()
+
+
+def preload_model():
+    """
+    Loads the model weights and NLTK resources in the parent so they are inherited by every worker. The rest of
+    the warm-up (the first forward pass) runs in the workers, see the module docstring.
+    """
+    from services.encoder import get_encoder_backend
+    from services.warmup import warm_up_model, warm_up_nltk
+
+    start = time.perf_counter()
+    try:
+        warm_up_nltk()
+        if get_encoder_backend() == 'unixcoder':
+            import torch
+
+            # Loading runs a few tensor ops, on one thread they don't start the OpenMP pool before the fork
+            torch.set_num_threads(1)
+        warm_up_model()
+    except Exception as e:
+        # The workers load whatever is missing during their own warm-up
+        logger.error(f"Preload failed: {e}")
+        return
+    logger.info(f"Preloaded model in {time.perf_counter() - start:.1f}s.")
+
+
+def run_worker(app, listener, host, port, torch_threads):
+    """
+    Worker process body: tunes torch threading, warms up and serves requests from the inherited listening socket.
+    """
+    # Torch is only imported here if the model (or something else) already loaded it
+    if "torch" in sys.modules:
+        torch = sys.modules["torch"]
+        torch.set_num_threads(torch_threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Only possible if something ran inter-op work in the parent
+            pass
+
+    # The parent wrote what it recorded before forking (i.e. the warm-up) to the metrics directory itself
+    from services.metrics import REGISTRY
+    REGISTRY.reset()
+    REGISTRY.start_writing(float(os.environ.get("METRICS_WRITE_SECONDS", "5")))
+
+    # Steps preloaded in the parent return right away, the worker holds its readiness until the rest finishes
+    from app.api.routes import warmup
+    warmup.start()
+
+    from werkzeug.serving import make_server
+
+    server = make_server(host, port, app, threaded=True, fd=listener.fileno())
+    logger.info(f"Worker {os.getpid()} serving with {torch_threads} torch thread(s).")
+    server.serve_forever()
+
+
+def spawn_worker(app, listener, args, torch_threads):
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        try:
+            run_worker(app, listener, args.host, args.port, torch_threads)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def main():
+    load_dotenv(find_dotenv())
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+
+    from index import create_app
+    from services.metrics import REGISTRY
+
+    # A warm-up thread started in the parent wouldn't survive the fork, and would run the model before it
+    os.environ["WARMUP_ON_START"] = "False"
+    app = create_app()
+    if not args.no_preload:
+        preload_model()
+
+    REGISTRY.share(args.metrics_dir or tempfile.mkdtemp(prefix="ladybug-metrics-"))
+    REGISTRY.write(gauges=False)
+
+    listener = socket.create_server((args.host, args.port), backlog=128)
+    listener.set_inheritable(True)
+
+    torch_threads = args.torch_threads or max(1, (os.cpu_count() or 1) // args.workers)
+
+    # Move everything allocated so far out of the garbage collector's reach, so collections in the
+    # workers don't write to (and copy) the pages shared with the parent
+    gc.collect()
+    gc.freeze()
+
+    workers = {spawn_worker(app, listener, args, torch_threads) for _ in range(args.workers)}
+    logger.info(f"Started {len(workers)} worker(s) on {args.host}:{args.port}.")
+
+    shutting_down = False
+
+    def shutdown(signum, frame):
+        nonlocal shutting_down
+        shutting_down = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+
+        workers.discard(pid)
+        REGISTRY.mark_process_dead(pid)
+        if not shutting_down:
+            logger.error(f"Worker {pid} exited with status {status}, starting a replacement.")
+            workers.add(spawn_worker(app, listener, args, torch_threads))
+
+    listener.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """
+    Raised when a stage has no free slot and its wait queue is full, or a slot did not free up in time.
+
+    :param stage: The stage that rejected the work.
+    :param retry_after: Suggested number of seconds before retrying.
+    """
+
+    def __init__(self, stage, retry_after):
+        self.stage = stage
+        self.retry_after = retry_after
+        super().__init__(f"The '{stage}' stage is at capacity, retry in {retry_after}s.")
+
+
+class _Stage:
+    def __init__(self, name, concurrency, max_queue):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.average_seconds = None
+
+
+class AdmissionController:
+    """
+    Bounds how much pipeline work runs at once. Every stage (i.e. clone, encode, store) has a number of
+    concurrent slots and a bounded queue of callers waiting for one. Work arriving while the queue is full is
+    rejected with `Overloaded` instead of piling up in memory, so the backend sheds load predictably.
+
+    :param limits: Mapping of stage name to a `(concurrency, max_queue)` tuple.
+    :param max_wait: The longest time, in seconds, a caller waits in a stage queue. `None` waits indefinitely.
+    :param default_retry_after: Retry-After suggested before any stage duration has been measured. Defaults to `30`.
+    """
+
+    def __init__(self, limits, max_wait=None, default_retry_after=30):
+        self.max_wait = max_wait
+        self.default_retry_after = default_retry_after
+        self.__condition = threading.Condition()
+        self.__stages = {name: _Stage(name, concurrency, max_queue)
+                         for name, (concurrency, max_queue) in limits.items()}
+
+    @contextmanager
+    def slot(self, stage):
+        """
+        Holds a slot of a stage for the duration of the block, waiting in the stage queue if all slots are taken.
+
+        Args:
+            stage (str): The stage name
+
+        :raises Overloaded: If the stage queue is full or no slot freed up within `max_wait` seconds.
+        """
+        self.__acquire(stage)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.__release(stage, time.monotonic() - start)
+
+    def check(self, stage):
+        """
+        Rejects early if work for a stage would not be admitted right now, before any work has been done.
+
+        :raises Overloaded: If every slot of the stage is taken and its queue is full.
+        """
+        with self.__condition:
+            state = self.__stages[stage]
+            if state.running >= state.concurrency and state.queued >= state.max_queue:
+                state.rejected += 1
+                raise Overloaded(stage, self.__retry_after(state))
+
+    def stats(self):
+        """
+        Gets the occupancy and counters of every stage.
+
+        Returns:
+            dict: Mapping of stage name to its running and queued work, limits and admission counters
+        """
+        with self.__condition:
+            return {
+                name: {
+                    'running': state.running,
+                    'queued': state.queued,
+                    'concurrency': state.concurrency,
+                    'max_queue': state.max_queue,
+                    'admitted': state.admitted,
+                    'rejected': state.rejected,
+                    'timed_out': state.timed_out,
+                    'average_seconds': state.average_seconds
+                }
+                for name, state in self.__stages.items()
+            }
+
+    def __acquire(self, stage):
+        with self.__condition:
+            state = self.__stages[stage]
+
+            if state.running >= state.concurrency:
+                if state.queued >= state.max_queue:
+                    state.rejected += 1
+                    logger.warning(f"Rejected '{stage}' work, {state.queued} caller(s) already waiting.")
+                    raise Overloaded(stage, self.__retry_after(state))
+
+                state.queued += 1
+                try:
+                    admitted = self.__condition.wait_for(lambda: state.running < state.concurrency,
+                                                         timeout=self.max_wait)
+                finally:
+                    state.queued -= 1
+
+                if not admitted:
+                    state.timed_out += 1
+                    logger.warning(f"Timed out waiting {self.max_wait}s for a '{stage}' slot.")
+                    raise Overloaded(stage, self.__retry_after(state))
+
+            state.running += 1
+            state.admitted += 1
+
+    def __release(self, stage, elapsed):
+        with self.__condition:
+            state = self.__stages[stage]
+            state.running -= 1
+            # Exponential moving average of the time a slot is held, used to estimate Retry-After
+            if state.average_seconds is None:
+                state.average_seconds = elapsed
+            else:
+                state.average_seconds = 0.8 * state.average_seconds + 0.2 * elapsed
+            self.__condition.notify_all()
+
+    def __retry_after(self, state):
+        if state.average_seconds is None:
+            return self.default_retry_after
+        # Time for the work ahead of the caller to drain through the stage's slots
+        return max(1, math.ceil(state.average_seconds * (state.queued + 1) / state.concurrency))
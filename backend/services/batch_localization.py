@@ -0,0 +1,65 @@
+from pathlib import Path
+
+from services.preprocess import Preprocessor
+from services.ranking import rank_files_batch
+from services.scheduler import get_scheduler
+
+STOP_WORDS_PATH = Path(__file__).parent / "../data/stop_words/java-keywords-bugs.txt"
+
+
+def localize_bug_reports(reports, repo_embeddings, top_k=10, preprocessor=None):
+    """
+    Localizes many bug reports of one repository at once, i.e. to backfill the open issues of a new installation.
+    The reports are preprocessed and encoded together, and ranked against the repository embeddings with
+    `rank_files_batch`, so the embeddings are stacked once for every report.
+
+    Args:
+        reports (list): bug report texts
+        repo_embeddings (list): tuples of (route, chunk embeddings) of the repository files
+        top_k (int): the number of files kept per report
+        preprocessor (Preprocessor): defaults to a Preprocessor encoding with the shared bug localizer
+
+    Returns:
+        list: per report, its `top_k` (route, score) tuples in descending order of similarity
+    """
+    return rank_bug_reports(encode_bug_reports(reports, preprocessor), repo_embeddings, top_k)
+
+
+def encode_bug_reports(reports, preprocessor=None):
+    """
+    Preprocesses and encodes many bug reports together, the first half of `localize_bug_reports`.
+
+    Args:
+        reports (list): bug report texts
+        preprocessor (Preprocessor): defaults to a Preprocessor encoding with the shared bug localizer
+
+    Returns:
+        list: the chunk embeddings of each report
+    """
+    if not reports:
+        return []
+
+    preprocessor = preprocessor or Preprocessor()
+    queries = preprocessor.preprocess_texts(reports, STOP_WORDS_PATH)
+    if queries is None:
+        raise ValueError(f"Bug reports could not be preprocessed, the stop words at {STOP_WORDS_PATH} are missing")
+    return queries
+
+
+def rank_bug_reports(queries, repo_embeddings, top_k=10):
+    """
+    Ranks the files of a repository for many encoded bug reports, the second half of `localize_bug_reports`.
+
+    Args:
+        queries (list): the chunk embeddings of each report, as returned by `encode_bug_reports`
+        repo_embeddings (list): tuples of (route, chunk embeddings) of the repository files
+        top_k (int): the number of files kept per report
+
+    Returns:
+        list: per report, its `top_k` (route, score) tuples in descending order of similarity
+    """
+    if not queries:
+        return []
+
+    with get_scheduler().slot():
+        return rank_files_batch(queries, repo_embeddings, top_k)
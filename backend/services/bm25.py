@@ -0,0 +1,261 @@
+import math
+import os
+import threading
+from collections import Counter
+
+_bm25_indexes = None
+_lock = threading.Lock()
+
+
+def term_counts(tokens):
+    """
+    Counts the preprocessed tokens of a file, the form files are stored in the inverted index with.
+
+    Args:
+        tokens (list): normalized, lemmatized tokens as returned by `Preprocessor.preprocess_tokens`
+
+    Returns:
+        dict: term to number of occurrences
+    """
+    return dict(Counter(tokens))
+
+
+class BM25Index:
+    """
+    In-memory inverted index of the files of a repository, scored with Okapi BM25. Files are added, replaced
+    and removed one at a time, so the index follows incremental updates without being rebuilt.
+
+    :param k1: The term frequency saturation. Defaults to `1.2`.
+    :param b: The document length normalization. Defaults to `0.75`.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.__lock = threading.Lock()
+        self.__postings = {}
+        self.__lengths = {}
+        self.__terms = {}
+        self.__missing = set()
+        self.__total_length = 0
+
+    @classmethod
+    def from_term_counts(cls, files, **kwargs):
+        """
+        Args:
+            files (iterable): tuples of (route, term counts), term counts are None for files stored without them
+
+        Returns:
+            BM25Index: the index of the files
+        """
+        index = cls(**kwargs)
+        for route, counts in files:
+            index.add(route, counts)
+        return index
+
+    def __len__(self):
+        return len(self.__lengths)
+
+    def __contains__(self, route):
+        return route in self.__lengths
+
+    @property
+    def missing_terms(self):
+        """
+        int: the number of files stored without term counts, which no query can match
+        """
+        return len(self.__missing)
+
+    @property
+    def file_count(self):
+        """
+        int: the number of files of the repository, with and without term counts
+        """
+        return len(self.__lengths) + len(self.__missing)
+
+    def add(self, route, counts):
+        """
+        Adds a file to the index, replacing its previous content if it is already indexed.
+        A file without term counts is only counted in `missing_terms`.
+
+        Args:
+            route (str): the file route
+            counts (dict): term to number of occurrences in the file, None if they weren't stored
+        """
+        with self.__lock:
+            self.__remove(route)
+            if counts is None:
+                self.__missing.add(route)
+                return
+            for term, count in counts.items():
+                self.__postings.setdefault(term, {})[route] = count
+            self.__lengths[route] = sum(counts.values())
+            self.__terms[route] = tuple(counts)
+            self.__total_length += self.__lengths[route]
+
+    def remove(self, route):
+        with self.__lock:
+            self.__remove(route)
+
+    def __remove(self, route):
+        self.__missing.discard(route)
+        length = self.__lengths.pop(route, None)
+        if length is None:
+            return
+        self.__total_length -= length
+        for term in self.__terms.pop(route):
+            del self.__postings[term][route]
+            if not self.__postings[term]:
+                del self.__postings[term]
+
+    def score(self, query_tokens):
+        """
+        Scores the files containing at least one query term. Repeated query terms count once.
+
+        Args:
+            query_tokens (list): preprocessed tokens of the query
+
+        Returns:
+            dict: route to BM25 score, only for files matching the query
+        """
+        with self.__lock:
+            files = len(self.__lengths)
+            if not files:
+                return {}
+            average_length = self.__total_length / files or 1
+
+            scores = {}
+            for term in set(query_tokens):
+                postings = self.__postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (files - len(postings) + 0.5) / (len(postings) + 0.5))
+                for route, count in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.__lengths[route] / average_length)
+                    scores[route] = scores.get(route, 0.0) + idf * count * (self.k1 + 1) / (count + norm)
+            return scores
+
+    def top(self, query_tokens, k):
+        """
+        Returns:
+            list: the (route, score) tuples of the `k` best matching files in descending order of score
+        """
+        scores = self.score(query_tokens)
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+
+
+class BM25Indexes:
+    """
+    The BM25 indexes of the repositories ranked by this process, each tagged with the commit SHA it reflects.
+    An index is loaded from the stored term counts on first use and whenever the stored SHA moved on without this
+    process seeing the update. Updates made by this process are applied to the loaded index directly.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__indexes = {}
+
+    def get(self, key, commit_sha, load):
+        """
+        Args:
+            key (tuple): (owner, repo_name)
+            commit_sha (str): the commit SHA the stored index is at
+            load (callable): returns the stored (route, term counts) tuples of the repository
+
+        Returns:
+            BM25Index: the index of the repository at the commit SHA
+        """
+        with self.__lock:
+            entry = self.__indexes.get(key)
+        if entry is not None and entry[0] == commit_sha:
+            return entry[1]
+
+        index = BM25Index.from_term_counts(load())
+        with self.__lock:
+            self.__indexes[key] = (commit_sha, index)
+        return index
+
+    def update(self, key, base_sha, upserted, removed=()):
+        """
+        Applies an incremental update to the loaded index of a repository, if there is one. An index at another
+        commit than the update's base is discarded instead (i.e. another worker patched the stored index since it
+        was loaded), so the next `get` loads the stored term counts.
+
+        Args:
+            key (tuple): (owner, repo_name)
+            base_sha (str): the commit SHA the update was computed from
+            upserted (dict): route to term counts of the added and modified files
+            removed (iterable): routes of the removed files
+        """
+        with self.__lock:
+            entry = self.__indexes.get(key)
+            if entry is not None and entry[0] != base_sha:
+                del self.__indexes[key]
+                return
+        if entry is None:
+            return
+
+        index = entry[1]
+        for route, counts in upserted.items():
+            index.add(route, counts)
+        for route in removed:
+            index.remove(route)
+
+    def advance(self, key, base_sha, commit_sha):
+        """
+        Tags the loaded index of a repository with the commit SHA an update from `base_sha` brought it to.
+        """
+        with self.__lock:
+            entry = self.__indexes.get(key)
+            if entry is not None and entry[0] == base_sha:
+                self.__indexes[key] = (commit_sha, entry[1])
+
+    def discard(self, key):
+        with self.__lock:
+            self.__indexes.pop(key, None)
+
+    def stats(self):
+        with self.__lock:
+            return {'repositories': len(self.__indexes),
+                    'files': sum(len(index) for _, index in self.__indexes.values())}
+
+
+def get_bm25_indexes():
+    """
+    Gets the process-wide BM25 indexes.
+
+    Returns:
+        BM25Indexes: The shared indexes
+    """
+    global _bm25_indexes
+
+    if _bm25_indexes is None:
+        with _lock:
+            if _bm25_indexes is None:
+                _bm25_indexes = BM25Indexes()
+
+    return _bm25_indexes
+
+
+def hybrid_scores(lexical, semantic, lexical_weight=None):
+    """
+    Combines the BM25 and embedding scores of the candidate files. BM25 scores are divided by the best one so both
+    are on a comparable scale before they are weighted.
+
+    Args:
+        lexical (list): (route, BM25 score) tuples of the candidates
+        semantic (list): (route, cosine similarity) tuples of the candidates
+        lexical_weight (float): the weight of the BM25 score, defaults to HYBRID_LEXICAL_WEIGHT (0.3)
+
+    Returns:
+        list: (route, combined score) tuples in descending order of score
+    """
+    if lexical_weight is None:
+        lexical_weight = float(os.environ.get("HYBRID_LEXICAL_WEIGHT", "0.3"))
+
+    lexical = dict(lexical)
+    best = max(lexical.values(), default=0.0) or 1.0
+    combined = [(route, (1 - lexical_weight) * score + lexical_weight * lexical.get(route, 0.0) / best)
+                for route, score in semantic]
+    combined.sort(key=lambda x: x[1], reverse=True)
+    return combined
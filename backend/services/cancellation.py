@@ -0,0 +1,119 @@
+import contextvars
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('ladybug_cancellation_token', default=None)
+
+
+class Cancelled(Exception):
+    """
+    Raised at a cancellation check point of a job that was superseded by a newer one.
+    """
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation flag of one indexing job. The job checks it between files and stops once set.
+
+    :param kind: The kind of job, i.e. 'initialization' or 'patch'.
+    :param target_sha: The commit SHA the job is indexing.
+    """
+
+    def __init__(self, kind, target_sha):
+        self.kind = kind
+        self.target_sha = target_sha
+        self.reason = None
+        self.__event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.__event.is_set()
+
+    def cancel(self, reason):
+        self.reason = reason
+        self.__event.set()
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise Cancelled(self.reason)
+
+
+class CancellationRegistry:
+    """
+    Tracks the indexing jobs of every repository so a newer job can cancel the ones it supersedes,
+    instead of letting them encode a commit whose results would be thrown away.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__tokens = {}
+        self.__cancelled = 0
+
+    @contextmanager
+    def track(self, key, kind, target_sha, supersedes=(), is_newer=None):
+        """
+        Registers a job for the duration of the block and makes its token the current one (see `raise_if_cancelled`).
+        Running jobs of the kinds in `supersedes` are cancelled, unless they target the same SHA as a job of the
+        same kind, which would produce the same result, or `is_newer` says their target isn't older than this one's.
+
+        Args:
+            key (hashable): Identifies the repository, i.e. (owner, repo_name)
+            kind (str): The kind of job, i.e. 'initialization' or 'patch'
+            target_sha (str): The commit SHA the job indexes
+            supersedes (iterable): The kinds of jobs this job supersedes
+            is_newer (callable): Called with the token of a running job, returns True if this job's target is newer
+                (i.e. a descendant of its target). Defaults to every job superseding the jobs that started before it.
+
+        Yields:
+            CancellationToken: The token of the job
+        """
+        token = CancellationToken(kind, target_sha)
+
+        with self.__lock:
+            candidates = [other for other in self.__tokens.get(key, []) if other.kind in supersedes
+                          and not (other.kind == kind and other.target_sha == target_sha)]
+
+        # Outside of the lock, finding out which commit is newer may take a request
+        superseded = [other for other in candidates if is_newer is None or is_newer(other)]
+        with self.__lock:
+            tokens = self.__tokens.setdefault(key, [])
+            for other in superseded:
+                # Finished or cancelled in the meantime
+                if other.cancelled or other not in tokens:
+                    continue
+                other.cancel(f"Superseded by a newer {kind} of {target_sha}")
+                self.__cancelled += 1
+                logger.info(f"Cancelled {other.kind} of {key} at {other.target_sha}, superseded by {target_sha}.")
+            tokens.append(token)
+
+        context_token = _current.set(token)
+        try:
+            yield token
+        finally:
+            _current.reset(context_token)
+            with self.__lock:
+                tokens = self.__tokens[key]
+                tokens.remove(token)
+                if not tokens:
+                    del self.__tokens[key]
+
+    def stats(self):
+        """
+        Returns:
+            dict: The number of running indexing jobs and of jobs cancelled so far
+        """
+        with self.__lock:
+            return {'active': sum(len(tokens) for tokens in self.__tokens.values()), 'cancelled': self.__cancelled}
+
+
+def raise_if_cancelled():
+    """
+    Cancellation check point: raises `Cancelled` if the job running in this context was superseded.
+    Does nothing outside of a tracked job.
+    """
+    token = _current.get()
+    if token is not None:
+        token.raise_if_cancelled()
@@ -0,0 +1,276 @@
+import logging
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ReplaceOne, ReturnDocument
+
+from database.database import Database
+from services.metrics import DB_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class InitializationCheckpoint:
+    """
+    Stores the embeddings of a repository initialization in batches, under a manifest on the repository document.
+    If the initialization is interrupted, the next attempt at the same commit resumes from the embeddings already
+    stored instead of encoding every file again.
+
+    The embeddings are written under a new `embeddings_id` recorded in the manifest, apart from the ones reports
+    are ranked against, so the routes stored so far are the ones under that id and the manifest stays small
+    however many files the repository has. Once every file is stored, the repository's `embeddings_id` and `commit_sha` (which is
+    what reports look up) are swapped to the new set in one update and the previous set is deleted, so reports
+    keep ranking the complete previous index until then and never see a partially stored initialization.
+
+    :param repos: The repository collection.
+    :param embeddings: The embeddings collection.
+    :param owner: The repository owner's username.
+    :param repo_name: The repository name.
+    :param target_sha: The commit SHA being indexed.
+    :param batch_size: The number of files written per batch. Defaults to `100`.
+    """
+
+    def __init__(self, repos, embeddings, owner, repo_name, target_sha, batch_size=100):
+        self.repos = repos
+        self.embeddings = embeddings
+        self.owner = owner
+        self.repo_name = repo_name
+        self.target_sha = target_sha
+        self.batch_size = batch_size
+        self.repo_id = None
+        self.embeddings_id = None
+        self.stored_files = 0
+        self.__pending = []
+
+    def begin(self, total_files=None):
+        """
+        Resumes the manifest of an earlier attempt at the same commit, or starts a new one.
+
+        Args:
+            total_files (int): The number of files to index, recorded for progress reporting
+
+        Returns:
+            set: The routes already stored, which don't need to be encoded again
+        """
+        query = {'repo_name': self.repo_name, 'owner': self.owner}
+        repo = self.repos.find_one(query)
+        manifest = (repo or {}).get('manifest')
+
+        # Manifests started before embeddings were staged wrote to the repository's current set, which also holds
+        # the files of the previous commit, so they start over
+        if manifest and manifest.get('target_sha') == self.target_sha and manifest.get('embeddings_id') is not None:
+            self.repo_id = repo['_id']
+            self.embeddings_id = manifest['embeddings_id']
+            with DB_SECONDS.time(operation='read_manifest'):
+                completed_routes = {document['route'] for document in
+                                    self.embeddings.find({'repo_id': self.embeddings_id}, {'route': 1, '_id': 0})}
+            self.stored_files = len(completed_routes)
+            logger.info(f"Resuming initialization of {self.owner}/{self.repo_name} at {self.target_sha}, "
+                        f"{self.stored_files} file(s) already stored.")
+            return completed_routes
+
+        # The staged embeddings of an abandoned attempt at another commit are never swapped in
+        if manifest and manifest.get('embeddings_id') not in (None, Database.get_embeddings_id(repo)):
+            with DB_SECONDS.time(operation='delete_embeddings'):
+                self.embeddings.delete_many({'repo_id': manifest['embeddings_id']})
+
+        self.embeddings_id = ObjectId()
+        repo = self.repos.find_one_and_update(
+            query,
+            {'$set': {
+                'repo_name': self.repo_name,
+                'owner': self.owner,
+                'status': 'indexing',
+                'manifest': {
+                    'target_sha': self.target_sha,
+                    'embeddings_id': self.embeddings_id,
+                    'total_files': total_files,
+                    'started_at': _timestamp()
+                }
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self.repo_id = repo['_id']
+        self.stored_files = 0
+        return set()
+
+    @property
+    def full(self):
+        """
+        Whether `batch_size` files are queued and the batch is due to be written.
+        """
+        return len(self.__pending) >= self.batch_size
+
+    def add(self, route, embedding, terms=None, flush=True):
+        """
+        Queues the embedding of a file, and its term counts for the lexical index if given,
+        writing the batch once `batch_size` files are queued.
+
+        Args:
+            flush (bool): Whether to write a full batch right away. Callers that time or throttle the writes
+                pass False and call `flush` themselves once the checkpoint is `full`
+        """
+        document = {
+            'route': route,
+            'embedding': embedding,
+            'last_updated': _timestamp(),
+            'repo_id': self.embeddings_id
+        }
+        if terms is not None:
+            document['terms'] = terms
+        self.__pending.append(document)
+        if flush and self.full:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the queued embeddings in one bulk upsert, then records the time of the write in the manifest.
+        """
+        if not self.__pending:
+            return
+
+        with DB_SECONDS.time(operation='write_embeddings'):
+            self.embeddings.bulk_write([
+                ReplaceOne({'repo_id': self.embeddings_id, 'route': document['route']}, document, upsert=True)
+                for document in self.__pending
+            ], ordered=False)
+
+        with DB_SECONDS.time(operation='write_manifest'):
+            self.repos.update_one({'_id': self.repo_id}, {'$set': {'manifest.updated_at': _timestamp()}})
+        written = len(self.__pending)
+        self.stored_files += written
+        self.__pending = []
+        logger.info(f"Checkpointed {written} file(s) of {self.owner}/{self.repo_name}, {self.stored_files} stored.")
+
+    def complete(self):
+        """
+        Writes the last batch, swaps the new embeddings in and marks the repository ready at the target commit,
+        then deletes the embeddings it replaced.
+        """
+        self.flush()
+
+        with DB_SECONDS.time(operation='complete_initialization'):
+            previous = self.repos.find_one_and_update(
+                {'_id': self.repo_id},
+                {
+                    '$set': {'commit_sha': self.target_sha, 'embeddings_id': self.embeddings_id,
+                             'status': 'ready', 'stored_at': _timestamp()},
+                    '$unset': {'manifest': ''}
+                },
+                return_document=ReturnDocument.BEFORE
+            )
+            previous_id = Database.get_embeddings_id(previous)
+            if previous_id != self.embeddings_id:
+                self.embeddings.delete_many({'repo_id': previous_id})
+        logger.info(f"Initialization of {self.owner}/{self.repo_name} at {self.target_sha} is complete.")
+
+
+class PatchStaging:
+    """
+    Holds the embeddings an incremental update stores before it is complete (i.e. to stay within its memory budget)
+    apart from the ones reports are ranked against, under a staging `embeddings_id` recorded on the repository
+    document. They are copied into the repository's embeddings once the update completes, so reports never rank
+    a mix of old and new files under the old commit SHA, and deleted if it fails or is cancelled. Staged embeddings
+    of an update that crashed are deleted by the next update that stages any.
+
+    :param repos: The repository collection.
+    :param embeddings: The embeddings collection.
+    :param owner: The repository owner's username.
+    :param repo_name: The repository name.
+    :param batch_size: The number of files copied per batch when the update completes. Defaults to `100`.
+    """
+
+    def __init__(self, repos, embeddings, owner, repo_name, batch_size=100):
+        self.repos = repos
+        self.embeddings = embeddings
+        self.owner = owner
+        self.repo_name = repo_name
+        self.batch_size = batch_size
+        self.staging_id = None
+
+    def add(self, clean_files):
+        """
+        Stages the embeddings of preprocessed files, each a dict with 'path', 'embedding_text' and optional 'terms'.
+        """
+        if not clean_files:
+            return
+        if self.staging_id is None:
+            self.__begin()
+
+        documents = []
+        for clean_file in clean_files:
+            document = {
+                'route': clean_file['path'],
+                'embedding': clean_file['embedding_text'],
+                'last_updated': _timestamp(),
+                'repo_id': self.staging_id
+            }
+            if clean_file.get('terms') is not None:
+                document['terms'] = clean_file['terms']
+            documents.append(document)
+
+        with DB_SECONDS.time(operation='write_embeddings'):
+            self.embeddings.bulk_write([
+                ReplaceOne({'repo_id': self.staging_id, 'route': document['route']}, document, upsert=True)
+                for document in documents
+            ], ordered=False)
+
+    def apply(self):
+        """
+        Copies the staged embeddings into the repository's embeddings, then deletes them.
+
+        Returns:
+            bool: Whether anything was staged
+        """
+        if self.staging_id is None:
+            return False
+
+        repo = self.repos.find_one({'repo_name': self.repo_name, 'owner': self.owner})
+        embeddings_id = Database.get_embeddings_id(repo)
+        with DB_SECONDS.time(operation='apply_staged_embeddings'):
+            operations = []
+            for document in self.embeddings.find({'repo_id': self.staging_id}):
+                document.pop('_id', None)
+                document['repo_id'] = embeddings_id
+                operations.append(ReplaceOne({'repo_id': embeddings_id, 'route': document['route']}, document,
+                                             upsert=True))
+                if len(operations) >= self.batch_size:
+                    self.embeddings.bulk_write(operations, ordered=False)
+                    operations = []
+            if operations:
+                self.embeddings.bulk_write(operations, ordered=False)
+        self.discard()
+        return True
+
+    def discard(self):
+        """
+        Deletes the staged embeddings, i.e. when the update failed or was cancelled.
+        """
+        if self.staging_id is None:
+            return
+
+        with DB_SECONDS.time(operation='delete_embeddings'):
+            self.embeddings.delete_many({'repo_id': self.staging_id})
+            self.repos.update_one({'repo_name': self.repo_name, 'owner': self.owner,
+                                   'patch_staging.embeddings_id': self.staging_id},
+                                  {'$unset': {'patch_staging': ''}})
+        self.staging_id = None
+
+    def __begin(self):
+        self.staging_id = ObjectId()
+        previous = self.repos.find_one_and_update(
+            {'repo_name': self.repo_name, 'owner': self.owner},
+            {'$set': {'patch_staging': {'embeddings_id': self.staging_id, 'started_at': _timestamp()}}},
+            return_document=ReturnDocument.BEFORE
+        )
+        # Left over by an update that crashed before applying or discarding its staged embeddings
+        abandoned = ((previous or {}).get('patch_staging') or {}).get('embeddings_id')
+        if abandoned is not None:
+            with DB_SECONDS.time(operation='delete_embeddings'):
+                self.embeddings.delete_many({'repo_id': abandoned})
+        logger.info(f"Staging the embeddings of the update of {self.owner}/{self.repo_name} until it is complete.")
+
+
+def _timestamp():
+    return datetime.utcnow().isoformat() + 'Z'
@@ -0,0 +1,77 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Debouncer:
+    """
+    Collapses bursts of triggers for the same key into a single call. The call fires once no new
+    trigger has arrived for `delay` seconds, with the arguments of the latest trigger. A key that
+    keeps being triggered still fires at most `max_delay` seconds after its first trigger.
+
+    :param func: The function called when a key fires.
+    :param delay: Seconds of quiet before a key fires.
+    :param max_delay: Upper bound on how long a key can be postponed. Defaults to `10 * delay`.
+    """
+
+    def __init__(self, func, delay, max_delay=None):
+        self.func = func
+        self.delay = delay
+        self.max_delay = max_delay if max_delay is not None else 10 * delay
+        self.__lock = threading.Lock()
+        self.__pending = {}
+
+    def trigger(self, key, *args, **kwargs):
+        """
+        Schedules (or postpones) the call for a key.
+
+        Args:
+            key (hashable): Identifies what is being debounced, i.e. (owner, repo_name)
+
+        Returns:
+            int: The number of triggers merged into the pending call so far
+        """
+        with self.__lock:
+            now = time.monotonic()
+            pending = self.__pending.get(key)
+            if pending:
+                pending['timer'].cancel()
+                first_triggered = pending['first_triggered']
+                merged = pending['merged'] + 1
+            else:
+                first_triggered = now
+                merged = 1
+
+            wait = min(self.delay, max(0, first_triggered + self.max_delay - now))
+            timer = threading.Timer(wait, self.__fire, args=(key,))
+            timer.daemon = True
+            self.__pending[key] = {
+                'timer': timer,
+                'first_triggered': first_triggered,
+                'merged': merged,
+                'args': args,
+                'kwargs': kwargs
+            }
+            timer.start()
+
+        return merged
+
+    def pending(self):
+        with self.__lock:
+            return list(self.__pending.keys())
+
+    def __fire(self, key):
+        with self.__lock:
+            pending = self.__pending.get(key)
+            # A newer trigger replaced this timer
+            if not pending or pending['timer'] is not threading.current_thread():
+                return
+            del self.__pending[key]
+
+        logger.info(f"Debounced {pending['merged']} trigger(s) for {key}.")
+        try:
+            self.func(*pending['args'], **pending['kwargs'])
+        except Exception as e:
+            logger.error(f"Debounced call for {key} failed: {e}")
@@ -0,0 +1,117 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+_embedding_cache = None
+_lock = threading.Lock()
+
+
+class EmbeddingCache:
+    """
+    Least recently used cache of source file embeddings keyed by the SHA-256 of the file content.
+    Files encoded by a job that is cancelled or fails are not encoded again by the next job if their
+    content hasn't changed. Embeddings are held as float32 arrays, a quarter of the size of Python floats,
+    next to the term counts of the file for the lexical index.
+
+    Entries are evicted once there are more than `max_entries` of them, or once their estimated size (the
+    embedding arrays and the term counts) exceeds `max_bytes`, since a few large multi-chunk files can take
+    more memory than thousands of small ones.
+
+    :param max_entries: The number of files kept. Defaults to `4096`.
+    :param max_bytes: The estimated size of the kept entries. Defaults to 256 MiB, `None` for no byte budget.
+    """
+
+    def __init__(self, max_entries=4096, max_bytes=256 * 2 ** 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.__lock = threading.Lock()
+        self.__entries = OrderedDict()
+        self.__bytes = 0
+        self.__hits = 0
+        self.__misses = 0
+
+    @staticmethod
+    def content_hash(content):
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def get(self, content_hash):
+        """
+        Gets the embedding of a file content.
+
+        Args:
+            content_hash (str): The `content_hash` of the file content
+
+        Returns:
+            list: The chunk embeddings as returned by `encode_text`, or None if not cached
+        """
+        with self.__lock:
+            entry = self.__entries.get(content_hash)
+            if entry is None:
+                self.__misses += 1
+                return None
+            self.__entries.move_to_end(content_hash)
+            self.__hits += 1
+
+        return [chunk.tolist() for chunk in entry[0]]
+
+    def get_terms(self, content_hash):
+        """
+        Gets the term counts of a file content, without counting as a hit or a miss.
+
+        Returns:
+            dict: The term counts of the file, or None if not cached
+        """
+        with self.__lock:
+            entry = self.__entries.get(content_hash)
+        return None if entry is None else entry[1]
+
+    def put(self, content_hash, embedding, terms=None):
+        if embedding is None or self.max_entries <= 0:
+            return
+
+        chunks = tuple(np.asarray(chunk, dtype=np.float32) for chunk in embedding)
+        size = _entry_bytes(chunks, terms)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        with self.__lock:
+            previous = self.__entries.pop(content_hash, None)
+            if previous is not None:
+                self.__bytes -= previous[2]
+            self.__entries[content_hash] = (chunks, terms, size)
+            self.__bytes += size
+            while len(self.__entries) > self.max_entries or \
+                    (self.max_bytes is not None and self.__bytes > self.max_bytes):
+                self.__bytes -= self.__entries.popitem(last=False)[1][2]
+
+    def stats(self):
+        with self.__lock:
+            return {'entries': len(self.__entries), 'bytes': self.__bytes, 'hits': self.__hits,
+                    'misses': self.__misses}
+
+
+def _entry_bytes(chunks, terms):
+    # The arrays, and roughly a dict slot, a string and an int per term
+    return sum(chunk.nbytes for chunk in chunks) + sum(len(term) + 100 for term in terms or ())
+
+
+def get_embedding_cache():
+    """
+    Gets the process-wide embedding cache, holding up to EMBEDDING_CACHE_SIZE files (defaults to 4096)
+    and EMBEDDING_CACHE_MB of embeddings and term counts (defaults to 256).
+
+    Returns:
+        EmbeddingCache: The shared cache
+    """
+    global _embedding_cache
+
+    if _embedding_cache is None:
+        with _lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache(int(os.environ.get("EMBEDDING_CACHE_SIZE", "4096")),
+                                                  int(float(os.environ.get("EMBEDDING_CACHE_MB", "256")) * 2 ** 20))
+
+    return _embedding_cache
@@ -0,0 +1,78 @@
+import os
+import threading
+
+_bug_localizer = None
+_lock = threading.Lock()
+
+ENCODER_BACKENDS = ('unixcoder', 'hashed', 'sidecar')
+
+
+def get_bug_localizer():
+    """
+    Gets the process-wide BugLocalization instance, loading the model on first use.
+    Loading UniXcoder takes seconds and hundreds of MB, so every pipeline step shares one instance.
+    When INFERENCE_SOCKET is set, encoding is delegated to the inference sidecar listening on that socket
+    and this process never loads the model. ENCODER_BACKEND="hashed" selects the offline HashedEncoder instead
+    (HASHED_ENCODER_DIM dimensions, defaults to 768), for tests and benchmarks that don't need the model.
+
+    Returns:
+        BugLocalization: The shared bug localizer, or a SidecarEncoder or HashedEncoder with the same interface
+    """
+    global _bug_localizer
+
+    if _bug_localizer is None:
+        with _lock:
+            if _bug_localizer is None:
+                _bug_localizer = create_bug_localizer(get_encoder_backend())
+
+    return _bug_localizer
+
+
+def get_encoder_backend():
+    """
+    Gets the backend the shared encoder uses: ENCODER_BACKEND, or 'sidecar' if it is 'unixcoder' (the default)
+    and INFERENCE_SOCKET is set.
+
+    Returns:
+        str: 'unixcoder', 'hashed' or 'sidecar'
+    """
+    backend = os.environ.get("ENCODER_BACKEND", "unixcoder").lower()
+    if backend == 'unixcoder' and os.environ.get("INFERENCE_SOCKET"):
+        return 'sidecar'
+    return backend
+
+
+def create_bug_localizer(backend='unixcoder'):
+    """
+    Creates a new encoder of the given backend, for callers that need one apart from the shared instance
+    (i.e. to compare backends).
+
+    Args:
+        backend (str): 'unixcoder', 'hashed', or 'sidecar' (the inference sidecar at INFERENCE_SOCKET)
+
+    Returns:
+        BugLocalization: A BugLocalization, HashedEncoder or SidecarEncoder
+    """
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend {backend}, expected one of {ENCODER_BACKENDS}")
+
+    if backend == 'hashed':
+        from services.hashed_encoder import HashedEncoder
+        return HashedEncoder(dim=int(os.environ.get("HASHED_ENCODER_DIM", "768")))
+    if backend == 'sidecar':
+        from services.inference_sidecar import SidecarEncoder
+        return SidecarEncoder(os.environ["INFERENCE_SOCKET"])
+
+    from experimental_unixcoder.bug_localization import BugLocalization
+    return BugLocalization(get_model_path())
+
+
+def get_model_path():
+    """
+    Gets where the UniXcoder weights are loaded from: MODEL_PATH, a local directory holding a downloaded copy
+    of the model (so startup doesn't need the Hugging Face Hub), or the Hub id by default.
+
+    Returns:
+        str: The model directory or Hub id
+    """
+    return os.environ.get("MODEL_PATH", "microsoft/unixcoder-base")
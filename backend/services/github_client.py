@@ -0,0 +1,306 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_lock = threading.Lock()
+
+
+class GitHubRateLimitError(Exception):
+    """
+    Raised when the GitHub rate limit resets later than the client is willing to wait.
+    """
+
+    def __init__(self, reset_at):
+        self.reset_at = reset_at
+        super().__init__(f"GitHub rate limit exceeded until {time.strftime('%H:%M:%S', time.localtime(reset_at))}.")
+
+
+class GitHubClient:
+    """
+    Shared GitHub REST API client.
+
+    - Pools connections through one `requests.Session`, authenticated with a token when one is configured.
+    - Sends conditional requests (`If-None-Match`) backed by an on-disk response cache, so unchanged
+      resources come back as 304s that don't count against the rate limit.
+    - Tracks the `X-RateLimit-*` headers and waits for the limit to reset instead of failing, as long as
+      the reset is within `max_rate_limit_wait` seconds.
+    - Streams large downloads (zipballs) to a temporary file instead of holding them in memory.
+
+    :param base_url: The API root. Defaults to `https://api.github.com`.
+    :param token: Token sent as `Authorization: Bearer <token>`. Defaults to anonymous requests.
+    :param cache_dir: Directory of the response cache, created on the first write. `None` disables caching.
+    :param max_rate_limit_wait: The longest wait, in seconds, for a rate limit reset. Defaults to `300`.
+    :param session: The HTTP session to send with. Defaults to a pooled `requests.Session`.
+    """
+
+    def __init__(self, base_url='https://api.github.com', token=None, cache_dir=None, max_rate_limit_wait=300,
+                 session=None):
+        self.base_url = base_url.rstrip('/')
+        self.cache_dir = cache_dir
+        self.max_rate_limit_wait = max_rate_limit_wait
+        self.__session = session or _pooled_session()
+        self.__session.headers.update({'Accept': 'application/vnd.github+json',
+                                       'X-GitHub-Api-Version': '2022-11-28'})
+        if token:
+            self.__session.headers['Authorization'] = f"Bearer {token}"
+        self.__lock = threading.Lock()
+        self.__rate_limit = {'limit': None, 'remaining': None, 'reset': None}
+
+    def compare(self, owner, repo_name, base, head):
+        """
+        Gets the comparison between two commits. Comparisons of two commit SHAs never change, so once
+        cached they are served without a request.
+
+        Returns:
+            dict: The comparison, or None if GitHub did not return one
+        """
+        return self.get_json(f"/repos/{owner}/{repo_name}/compare/{base}...{head}", immutable=True)
+
+    def get_json(self, path, immutable=False):
+        """
+        GETs a JSON resource, revalidating cached copies with their ETag.
+
+        Args:
+            path (str): The resource path, i.e. '/repos/owner/repo'
+            immutable (bool): Serve cached copies without revalidating them
+
+        Returns:
+            The decoded JSON body, or None if the request failed
+        """
+        url = self.base_url + path
+        cached = self.__read_cache(url)
+        if cached and immutable:
+            logger.debug(f"Serving {url} from the response cache.")
+            return cached['body']
+
+        headers = {}
+        if cached and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+
+        response = self.request('GET', url, headers=headers)
+
+        if response.status_code == 304 and cached:
+            logger.debug(f"{url} not modified, serving the cached copy.")
+            return cached['body']
+
+        if response.status_code != 200:
+            logger.error(f"GitHub request to {url} failed with status code {response.status_code}.")
+            return None
+
+        body = response.json()
+        self.__write_cache(url, response.headers.get('ETag'), body)
+        return body
+
+    def download_zipball(self, owner, repo_name, ref):
+        """
+        Downloads the zip archive of a repository at a commit, streaming it to a temporary file.
+
+        Returns:
+            zipfile.ZipFile: The archive, or None if the download failed. Closing it (i.e. with `with`) also closes
+            and removes its temporary file
+        """
+        url = f"{self.base_url}/repos/{owner}/{repo_name}/zipball/{ref}"
+        response = self.request('GET', url, stream=True)
+
+        if response.status_code != 200:
+            logger.error(f"Failed to download zip archive from {url}, status code {response.status_code}.")
+            response.close()
+            return None
+
+        archive_file = tempfile.TemporaryFile()
+        try:
+            with response:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    archive_file.write(chunk)
+            archive_file.seek(0)
+            return _TemporaryZipFile(archive_file)
+        except Exception:
+            archive_file.close()
+            raise
+
+    def rate_limit(self):
+        """
+        Gets the rate limit state reported by the last response.
+
+        Returns:
+            dict: 'limit', 'remaining' and 'reset' (epoch seconds), None until GitHub has reported them
+        """
+        with self.__lock:
+            return dict(self.__rate_limit)
+
+    def request(self, method, url, max_attempts=3, **kwargs):
+        """
+        Sends a request, waiting out the rate limit before sending and retrying when GitHub rejects
+        the request because of it.
+
+        Returns:
+            requests.Response: The response
+        :raises GitHubRateLimitError: If the rate limit resets too far in the future to wait for.
+        """
+        for attempt in range(max_attempts):
+            self.__wait_for_rate_limit()
+
+            response = self.__session.request(method, url, timeout=30, **kwargs)
+            self.__update_rate_limit(response.headers)
+
+            wait = _rate_limited_wait(response)
+            if wait is None or attempt == max_attempts - 1:
+                return response
+
+            if wait > self.max_rate_limit_wait:
+                raise GitHubRateLimitError(time.time() + wait)
+
+            logger.warning(f"GitHub rate limited {url}, retrying in {wait:.1f}s.")
+            response.close()
+            time.sleep(wait)
+
+        return response
+
+    def __wait_for_rate_limit(self):
+        with self.__lock:
+            remaining, reset = self.__rate_limit['remaining'], self.__rate_limit['reset']
+
+        if remaining != 0 or reset is None:
+            return
+
+        wait = reset - time.time()
+        if wait <= 0:
+            return
+        if wait > self.max_rate_limit_wait:
+            raise GitHubRateLimitError(reset)
+
+        logger.warning(f"GitHub rate limit exhausted, waiting {wait:.1f}s for it to reset.")
+        time.sleep(wait)
+
+    def __update_rate_limit(self, headers):
+        if 'X-RateLimit-Remaining' not in headers:
+            return
+
+        with self.__lock:
+            self.__rate_limit = {
+                'limit': int(headers.get('X-RateLimit-Limit', 0)),
+                'remaining': int(headers['X-RateLimit-Remaining']),
+                'reset': int(headers.get('X-RateLimit-Reset', 0)) or None
+            }
+
+    def __cache_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+    def __read_cache(self, url):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self.__cache_path(url), 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def __write_cache(self, url, etag, body):
+        if not self.cache_dir:
+            return
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        path = self.__cache_path(url)
+        temporary_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(temporary_path, 'w', encoding='utf-8') as file:
+                json.dump({'url': url, 'etag': etag, 'body': body}, file)
+            os.replace(temporary_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to cache GitHub response for {url}: {e}")
+
+
+def get_github_client():
+    """
+    Gets the process-wide GitHub client, created on first use from GITHUB_API_URL, GITHUB_TOKEN and GITHUB_CACHE_DIR.
+
+    Returns:
+        GitHubClient: The shared client
+    """
+    global _client
+
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = GitHubClient(base_url=os.environ.get("GITHUB_API_URL", "https://api.github.com"),
+                                       token=os.environ.get("GITHUB_TOKEN"),
+                                       cache_dir=os.environ.get("GITHUB_CACHE_DIR", os.path.join(".cache", "github")))
+
+    return _client
+
+
+class _TemporaryZipFile(zipfile.ZipFile):
+    """
+    Zip archive read from a temporary file, which `ZipFile` doesn't close when it was given a file object.
+    Closing the archive closes the file, which removes it.
+    """
+
+    def __init__(self, file):
+        super().__init__(file)
+        self.__file = file
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.__file.close()
+
+
+def _rate_limited_wait(response):
+    """
+    Gets how long to wait before retrying a rate limited response, or None if it wasn't rate limited.
+    """
+    if response.status_code not in (403, 429):
+        return None
+
+    retry_after = response.headers.get('Retry-After')
+    if retry_after is not None:
+        wait = _parse_retry_after(retry_after)
+        if wait is not None:
+            return wait
+
+    if response.headers.get('X-RateLimit-Remaining') == '0':
+        reset = int(response.headers.get('X-RateLimit-Reset', 0))
+        return max(0, reset - time.time()) + 1
+
+    # GitHub asks to wait at least a minute when it doesn't say how long
+    return 60.0 if retry_after is not None else None
+
+
+def _parse_retry_after(value):
+    """
+    Parses a `Retry-After` header, either a number of seconds or an HTTP date, into seconds to wait.
+    Returns None if it is neither.
+    """
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def _pooled_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
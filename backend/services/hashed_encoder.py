@@ -0,0 +1,72 @@
+import hashlib
+import re
+
+import numpy as np
+
+from services.ranking import rank_files
+
+_TOKEN = re.compile(r"[A-Za-z0-9_]+")
+
+
+class HashedEncoder:
+    """
+    Offline stand-in for `BugLocalization` that needs neither torch nor model weights.
+    Each chunk is encoded as a signed feature-hashing vector of its words, word bigrams and character trigrams,
+    L2-normalized, so texts sharing vocabulary score higher. Encodings are deterministic across processes and
+    machines, which makes the pipeline testable and benchmarkable without the network. The scores mean nothing for
+    localization quality.
+
+    :param dim: The dimension of the vectors. Defaults to `768`, the UniXcoder dimension.
+    :param chunk_size: The number of characters encoded per chunk. Defaults to `500`, like `BugLocalization`.
+    """
+
+    def __init__(self, dim=768, chunk_size=500):
+        self.dim = dim
+        self.chunk_size = chunk_size
+
+    def encode_text(self, text):
+        """
+        Encodes text by splitting it into chunks of `chunk_size` characters.
+
+        Args:
+            text (str): text to encode
+
+        Returns:
+            list: one [vector] per chunk, like `BugLocalization.encode_text`
+        """
+        return [[self.encode_chunk(text[i:i + self.chunk_size]).tolist()]
+                for i in range(0, len(text), self.chunk_size)]
+
+    def encode_texts(self, texts):
+        """
+        Returns:
+            list: per text, one [vector] per chunk like `encode_text`
+        """
+        return [self.encode_text(text) for text in texts]
+
+    def encode_chunk(self, chunk):
+        """
+        Returns:
+            np.ndarray: the L2-normalized float32 vector of a chunk, zeros if it has no words
+        """
+        words = [word.lower() for word in _TOKEN.findall(chunk)]
+        features = [(word, 1.0) for word in words]
+        features += [(f"{first} {second}", 0.5) for first, second in zip(words, words[1:])]
+        features += [(f"#{word[i:i + 3]}", 0.25) for word in words for i in range(len(word) - 2)]
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in features:
+            digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+            vector[digest % self.dim] += weight if digest >> 63 else -weight
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def rank_files(self, query_embeddings, db_embeddings):
+        """
+        Ranks files by the highest cosine similarity between any query chunk and any file chunk.
+
+        Returns:
+            list: (file_id, max_similarity_score) tuples in descending order of similarity
+        """
+        return rank_files(query_embeddings, db_embeddings)
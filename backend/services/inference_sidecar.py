@@ -0,0 +1,373 @@
+"""
+Local inference sidecar: one long-lived process owns the UniXcoder model and serves encodings to the
+web and ingestion workers over a Unix domain socket, so those workers never import torch or transformers.
+
+Protocol (little-endian):
+
+    request   magic b'LBUG' | op u8 | count u32 | count sequences
+              ENCODE_IDS:  length u32 | length x int32 token ids
+              ENCODE_TEXT: length u32 | length bytes of utf-8 text
+              PING:        no sequences
+    response  status u8 | count u32 | dim u32 | count x dim float32 (L2-normalized)
+              on error, status 1 | length u32 | utf-8 message
+
+Run it with:
+
+    python -m services.inference_sidecar --socket /tmp/ladybug-encoder.sock
+"""
+import argparse
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from services import ranking
+from services.encoder import get_model_path
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'LBUG'
+OP_ENCODE_IDS = 1
+OP_ENCODE_TEXT = 2
+OP_PING = 3
+
+_REQUEST_HEADER = struct.Struct('<4sBI')
+_RESPONSE_HEADER = struct.Struct('<BII')
+_LENGTH = struct.Struct('<I')
+
+
+class SidecarError(Exception):
+    """
+    Raised when the sidecar reports an error or the connection to it fails.
+    """
+
+
+# ======================================================================================================================
+# Client
+# ======================================================================================================================
+
+class SidecarEncoder:
+    """
+    Drop-in replacement for `BugLocalization` that delegates encoding to the inference sidecar.
+    Texts are sent as chunks and tokenized by the sidecar, since tokenizing here would need transformers;
+    callers that already hold token ids can use `encode_ids`.
+
+    :param socket_path: Path of the sidecar's Unix domain socket.
+    :param chunk_size: Characters per chunk, matching `BugLocalization.encode_text`. Defaults to `500`.
+    :param timeout: Seconds to wait for a response. Defaults to `120`.
+    """
+
+    def __init__(self, socket_path, chunk_size=500, timeout=120):
+        self.socket_path = socket_path
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.__local = threading.local()
+
+    def encode_text(self, text):
+        """
+        Encodes long text in roughly 500-character chunks.
+
+        Returns:
+            list: one embedding per chunk, each as [vector] like `BugLocalization.encode_text`
+        """
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        if not chunks:
+            return []
+
+        vectors = self.__call(OP_ENCODE_TEXT, [chunk.encode('utf-8') for chunk in chunks])
+        return [[vector.tolist()] for vector in vectors]
+
+    def encode_texts(self, texts):
+        """
+        Encodes many long texts in one request, so the sidecar can batch the chunks of every text together.
+
+        Returns:
+            list: per text, one embedding per chunk like `encode_text`
+        """
+        chunks = [(index, text[i:i + self.chunk_size])
+                  for index, text in enumerate(texts) for i in range(0, len(text), self.chunk_size)]
+        embeddings = [[] for _ in texts]
+        if not chunks:
+            return embeddings
+
+        vectors = self.__call(OP_ENCODE_TEXT, [chunk.encode('utf-8') for _, chunk in chunks])
+        for (index, _), vector in zip(chunks, vectors):
+            embeddings[index].append([vector.tolist()])
+        return embeddings
+
+    def encode_ids(self, token_ids):
+        """
+        Encodes already tokenized sequences.
+
+        Args:
+            token_ids (list): token id lists, one per sequence
+
+        Returns:
+            np.ndarray: float32 matrix with one normalized embedding per sequence
+        """
+        return self.__call(OP_ENCODE_IDS, [np.asarray(ids, dtype='<i4').tobytes() for ids in token_ids],
+                           lengths=[len(ids) for ids in token_ids])
+
+    def ping(self):
+        self.__call(OP_PING, [])
+        return True
+
+    def rank_files(self, query_embeddings, db_embeddings):
+        return ranking.rank_files(query_embeddings, db_embeddings)
+
+    def __call(self, op, payloads, lengths=None):
+        lengths = lengths if lengths is not None else [len(payload) for payload in payloads]
+        message = bytearray(_REQUEST_HEADER.pack(MAGIC, op, len(payloads)))
+        for length, payload in zip(lengths, payloads):
+            message += _LENGTH.pack(length)
+            message += payload
+
+        # Retry once on a fresh connection, the sidecar may have been restarted
+        for attempt in range(2):
+            connection = self.__connection()
+            try:
+                connection.sendall(message)
+                return _read_response(connection)
+            except (OSError, EOFError) as e:
+                self.__local.connection = None
+                connection.close()
+                if attempt == 1:
+                    raise SidecarError(f"Inference sidecar at {self.socket_path} is unavailable: {e}") from e
+
+    def __connection(self):
+        connection = getattr(self.__local, 'connection', None)
+        if connection is None:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout)
+            try:
+                connection.connect(self.socket_path)
+            except OSError as e:
+                connection.close()
+                raise SidecarError(f"Inference sidecar at {self.socket_path} is unavailable: {e}") from e
+            self.__local.connection = connection
+        return connection
+
+
+def _read_exactly(connection, size):
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = connection.recv(size - len(buffer))
+        if not chunk:
+            raise EOFError("Connection closed")
+        buffer += chunk
+    return bytes(buffer)
+
+
+def _read_response(connection):
+    status, count, dim = _RESPONSE_HEADER.unpack(_read_exactly(connection, _RESPONSE_HEADER.size))
+    if status != 0:
+        (length,) = _LENGTH.unpack(_read_exactly(connection, _LENGTH.size))
+        raise SidecarError(_read_exactly(connection, length).decode('utf-8'))
+
+    data = _read_exactly(connection, count * dim * 4)
+    return np.frombuffer(data, dtype='<f4').reshape(count, dim)
+
+
+# ======================================================================================================================
+# Server
+# ======================================================================================================================
+
+class InferenceServer:
+    """
+    Serves encodings over a Unix domain socket. Sequences from all connections are collected into batches
+    of up to `max_batch_size`, waiting at most `max_batch_wait_ms` for a batch to fill, and each batch is
+    encoded in a single forward pass.
+
+    :param socket_path: Path of the Unix domain socket to listen on.
+    :param encode_batch: Function from a list of token id lists to a (count, dim) float32 matrix.
+    :param tokenize: Function from a list of texts to a list of token id lists.
+    :param max_batch_size: Most sequences per forward pass. Defaults to `32`.
+    :param max_batch_wait_ms: Longest wait for a batch to fill. Defaults to `5`.
+    """
+
+    def __init__(self, socket_path, encode_batch, tokenize, max_batch_size=32, max_batch_wait_ms=5):
+        self.socket_path = socket_path
+        self.encode_batch = encode_batch
+        self.tokenize = tokenize
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait = max_batch_wait_ms / 1000
+        self.__requests = queue.Queue()
+        self.__listener = None
+        self.__running = threading.Event()
+
+    def start(self):
+        """
+        Binds the socket and starts the accept and batching threads.
+        """
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        self.__listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__listener.bind(self.socket_path)
+        self.__listener.listen(64)
+        self.__running.set()
+
+        threading.Thread(target=self.__accept_loop, name='sidecar-accept', daemon=True).start()
+        threading.Thread(target=self.__batch_loop, name='sidecar-batch', daemon=True).start()
+        logger.info(f"Inference sidecar listening on {self.socket_path}.")
+
+    def stop(self):
+        self.__running.clear()
+        if self.__listener:
+            self.__listener.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def __accept_loop(self):
+        while self.__running.is_set():
+            try:
+                connection, _ = self.__listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=self.__serve_connection, args=(connection,), daemon=True).start()
+
+    def __serve_connection(self, connection):
+        with connection:
+            while True:
+                try:
+                    magic, op, count = _REQUEST_HEADER.unpack(_read_exactly(connection, _REQUEST_HEADER.size))
+                except (EOFError, OSError):
+                    return
+
+                try:
+                    if magic != MAGIC:
+                        raise ValueError("Bad request header")
+                    sequences = [self.__read_sequence(connection, op) for _ in range(count)]
+                    vectors = self.__encode(op, sequences)
+                    connection.sendall(_RESPONSE_HEADER.pack(0, *vectors.shape) + vectors.astype('<f4').tobytes())
+                except (EOFError, OSError):
+                    return
+                except Exception as e:
+                    logger.error(f"Inference sidecar request failed: {e}")
+                    error = str(e).encode('utf-8')
+                    connection.sendall(_RESPONSE_HEADER.pack(1, 0, 0) + _LENGTH.pack(len(error)) + error)
+                    if magic != MAGIC:
+                        return
+
+    def __read_sequence(self, connection, op):
+        (length,) = _LENGTH.unpack(_read_exactly(connection, _LENGTH.size))
+        if op == OP_ENCODE_IDS:
+            return np.frombuffer(_read_exactly(connection, length * 4), dtype='<i4').tolist()
+        if op == OP_ENCODE_TEXT:
+            return _read_exactly(connection, length).decode('utf-8')
+        raise ValueError(f"Unknown op {op}")
+
+    def __encode(self, op, sequences):
+        if op == OP_PING or not sequences:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        token_ids = self.tokenize(sequences) if op == OP_ENCODE_TEXT else sequences
+
+        # Hand the sequences to the batching thread and wait for their embeddings
+        done = threading.Event()
+        request = {'token_ids': token_ids, 'done': done, 'result': None, 'error': None}
+        self.__requests.put(request)
+        done.wait()
+        if request['error'] is not None:
+            raise request['error']
+        return request['result']
+
+    def __batch_loop(self):
+        while self.__running.is_set():
+            try:
+                batch = [self.__requests.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+
+            size = len(batch[0]['token_ids'])
+            deadline = time.monotonic() + self.max_batch_wait
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.__requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request['token_ids'])
+
+            self.__run_batch(batch)
+
+    def __run_batch(self, batch):
+        token_ids = [ids for request in batch for ids in request['token_ids']]
+        try:
+            vectors = np.concatenate([self.encode_batch(token_ids[i:i + self.max_batch_size])
+                                      for i in range(0, len(token_ids), self.max_batch_size)])
+        except Exception as e:
+            for request in batch:
+                request['error'] = e
+                request['done'].set()
+            return
+
+        offset = 0
+        for request in batch:
+            count = len(request['token_ids'])
+            request['result'] = vectors[offset:offset + count]
+            offset += count
+            request['done'].set()
+
+
+def unixcoder_backend(model_name="microsoft/unixcoder-base", threads=None):
+    """
+    Builds the (encode_batch, tokenize) pair backed by UniXcoder. Only the sidecar imports torch.
+    """
+    import torch
+    from experimental_unixcoder.unixcoder import UniXcoder
+
+    if threads:
+        torch.set_num_threads(threads)
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = UniXcoder(model_name)
+    model.to(device)
+    model.eval()
+    pad_id = model.config.pad_token_id
+
+    def tokenize(texts):
+        return model.tokenize(texts, mode="<encoder-only>")
+
+    def encode_batch(token_ids):
+        longest = max(len(ids) for ids in token_ids)
+        padded = [ids + [pad_id] * (longest - len(ids)) for ids in token_ids]
+        with torch.no_grad():
+            _, embeddings = model(torch.tensor(padded, device=device))
+            embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
+        return embeddings.cpu().numpy().astype(np.float32)
+
+    return encode_batch, tokenize
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Ladybug inference sidecar.")
+    parser.add_argument("--socket", default=os.environ.get("INFERENCE_SOCKET", "/tmp/ladybug-encoder.sock"))
+    parser.add_argument("--model", default=get_model_path(), help="Hub id or local directory (MODEL_PATH).")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("INFERENCE_THREADS", "0")) or None)
+    parser.add_argument("--max-batch-size", type=int, default=int(os.environ.get("INFERENCE_MAX_BATCH_SIZE", "32")))
+    parser.add_argument("--max-batch-wait-ms", type=float,
+                        default=float(os.environ.get("INFERENCE_MAX_BATCH_WAIT_MS", "5")))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    encode_batch, tokenize = unixcoder_backend(args.model, args.threads)
+    server = InferenceServer(args.socket, encode_batch, tokenize, args.max_batch_size, args.max_batch_wait_ms)
+    server.start()
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
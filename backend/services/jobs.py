@@ -0,0 +1,190 @@
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import requests
+from werkzeug.exceptions import HTTPException
+
+from services.admission import Overloaded
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """
+    Runs long backend work (repository initialization, report processing) on a pool of worker
+    threads so the HTTP request that triggered it can return immediately with a job id.
+
+    Each job function must return a `(body, status_code)` tuple. The job record keeps that body
+    as the job result so it can be polled through the `/jobs/<job_id>` endpoint.
+
+    :param max_workers: Number of worker threads executing jobs. Defaults to `2`.
+    :param max_finished_jobs: How many finished job records are kept for polling. Defaults to `1000`.
+    :param max_queued: How many jobs may wait for a worker before new jobs are rejected. `None` is unbounded.
+    :param retry_after: Retry-After suggested when a job is rejected. Defaults to `30`.
+    :param callback_hosts: The hosts (`host`, or `host:port` for one port) completion callbacks may be posted to.
+        Defaults to none, which rejects every callback URL.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    def __init__(self, max_workers=2, max_finished_jobs=1000, max_queued=None, retry_after=30, callback_hosts=()):
+        self.max_workers = max_workers
+        self.max_finished_jobs = max_finished_jobs
+        self.max_queued = max_queued
+        self.retry_after = retry_after
+        self.callback_hosts = {host.strip().lower() for host in callback_hosts if host.strip()}
+        self.__rejected = 0
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ladybug-job')
+        self.__jobs = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def submit(self, kind, func, *args, callback_url=None, **kwargs):
+        """
+        Enqueues a job for execution on the worker pool.
+
+        Args:
+            kind (str): The kind of job, i.e. 'initialization' or 'report'
+            func (callable): The job function, returning a `(body, status_code)` tuple
+            callback_url (str): Optional URL that receives the job record as JSON once the job finishes,
+                its host must be one of `callback_hosts`
+
+        Returns:
+            str: The id of the enqueued job
+        :raises Overloaded: If `max_queued` jobs are already waiting for a worker.
+        :raises ValueError: If the callback URL isn't allowed.
+        """
+        if callback_url is not None:
+            self.check_callback_url(callback_url)
+
+        job_id = uuid.uuid4().hex
+        job = {
+            'job_id': job_id,
+            'kind': kind,
+            'status': JobQueue.QUEUED,
+            'created_at': _timestamp(),
+            'started_at': None,
+            'finished_at': None,
+            'status_code': None,
+            'result': None,
+            'error': None,
+            'callback_url': callback_url
+        }
+
+        with self.__lock:
+            if self.max_queued is not None:
+                queued = sum(1 for queued_job in self.__jobs.values() if queued_job['status'] == JobQueue.QUEUED)
+                if queued >= self.max_queued:
+                    self.__rejected += 1
+                    logger.warning(f"Rejected {kind} job, {queued} job(s) already queued.")
+                    raise Overloaded('jobs', self.retry_after)
+            self.__jobs[job_id] = job
+            self.__prune_finished_jobs()
+
+        self.__executor.submit(self.__run, job_id, func, args, kwargs)
+        logger.info(f"Enqueued {kind} job {job_id}.")
+        return job_id
+
+    def check_callback_url(self, url):
+        """
+        Validates a completion callback URL. Job results are only posted over http(s) to the allowed hosts,
+        so a request can't make the backend send them to an arbitrary (i.e. internal) address.
+
+        Args:
+            url (str): The callback URL
+
+        :raises ValueError: If the URL isn't allowed.
+        """
+        parts = urlsplit(str(url))
+        if parts.scheme not in ('http', 'https') or not parts.hostname or parts.username is not None:
+            raise ValueError(f"Callback URL must be an http(s) URL without credentials, got {url!r}")
+
+        host = parts.hostname.lower()
+        if host not in self.callback_hosts and f"{host}:{parts.port}" not in self.callback_hosts:
+            raise ValueError(f"Callback host {parts.netloc} is not allowed")
+
+    def get(self, job_id):
+        """
+        Gets a snapshot of a job record.
+
+        Args:
+            job_id (str): The id of the job
+
+        Returns:
+            dict: A copy of the job record, or None if the job is unknown
+        """
+        with self.__lock:
+            job = self.__jobs.get(job_id)
+            return dict(job) if job else None
+
+    def stats(self):
+        """
+        Counts the tracked jobs by status, and the jobs rejected because the queue was full.
+
+        Returns:
+            dict: Mapping of job status (and 'rejected') to the number of jobs
+        """
+        counts = {JobQueue.QUEUED: 0, JobQueue.RUNNING: 0, JobQueue.SUCCEEDED: 0, JobQueue.FAILED: 0}
+        with self.__lock:
+            for job in self.__jobs.values():
+                counts[job['status']] += 1
+            counts['rejected'] = self.__rejected
+        return counts
+
+    def shutdown(self, wait=True):
+        self.__executor.shutdown(wait=wait)
+
+    def __run(self, job_id, func, args, kwargs):
+        self.__update(job_id, status=JobQueue.RUNNING, started_at=_timestamp())
+        logger.info(f"Started job {job_id}.")
+
+        try:
+            body, status_code = func(*args, **kwargs)
+            status = JobQueue.SUCCEEDED if status_code < 400 else JobQueue.FAILED
+            outcome = {'status': status, 'status_code': status_code, 'result': body}
+        except HTTPException as e:
+            # Handlers still use `abort` to report request errors, keep its code and description
+            outcome = {'status': JobQueue.FAILED, 'status_code': e.code, 'error': e.description}
+        except Overloaded as e:
+            logger.warning(f"Job {job_id} was shed: {e}")
+            outcome = {'status': JobQueue.FAILED, 'status_code': 503, 'error': str(e)}
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            outcome = {'status': JobQueue.FAILED, 'status_code': 500, 'error': str(e)}
+
+        job = self.__update(job_id, finished_at=_timestamp(), **outcome)
+        logger.info(f"Finished job {job_id} with status '{job['status']}'.")
+
+        if job['callback_url']:
+            self.__post_callback(job)
+
+    def __update(self, job_id, **fields):
+        with self.__lock:
+            job = self.__jobs[job_id]
+            job.update(fields)
+            return dict(job)
+
+    def __prune_finished_jobs(self):
+        finished = [job_id for job_id, job in self.__jobs.items()
+                    if job['status'] in (JobQueue.SUCCEEDED, JobQueue.FAILED)]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.__jobs[job_id]
+
+    def __post_callback(self, job):
+        try:
+            # Redirects could lead anywhere, only the allowed host is posted to
+            response = requests.post(job['callback_url'], json=job, timeout=10, allow_redirects=False)
+            response.raise_for_status()
+            logger.info(f"Posted completion callback for job {job['job_id']}.")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to post completion callback for job {job['job_id']}: {e}")
+
+
+def _timestamp():
+    return datetime.utcnow().isoformat() + 'Z'
@@ -0,0 +1,159 @@
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+_recent_reports = deque(maxlen=20)
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+def rss_bytes():
+    """
+    Gets the resident set size of the process.
+
+    Returns:
+        int: RSS in bytes, the peak RSS where the current one isn't available
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    """
+    Returns:
+        int: The highest RSS of the process so far in bytes, 0 where it isn't available
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def torch_memory():
+    """
+    Gets the memory held by torch on the GPU, without importing torch if nothing else did.
+
+    Returns:
+        dict: allocated and reserved bytes, or None without torch or a GPU
+    """
+    torch = sys.modules.get('torch')
+    if torch is None or not torch.cuda.is_available():
+        return None
+    return {'allocated_bytes': torch.cuda.memory_allocated(), 'reserved_bytes': torch.cuda.memory_reserved()}
+
+
+def recent_reports():
+    """
+    Returns:
+        list: The memory reports of the last 20 finished jobs, oldest first
+    """
+    return list(_recent_reports)
+
+
+class MemoryTracker:
+    """
+    Accounts for the memory of an indexing job at its stage boundaries: RSS and its growth since the job started,
+    GPU memory held by torch and, when `trace_top` is set, the top allocating source lines from tracemalloc.
+
+    With a budget, `under_pressure` tells the pipeline to hold less in memory (smaller batches, streaming) once the
+    job's RSS growth passes `pressure_threshold` of it. RSS is process-wide, so concurrent jobs see each other's
+    allocations; the growth is an upper bound of what the job holds.
+
+    :param job: The job name, i.e. `'initialization octocat/repo'`.
+    :param budget_bytes: The RSS growth the job may cause. Defaults to no budget (tracking only).
+    :param trace_top: The number of top allocators recorded per stage. Defaults to `0` (tracemalloc off, it slows
+        allocations down).
+    :param pressure_threshold: The fraction of the budget at which the job is under pressure. Defaults to `0.8`.
+    """
+
+    def __init__(self, job, budget_bytes=None, trace_top=0, pressure_threshold=0.8):
+        self.job = job
+        self.budget_bytes = budget_bytes
+        self.trace_top = trace_top
+        self.pressure_threshold = pressure_threshold
+        self.stages = []
+        self.peak_used_bytes = 0
+        self.__traced = False
+        self.__baseline = rss_bytes()
+
+    def __enter__(self):
+        global _tracing_users
+
+        if self.trace_top > 0:
+            with _tracing_lock:
+                if _tracing_users == 0:
+                    tracemalloc.start()
+                _tracing_users += 1
+                self.__traced = True
+        return self
+
+    def __exit__(self, *exc_info):
+        global _tracing_users
+
+        self.checkpoint('end')
+        if self.__traced:
+            with _tracing_lock:
+                _tracing_users -= 1
+                if _tracing_users == 0:
+                    tracemalloc.stop()
+            self.__traced = False
+        _recent_reports.append(self.report())
+        logger.info(f"Memory of {self.job}: peak growth {self.peak_used_bytes / 2 ** 20:.1f} MiB")
+
+    def used_bytes(self):
+        """
+        Returns:
+            int: The RSS growth since the job started
+        """
+        used = max(rss_bytes() - self.__baseline, 0)
+        self.peak_used_bytes = max(self.peak_used_bytes, used)
+        return used
+
+    def under_pressure(self):
+        """
+        Returns:
+            bool: True if the job has a budget and its RSS growth passed the pressure threshold of it
+        """
+        return bool(self.budget_bytes) and self.used_bytes() >= self.budget_bytes * self.pressure_threshold
+
+    def checkpoint(self, stage):
+        """
+        Records the memory at the end of a stage.
+
+        Returns:
+            dict: The stage record
+        """
+        record = {'stage': stage, 'rss_bytes': rss_bytes(), 'used_bytes': self.used_bytes()}
+        gpu = torch_memory()
+        if gpu:
+            record['torch'] = gpu
+        if self.__traced:
+            statistics = tracemalloc.take_snapshot().statistics('lineno')[:self.trace_top]
+            record['top_allocators'] = [{'location': str(statistic.traceback[0]), 'size_bytes': statistic.size}
+                                        for statistic in statistics]
+
+        if self.budget_bytes and record['used_bytes'] > self.budget_bytes:
+            logger.warning(f"{self.job} is over its memory budget after {stage}: "
+                           f"{record['used_bytes'] / 2 ** 20:.1f} of {self.budget_bytes / 2 ** 20:.1f} MiB")
+        self.stages.append(record)
+        return record
+
+    def report(self):
+        """
+        Returns:
+            dict: The job, its budget, its peak RSS growth and the stage records
+        """
+        return {'job': self.job, 'budget_bytes': self.budget_bytes, 'peak_used_bytes': self.peak_used_bytes,
+                'stages': list(self.stages)}
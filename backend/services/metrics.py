@@ -0,0 +1,440 @@
+"""
+Pipeline metrics in the Prometheus text exposition format, served by `GET /metrics`.
+
+Metrics that have a `repo_size` label take it from the repository size scope of the caller
+(see `repo_size_scope`) when it isn't passed explicitly, so code deep in the pipeline doesn't need to know
+which repository it is working on.
+
+Each process records its own metrics. Under the pre-fork launcher the registry is shared through a directory
+(see `MetricsRegistry.share`): every worker writes its metrics there, and whichever worker serves `/metrics`
+adds up the counters and histograms of all of them.
+"""
+import contextvars
+import functools
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+REPO_SIZE_BUCKETS = ((100, '0-99'), (1000, '100-999'), (10000, '1000-9999'))
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+_repo_size = contextvars.ContextVar('ladybug_repo_size', default='unknown')
+_repo_sizes = {}
+_repo_sizes_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels):
+        if 'repo_size' in self.labelnames and 'repo_size' not in labels:
+            labels = {**labels, 'repo_size': _repo_size.get()}
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self, values=None):
+        """
+        Args:
+            values: The values to render (see `_merge`), defaults to the ones of this process
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples(self._values() if values is None else values))
+        return lines
+
+    def _values(self):
+        raise NotImplementedError
+
+    def _snapshot(self):
+        """
+        Returns the values of this process in a JSON serializable form.
+        """
+        raise NotImplementedError
+
+    def _merge(self, snapshots):
+        """
+        Combines the snapshots of several processes (by process id) into values to render.
+        """
+        raise NotImplementedError
+
+    def _reset(self):
+        pass
+
+    def _samples(self, values):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    A count that only goes up, i.e. chunks encoded.
+    """
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.__values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self.__values[key] = self.__values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self.__values.get(self._label_values(labels), 0)
+
+    def _values(self):
+        with self._lock:
+            return dict(self.__values)
+
+    def _snapshot(self):
+        return [[list(key), value] for key, value in self._values().items()]
+
+    def _merge(self, snapshots):
+        values = {}
+        for snapshot in snapshots.values():
+            for key, value in snapshot:
+                values[tuple(key)] = values.get(tuple(key), 0) + value
+        return values
+
+    def _reset(self):
+        with self._lock:
+            self.__values = {}
+
+    def _samples(self, values):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values (i.e. durations in seconds) over cumulative buckets.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.__values = {}
+
+    def observe(self, value, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            counts, total = self.__values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self.__values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observes the duration of the enclosed block in seconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            counts, _ = self.__values.get(self._label_values(labels), ([0], 0.0))
+            return sum(counts)
+
+    def _values(self):
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self.__values.items()}
+
+    def _snapshot(self):
+        return [[list(key), counts, total] for key, (counts, total) in self._values().items()]
+
+    def _merge(self, snapshots):
+        values = {}
+        for snapshot in snapshots.values():
+            for key, counts, total in snapshot:
+                # Written by a process with other buckets (i.e. before an upgrade)
+                if len(counts) != len(self.buckets):
+                    continue
+                merged_counts, merged_total = values.get(tuple(key), ([0] * len(self.buckets), 0.0))
+                values[tuple(key)] = ([a + b for a, b in zip(merged_counts, counts)], merged_total + total)
+        return values
+
+    def _reset(self):
+        with self._lock:
+            self.__values = {}
+
+    def _samples(self, values):
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    A value read when the metrics are collected, i.e. the notifier queue depth.
+    Gauges describe a single process, so when the registry is shared they are rendered per live worker
+    with a `worker` label (the process id) instead of being added up.
+    """
+    type = 'gauge'
+
+    def __init__(self, name, documentation, func):
+        super().__init__(name, documentation)
+        self.func = func
+
+    def _values(self):
+        return {(): self.func()}
+
+    def _snapshot(self):
+        return self.func()
+
+    def _merge(self, snapshots):
+        return {(str(pid),): value for pid, value in snapshots.items()}
+
+    def _samples(self, values):
+        labelnames = ('worker',) if any(values) else ()
+        return [f"{self.name}{_format_labels(labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class MetricsRegistry:
+    """
+    The set of metrics rendered by `/metrics`.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__metrics = {}
+        self.__directory = None
+        self.__write_lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.__register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.__register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, func):
+        return self.__register(Gauge(name, documentation, func), replace=True)
+
+    def render(self):
+        """
+        Returns:
+            str: Every metric in the Prometheus text exposition format, of every process sharing the registry
+        """
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+
+        snapshots = self.__read_snapshots() if self.__directory else None
+        lines = []
+        for metric in metrics:
+            if snapshots is None:
+                lines.extend(metric.render())
+                continue
+            metric_snapshots = {pid: snapshot[metric.name] for pid, snapshot in snapshots.items()
+                                if metric.name in snapshot}
+            lines.extend(metric.render(metric._merge(metric_snapshots)))
+        return '\n'.join(lines) + '\n'
+
+    def share(self, directory):
+        """
+        Shares the registry between processes through `directory`, removing what earlier runs left there.
+        Call it in the parent before forking the workers.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            os.remove(path)
+        self.__directory = directory
+
+    def write(self, gauges=True):
+        """
+        Writes the metrics of this process to the shared directory (if any), replacing its previous write.
+
+        Args:
+            gauges (bool): Whether to include the gauges, which only make sense for a process serving requests
+        """
+        if not self.__directory:
+            return
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+        snapshot = {metric.name: metric._snapshot() for metric in metrics if gauges or metric.type != 'gauge'}
+
+        path = self.__path(os.getpid())
+        with self.__write_lock:
+            with open(path + '.tmp', 'w', encoding='utf-8') as file:
+                json.dump(snapshot, file)
+            os.replace(path + '.tmp', path)
+
+    def start_writing(self, interval=5.0):
+        """
+        Writes the metrics of this process to the shared directory every `interval` seconds from a daemon thread,
+        so workers that don't serve `/metrics` are still collected. Call it in each worker.
+        """
+        if not self.__directory:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write()
+                except Exception as e:
+                    logger.warning(f"Failed to write metrics: {e}")
+
+        threading.Thread(target=run, name='metrics-writer', daemon=True).start()
+
+    def reset(self):
+        """
+        Clears the values recorded so far, i.e. the ones a forked worker inherited from the parent
+        (which wrote them to the shared directory itself).
+        """
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+        for metric in metrics:
+            metric._reset()
+
+    def mark_process_dead(self, pid):
+        """
+        Drops the gauges of a worker that exited. Its counters and histograms keep counting towards the totals,
+        so they don't go down when a worker is replaced.
+        """
+        path = self.__path(pid)
+        try:
+            with open(path, encoding='utf-8') as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError):
+            return
+        with self.__lock:
+            gauges = {name for name, metric in self.__metrics.items() if metric.type == 'gauge'}
+        with open(path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump({name: value for name, value in snapshot.items() if name not in gauges}, file)
+        os.replace(path + '.tmp', path)
+
+    def __path(self, pid):
+        return os.path.join(self.__directory, f'{pid}.json')
+
+    def __read_snapshots(self):
+        # Include what this process recorded since its last periodic write
+        self.write()
+        snapshots = {}
+        for path in glob.glob(os.path.join(self.__directory, '*.json')):
+            try:
+                with open(path, encoding='utf-8') as file:
+                    snapshots[int(os.path.basename(path)[:-len('.json')])] = json.load(file)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable metrics file {path}: {e}")
+        return snapshots
+
+    def __register(self, metric, replace=False):
+        with self.__lock:
+            if metric.name in self.__metrics and not replace:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self.__metrics[metric.name] = metric
+        return metric
+
+
+def repo_size_bucket(file_count):
+    """
+    Buckets a repository by its number of source files, i.e. '100-999'.
+    """
+    if file_count is None:
+        return 'unknown'
+    for upper, bucket in REPO_SIZE_BUCKETS:
+        if file_count < upper:
+            return bucket
+    return '10000+'
+
+
+def record_repo_size(owner, repo_name, file_count):
+    """
+    Remembers the number of files of a repository, so later pipeline runs are labeled with its size bucket.
+    """
+    with _repo_sizes_lock:
+        _repo_sizes[(owner, repo_name)] = file_count
+    _repo_size.set(repo_size_bucket(file_count))
+
+
+@contextmanager
+def repo_size_scope(owner, repo_name):
+    """
+    Labels the metrics recorded in the block with the size bucket of a repository (as far as it is known).
+    """
+    with _repo_sizes_lock:
+        file_count = _repo_sizes.get((owner, repo_name))
+    token = _repo_size.set(repo_size_bucket(file_count))
+    try:
+        yield
+    finally:
+        _repo_size.reset(token)
+
+
+def labeled_by_repo_size(func):
+    """
+    Decorates a route handler so the metrics it records are labeled with the size bucket of its `repo_info`
+    (first argument).
+    """
+    @functools.wraps(func)
+    def wrapper(repo_info, *args, **kwargs):
+        with repo_size_scope(repo_info.get('owner'), repo_info.get('repo_name')):
+            return func(repo_info, *args, **kwargs)
+    return wrapper
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'ladybug_stage_seconds', "Time spent in each stage of a pipeline.", ('pipeline', 'stage', 'repo_size'))
+PREPROCESS_STEP_SECONDS = REGISTRY.histogram(
+    'ladybug_preprocess_step_seconds', "Time spent in each step of preprocessing one text.", ('step', 'repo_size'))
+ENCODE_SECONDS = REGISTRY.histogram(
+    'ladybug_encode_seconds', "Time to encode one text.", ('repo_size',))
+ENCODE_BATCH_CHUNKS = REGISTRY.histogram(
+    'ladybug_encode_batch_chunks', "Number of chunks encoded per text.", ('repo_size',),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+ENCODED_CHUNKS = REGISTRY.counter(
+    'ladybug_encoded_chunks_total', "Chunks encoded by the model.", ('repo_size',))
+DB_SECONDS = REGISTRY.histogram(
+    'ladybug_db_seconds', "Time spent in database operations.", ('operation', 'repo_size'))
+NOTIFIER_LAG_SECONDS = REGISTRY.histogram(
+    'ladybug_notifier_lag_seconds', "Time from queueing a progress message to delivering it to Probot.")
@@ -0,0 +1,200 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from services.metrics import NOTIFIER_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class ProbotNotifier:
+    """
+    Delivers progress messages to the Probot /post-message endpoint from a small pool of worker threads.
+
+    Every message for an (owner, repo, comment_id) target replaces the comment body, so queued messages
+    for the same target are coalesced and only the latest one is sent. Each target is rate limited on
+    its own, so a busy repository never delays the progress of another one. Failed deliveries are
+    retried with exponential backoff unless a newer message for the target supersedes them.
+
+    :param url: The Probot /post-message endpoint.
+    :param workers: Number of delivery threads. Defaults to `4`.
+    :param min_interval: Minimum number of seconds between two messages to the same target. Defaults to `2`.
+    :param max_retries: Retries for a failed delivery. Defaults to `3`.
+    :param backoff: Seconds before the first retry, doubled on every retry. Defaults to `0.5`.
+    :param session: The HTTP session to send with. Defaults to a pooled `requests.Session`.
+    """
+
+    def __init__(self, url, workers=4, min_interval=2.0, max_retries=3, backoff=0.5, session=None):
+        self.url = url
+        self.workers = workers
+        self.min_interval = min_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.__session = session or _pooled_session(workers)
+        self.__condition = threading.Condition()
+        self.__pending = OrderedDict()
+        self.__sending = set()
+        self.__next_allowed = {}
+        self.__threads = []
+        self.__stats = {'sent': 0, 'failed': 0, 'coalesced': 0, 'retried': 0, 'last_lag_seconds': 0.0,
+                        'max_lag_seconds': 0.0}
+
+        # Threads don't survive a fork, pre-forked server workers get their own fresh delivery threads
+        os.register_at_fork(after_in_child=self.__reset_after_fork)
+
+    def start(self):
+        """
+        Starts the delivery threads, once.
+        """
+        with self.__condition:
+            if self.__threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self.__worker, name=f'ladybug-notifier-{i}', daemon=True)
+                self.__threads.append(thread)
+                thread.start()
+
+    def notify(self, owner, repo, comment_id, message):
+        """
+        Enqueues a message, replacing any message still queued for the same target.
+
+        Args:
+            owner (str): The GitHub username or organization name that owns the repository
+            repo (str): The name of the repository
+            comment_id (int): The id of the comment to update
+            message (str): The message to post as the comment body
+        """
+        if not (owner and repo and comment_id and message):
+            return
+
+        key = (owner, repo, comment_id)
+        with self.__condition:
+            pending = self.__pending.get(key)
+            if pending:
+                # Keep the original enqueue time so lag reflects how long the target has been waiting
+                pending['message'] = message
+                self.__stats['coalesced'] += 1
+            else:
+                self.__pending[key] = {'message': message, 'enqueued_at': time.monotonic()}
+            self.__condition.notify_all()
+
+    def stats(self):
+        """
+        Gets the delivery statistics.
+
+        Returns:
+            dict: Queue depth, the age of the oldest queued message and delivery counters
+        """
+        with self.__condition:
+            now = time.monotonic()
+            oldest = min((pending['enqueued_at'] for pending in self.__pending.values()), default=now)
+            return dict(self.__stats, queue_depth=len(self.__pending), in_flight=len(self.__sending),
+                        oldest_lag_seconds=round(now - oldest, 3))
+
+    def flush(self, timeout=None):
+        """
+        Waits until every queued message has been delivered (or dropped).
+
+        Returns:
+            bool: False if the timeout expired first
+        """
+        with self.__condition:
+            return self.__condition.wait_for(lambda: not self.__pending and not self.__sending, timeout)
+
+    def __reset_after_fork(self):
+        restart = bool(self.__threads)
+        self.__condition = threading.Condition()
+        self.__pending = OrderedDict()
+        self.__sending = set()
+        self.__next_allowed = {}
+        self.__threads = []
+        if restart:
+            self.start()
+
+    def __worker(self):
+        while True:
+            key, pending = self.__next_message()
+            try:
+                self.__deliver(key, pending)
+            except Exception as e:
+                logger.error(f"Error in notifier worker: {e}")
+            finally:
+                with self.__condition:
+                    self.__sending.discard(key)
+                    self.__next_allowed[key] = time.monotonic() + self.min_interval
+                    self.__condition.notify_all()
+
+    def __next_message(self):
+        with self.__condition:
+            while True:
+                now = time.monotonic()
+                wake_at = None
+                for key, pending in self.__pending.items():
+                    if key in self.__sending:
+                        continue
+                    allowed_at = self.__next_allowed.get(key, 0)
+                    if allowed_at <= now:
+                        del self.__pending[key]
+                        self.__sending.add(key)
+                        self.__next_allowed.pop(key, None)
+                        return key, pending
+                    wake_at = allowed_at if wake_at is None else min(wake_at, allowed_at)
+
+                # Forget rate limits that have expired
+                for key in [key for key, allowed_at in self.__next_allowed.items()
+                            if allowed_at <= now and key not in self.__pending]:
+                    del self.__next_allowed[key]
+
+                self.__condition.wait(None if wake_at is None else wake_at - now)
+
+    def __deliver(self, key, pending):
+        owner, repo, comment_id = key
+        payload = {
+            'owner': owner,
+            'repo': repo,
+            'comment_id': comment_id,
+            'message': pending['message']
+        }
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.__session.post(self.url, json=payload, timeout=10)
+                response.raise_for_status()
+                lag = time.monotonic() - pending['enqueued_at']
+                NOTIFIER_LAG_SECONDS.observe(lag)
+                with self.__condition:
+                    self.__stats['sent'] += 1
+                    self.__stats['last_lag_seconds'] = round(lag, 3)
+                    self.__stats['max_lag_seconds'] = round(max(self.__stats['max_lag_seconds'], lag), 3)
+                logger.info(f"Successfully posted message to {owner}/{repo} Issue #{comment_id}: {pending['message']}")
+                return
+            except requests.exceptions.RequestException as e:
+                retryable = not (isinstance(e, requests.exceptions.HTTPError)
+                                 and e.response is not None and e.response.status_code < 500)
+                with self.__condition:
+                    superseded = key in self.__pending
+                if superseded:
+                    logger.info(f"Dropped failed message to {owner}/{repo} Issue #{comment_id}, a newer one is queued.")
+                    return
+                if not retryable or attempt == self.max_retries:
+                    with self.__condition:
+                        self.__stats['failed'] += 1
+                    logger.error(f"Failed to post message to Probot: {e}")
+                    return
+
+                with self.__condition:
+                    self.__stats['retried'] += 1
+                time.sleep(self.backoff * 2 ** attempt)
+
+
+def _pooled_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
@@ -1,13 +1,16 @@
 import re
-from nltk.stem import WordNetLemmatizer
-from nltk.tokenize import wordpunct_tokenize
-from nltk.corpus import wordnet as wn
-from nltk import pos_tag
-from experimental_unixcoder.bug_localization import BugLocalization
+import time
+from functools import lru_cache
+from services.encoder import get_bug_localizer
+from services.scheduler import get_scheduler
+from services.metrics import PREPROCESS_STEP_SECONDS, ENCODE_SECONDS, ENCODE_BATCH_CHUNKS, ENCODED_CHUNKS
+
+# NLTK is imported where it is used, importing it takes a noticeable part of a second
 
 class Preprocessor:
-    def __init__(self):
-        self.bug_localizer = BugLocalization()
+    def __init__(self, bug_localizer=None):
+        # Encodes with the process-wide bug localizer unless another one (i.e. under evaluation) is given
+        self.bug_localizer = bug_localizer or get_bug_localizer()
 
     def camel_case_split(identifier):
         """
@@ -36,6 +39,8 @@ class Preprocessor:
             list: tokens
         """
 
+        from nltk.tokenize import wordpunct_tokenize
+
         tokens = []
 
         # Tokenize the input text
@@ -73,7 +78,9 @@ class Preprocessor:
         Returns:
             WordNet tag constant (i.e. wn.NOUN -> 'n')
         """
-        
+        from nltk import pos_tag
+        from nltk.corpus import wordnet as wn
+
         # Get the POS tag from the pos_tag function
         # pos_tag returns a tuple so we index [0][1] to return the tag of a single token
         tag = pos_tag([token])[0][1]
@@ -100,14 +107,30 @@ class Preprocessor:
         Returns:
             tokens (list of strings): lemmatized tokens
         '''
+        from nltk.stem import WordNetLemmatizer
+
         lemmatizer = WordNetLemmatizer()
 
         # Call the get_pos_tag function to assign the correct POS tag to each token in tokens
         return [lemmatizer.lemmatize(token, Preprocessor.get_pos_tag(token)) for token in tokens]        
     
-    def preprocess_text(self, text, stop_words_path):
+    @lru_cache(maxsize=8)
+    def load_stop_words(stop_words_path):
         """
-        Preprocesses input text by
+        Reads a stop words file, cached so the file is only read once per process
+
+        Args:
+            stop_words_path (string): path to a stop words file
+
+        Returns:
+            frozenset: stop words
+        """
+        with open(stop_words_path) as f:
+            return frozenset(f.read().splitlines())
+
+    def preprocess_tokens(self, text, stop_words_path):
+        """
+        Normalizes input text into the tokens that are encoded (and indexed for lexical retrieval) by
             - Removing Numbers
             - Removing special characters
             - Removing punctuation
@@ -120,41 +143,115 @@ class Preprocessor:
             stop_words (string): path to a stop words file
 
         Returns:
-            string: preprocessed text
+            list: lemmatized tokens, None if the stop words file was not found
         """
 
         # Remove all special chars and punctuation from the text
-        text = Preprocessor.remove_special_characters(text)
+        with PREPROCESS_STEP_SECONDS.time(step='clean'):
+            text = Preprocessor.remove_special_characters(text)
 
         # Tokenize the text
-        tokens = Preprocessor.tokenize_text(text)
+        with PREPROCESS_STEP_SECONDS.time(step='tokenize'):
+            tokens = Preprocessor.tokenize_text(text)
 
         try:
             # Read stop words from the input
-            with open(stop_words_path) as f:
-                stop_words = set(f.read().splitlines())
+            stop_words = Preprocessor.load_stop_words(str(stop_words_path))
         except FileNotFoundError:
             print(f"Error: The stop words at '{stop_words_path}' were not found.")
             return
 
         # Remove stop words
-        tokens = [token for token in tokens if token not in stop_words]
+        with PREPROCESS_STEP_SECONDS.time(step='stop_words'):
+            tokens = [token for token in tokens if token not in stop_words]
 
         # Remove cases
         tokens = [token.lower() for token in tokens]
 
         # Lemmatize the tokens. i.e., running -> run
-        tokens = Preprocessor.lemmatize_tokens(tokens)
+        with PREPROCESS_STEP_SECONDS.time(step='lemmatize'):
+            tokens = Preprocessor.lemmatize_tokens(tokens)
         
         # Remove short tokens
-        tokens = [token for token in tokens if len(token) > 2]
+        return [token for token in tokens if len(token) > 2]
+
+    def encode_tokens(self, tokens):
+        """
+        Encodes preprocessed tokens
+
+        Args:
+            tokens (list): tokens as returned by `preprocess_tokens`
+
+        Returns:
+            list: one embedding per chunk of the text
+        """
 
         # Join the tokens into a single string and remove cases
         preprocessed_text = " ".join(tokens)
 
         print(preprocessed_text)
 
-        # Calculate embeddings for preprocessed text
-        preprocessed_text = self.bug_localizer.encode_text(preprocessed_text)
+        # Calculate embeddings for preprocessed text, waiting for the encoder according to the caller's priority
+        with get_scheduler().slot(), ENCODE_SECONDS.time():
+            preprocessed_text = self.bug_localizer.encode_text(preprocessed_text)
+
+        # One embedding per chunk of the text
+        ENCODE_BATCH_CHUNKS.observe(len(preprocessed_text))
+        ENCODED_CHUNKS.inc(len(preprocessed_text))
+
+        return preprocessed_text
+
+    def preprocess_text(self, text, stop_words_path):
+        """
+        Preprocesses input text (see `preprocess_tokens`) and encodes it
+
+        Args:
+            text (string): text to be preprocessed
+            stop_words (string): path to a stop words file
+
+        Returns:
+            string: preprocessed text
+        """
+        tokens = self.preprocess_tokens(text, stop_words_path)
+        if tokens is None:
+            return
+
+        return self.encode_tokens(tokens)
+
+    def preprocess_texts(self, texts, stop_words_path, batch_size=16):
+        """
+        Preprocesses many input texts (see `preprocess_tokens`) and encodes them together, `batch_size` texts
+        per encoder call. The encoder slot is given back between calls, so a large batch doesn't hold off
+        interactive requests
+
+        Args:
+            texts (list of strings): texts to be preprocessed
+            stop_words (string): path to a stop words file
+            batch_size (int): texts encoded per encoder call
+
+        Returns:
+            list: the chunk embeddings of each text, None if the stop words file was not found
+        """
+        token_lists = []
+        for text in texts:
+            tokens = self.preprocess_tokens(text, stop_words_path)
+            if tokens is None:
+                return
+            token_lists.append(tokens)
+
+        embeddings = []
+        for start in range(0, len(token_lists), batch_size):
+            batch = [" ".join(tokens) for tokens in token_lists[start:start + batch_size]]
+            with get_scheduler().slot():
+                encode_start = time.perf_counter()
+                encoded = self.bug_localizer.encode_texts(batch)
+                elapsed = time.perf_counter() - encode_start
+
+            # Recorded per text like `encode_tokens`, the batch's time is shared evenly between its texts
+            for embedding in encoded:
+                ENCODE_SECONDS.observe(elapsed / len(batch))
+                ENCODE_BATCH_CHUNKS.observe(len(embedding))
+                ENCODED_CHUNKS.inc(len(embedding))
+            embeddings += encoded
 
-        return preprocessed_text
\ No newline at end of file
+        return embeddings
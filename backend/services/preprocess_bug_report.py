@@ -4,7 +4,7 @@ from pathlib import Path
 # Main driver method for preprocessing bug reports
 def preprocess_bug_report(bug_report_path: str):
     """
-    Preprocesses bug reports and applies query reformulation (MVP)
+    Preprocesses a bug report file and applies query reformulation (MVP)
 
     Args:
         bug_report_path (str): The path to the bug report
@@ -12,9 +12,6 @@ def preprocess_bug_report(bug_report_path: str):
     Returns:
         String: The preprocessed bug report
     """
-    preprocessor = Preprocessor()
-    stop_words_path = Path(__file__).parent / "../data/stop_words/java-keywords-bugs.txt"
-
     # Put bug report content into a string
     try:
         with open(bug_report_path, "r") as file:
@@ -23,10 +20,44 @@ def preprocess_bug_report(bug_report_path: str):
         print(f"Error: The bug report at '{bug_report_path}' was not found.")
         return 
 
+    return preprocess_bug_report_text(bug_report_string)
+
+def preprocess_bug_report_text(bug_report_string: str):
+    """
+    Preprocesses bug report content held in memory and applies query reformulation (MVP)
+
+    Args:
+        bug_report_string (str): The content of the bug report
+
+    Returns:
+        String: The preprocessed bug report
+    """
+    preprocessor = Preprocessor()
+    stop_words_path = Path(__file__).parent / "../data/stop_words/java-keywords-bugs.txt"
+
     # Run bug report through preprocessor
     preprocessed_bug_report = preprocessor.preprocess_text(bug_report_string, stop_words_path)
 
     # Apply query reformulation (MVP)
 
     # Return preprocessed bug report as a string
-    return preprocessed_bug_report
\ No newline at end of file
+    return preprocessed_bug_report
+
+def preprocess_bug_report_with_tokens(bug_report_string: str):
+    """
+    Preprocesses bug report content held in memory, keeping its tokens for lexical retrieval
+
+    Args:
+        bug_report_string (str): The content of the bug report
+
+    Returns:
+        tuple: The preprocessed bug report and its tokens, (None, None) if preprocessing failed
+    """
+    preprocessor = Preprocessor()
+    stop_words_path = Path(__file__).parent / "../data/stop_words/java-keywords-bugs.txt"
+
+    tokens = preprocessor.preprocess_tokens(bug_report_string, stop_words_path)
+    if tokens is None:
+        return None, None
+
+    return preprocessor.encode_tokens(tokens), tokens
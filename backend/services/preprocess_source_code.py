@@ -1,10 +1,15 @@
 from pathlib import Path
 from services.preprocess import Preprocessor
+from services.cancellation import raise_if_cancelled
+from services.embedding_cache import EmbeddingCache, get_embedding_cache
+from services.bm25 import term_counts
 
 def preprocess_source_code(root):
     """
     Preprocesses all source code files in a source code repository. Assumes all files contained
     in the root directory have had non-.java files filtered out.
+    Files whose content was already encoded (i.e. by a job that was superseded) are served from the embedding cache,
+    and the job stops between files if it was cancelled.
 
     Args:
         root (string): path to the root directory of the source code repository
@@ -13,10 +18,33 @@ def preprocess_source_code(root):
         tuple (list): list of tuples mapping file name to preprocessed contents
     """
 
-    preprocessor = Preprocessor()
-
     preprocessed_files = []
 
+    try:
+        for preprocessed_file in iter_preprocessed_source_code(root):
+            preprocessed_files.append(preprocessed_file)
+    except FileNotFoundError as e:
+        print(f"Error: The source code file at '{e.filename}' was not found.")
+        return
+
+    return preprocessed_files
+
+def iter_preprocessed_source_code(root, skip=(), with_terms=False):
+    """
+    Preprocesses the source code files of a repository one at a time, so callers can store them as they go.
+
+    Args:
+        root (string): path to the root directory of the source code repository
+        skip (set): paths relative to the root (i.e. 'src/Main.java') of files that don't need preprocessing
+        with_terms (bool): also yield the term counts of the preprocessed tokens, for the lexical index
+
+    Yields:
+        tuple: (file path, file name, preprocessed contents), followed by the term counts with `with_terms`
+    """
+
+    preprocessor = Preprocessor()
+    embedding_cache = get_embedding_cache()
+
     stop_words_path = Path(__file__).parent / "../data/stop_words/java-keywords-bugs.txt"
 
     repo = Path(root)
@@ -24,14 +52,27 @@ def preprocess_source_code(root):
     # Traverse the root directory
     for file_path in repo.rglob("*"):
         if file_path.is_file():
-            # Read and preprocess source code file and append it to the output list
-            try: 
-                with open(file_path, "r", encoding="utf-8") as f:
-                    file_content = f.read()
-                    preprocessed_file_content = preprocessor.preprocess_text(file_content, stop_words_path)
-                    preprocessed_files.append((file_path, file_path.name, preprocessed_file_content))
-            except FileNotFoundError:
-                print(f"Error: The source code file at '{file_path}' was not found.")
-                return
-
-    return preprocessed_files
\ No newline at end of file
+            if file_path.relative_to(repo).as_posix() in skip:
+                continue
+
+            # Stop here if a newer indexing job superseded this one
+            raise_if_cancelled()
+
+            # Read and preprocess the source code file, reusing the embedding of identical content
+            with open(file_path, "r", encoding="utf-8") as f:
+                file_content = f.read()
+            content_hash = EmbeddingCache.content_hash(file_content)
+            preprocessed_file_content = embedding_cache.get(content_hash)
+            terms = embedding_cache.get_terms(content_hash)
+            if preprocessed_file_content is None or (with_terms and terms is None):
+                # The tokens are counted for the lexical index on the way, encoding them is the expensive part
+                tokens = preprocessor.preprocess_tokens(file_content, stop_words_path)
+                terms = term_counts(tokens) if tokens is not None else None
+                if preprocessed_file_content is None and tokens is not None:
+                    preprocessed_file_content = preprocessor.encode_tokens(tokens)
+                embedding_cache.put(content_hash, preprocessed_file_content, terms)
+
+            if with_terms:
+                yield file_path, file_path.name, preprocessed_file_content, terms
+            else:
+                yield file_path, file_path.name, preprocessed_file_content
@@ -0,0 +1,210 @@
+import cProfile
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Python frames a thread sits in while it waits for work, not worth a sample
+IDLE_LEAVES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+    ('thread.py', '_worker'),
+}
+
+
+class ProfileRun:
+    """
+    A profiled run, its artifacts are written to `path` when it ends.
+    """
+
+    def __init__(self, name, mode, path):
+        self.name = name
+        self.mode = mode
+        self.path = path
+        self.summary = None
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of every thread (but its own) at a fixed interval, so work handed to executor
+    threads shows up too. Stacks are counted in the collapsed format read by flamegraph.pl and speedscope.
+
+    :param interval: Seconds between two samples. Defaults to `0.005`.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__run, name='ladybug-profiler', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop.set()
+        self.__thread.join()
+
+    def collapsed(self):
+        """
+        Returns:
+            str: One `thread;outer;...;inner count` line per distinct stack, most frequent first
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def __run(self):
+        own_id = threading.get_ident()
+        while not self.__stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = _collapse(frame)
+                if stack:
+                    self.stacks[f"{names.get(thread_id, thread_id)};{stack}"] += 1
+            self.samples += 1
+
+
+def _collapse(frame):
+    leaf = frame.f_code
+    if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_LEAVES:
+        return None
+
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+class RequestProfiler:
+    """
+    Profiles single pipeline runs on demand. Nothing is set up for runs that aren't profiled.
+
+    Every profiled run writes to its own directory under `output_dir`:
+    - `stacks.folded`: sampled stacks of every thread in the collapsed format (`flamegraph.pl stacks.folded`).
+    - `profile.pstats`: in `cprofile` mode, a deterministic profile. Before Python 3.12 it covers the thread running
+      the handler, from 3.12 on (where cProfile is built on `sys.monitoring`) every thread of the process.
+    - `torch_ops.txt`: torch operator timings, when torch is loaded in the process.
+    - `summary.json`: the run name, mode, duration and sample count.
+
+    Only one run at a time can use cProfile and the torch profiler, a second one can't be enabled while another
+    is active. Runs overlapping a run that holds them are only sampled, and their summary says so.
+
+    :param output_dir: The directory profiles are written to. Defaults to `'profiles'`.
+    :param mode: The default mode, `'sampling'` or `'cprofile'`. Defaults to `'sampling'`.
+    :param interval: Seconds between two stack samples. Defaults to `0.005`.
+    :param repos: `owner/repo` (or `owner/*`) names of repositories whose runs are always profiled.
+    :param torch_ops: Record torch operator timings when torch is loaded. Defaults to True.
+    """
+    MODES = ('sampling', 'cprofile')
+
+    def __init__(self, output_dir='profiles', mode='sampling', interval=0.005, repos=(), torch_ops=True):
+        if mode not in RequestProfiler.MODES:
+            raise ValueError(f"Unknown profiling mode {mode}, expected one of {RequestProfiler.MODES}")
+        self.output_dir = output_dir
+        self.mode = mode
+        self.interval = interval
+        self.repos = {repo.strip() for repo in repos if repo.strip()}
+        self.torch_ops = torch_ops
+        self.__exclusive = threading.Lock()
+
+    def is_profiled_repo(self, owner, repo_name):
+        return f"{owner}/{repo_name}" in self.repos or f"{owner}/*" in self.repos
+
+    @contextmanager
+    def profile(self, name, mode=None):
+        """
+        Profiles the enclosed block and writes the artifacts when it ends, even if it raises.
+
+        Args:
+            name (str): The name of the run, part of its directory name
+            mode (str): `'sampling'` or `'cprofile'`, defaults to the profiler's mode
+
+        Yields:
+            ProfileRun: The run, with the directory its artifacts are written to
+        """
+        mode = mode or self.mode
+        if mode not in RequestProfiler.MODES:
+            raise ValueError(f"Unknown profiling mode {mode}, expected one of {RequestProfiler.MODES}")
+
+        directory = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}-" \
+                    f"{uuid.uuid4().hex[:6]}"
+        run = ProfileRun(name, mode, os.path.join(self.output_dir, directory))
+
+        sampler = StackSampler(self.interval)
+        # Only when something else loaded torch, profiling must never be the reason it is imported
+        torch_ops = self.torch_ops and 'torch' in sys.modules
+        wants_exclusive = mode == 'cprofile' or torch_ops
+        exclusive = wants_exclusive and self.__exclusive.acquire(blocking=False)
+        if wants_exclusive and not exclusive:
+            logger.warning(f"Another run holds cProfile and the torch profiler, only sampling {name}.")
+            run.mode = 'sampling'
+        deterministic = cProfile.Profile() if exclusive and mode == 'cprofile' else None
+        torch_profile = self.__torch_profile() if exclusive and torch_ops else nullcontext()
+
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            with torch_profile as torch_profiler:
+                if deterministic:
+                    try:
+                        deterministic.enable()
+                    except ValueError as e:
+                        # Another profiling tool (i.e. a debugger or coverage) is active
+                        logger.warning(f"cProfile is unavailable, only sampling {name}: {e}")
+                        deterministic, run.mode = None, 'sampling'
+                try:
+                    yield run
+                finally:
+                    if deterministic:
+                        deterministic.disable()
+        finally:
+            sampler.stop()
+            if exclusive:
+                self.__exclusive.release()
+            duration = time.perf_counter() - start
+            try:
+                self.__write(run, duration, sampler, deterministic, torch_profiler, requested_mode=mode)
+            except OSError as e:
+                logger.error(f"Failed to write the profile of {name}: {e}")
+
+    def __torch_profile(self):
+        from torch.profiler import profile, ProfilerActivity
+        return profile(activities=[ProfilerActivity.CPU])
+
+    def __write(self, run, duration, sampler, deterministic, torch_profiler, requested_mode):
+        os.makedirs(run.path, exist_ok=True)
+        artifacts = ['stacks.folded']
+        with open(os.path.join(run.path, 'stacks.folded'), 'w') as f:
+            f.write(sampler.collapsed())
+
+        if deterministic:
+            deterministic.dump_stats(os.path.join(run.path, 'profile.pstats'))
+            artifacts.append('profile.pstats')
+
+        if torch_profiler is not None:
+            with open(os.path.join(run.path, 'torch_ops.txt'), 'w') as f:
+                f.write(torch_profiler.key_averages().table(sort_by='self_cpu_time_total', row_limit=50))
+            artifacts.append('torch_ops.txt')
+
+        run.summary = {'name': run.name, 'mode': run.mode, 'requested_mode': requested_mode,
+                       'duration_seconds': round(duration, 3),
+                       'samples': sampler.samples, 'interval_seconds': self.interval, 'artifacts': artifacts}
+        with open(os.path.join(run.path, 'summary.json'), 'w') as f:
+            json.dump(run.summary, f, indent=2)
+        logger.info(f"Wrote the profile of {run.name} to {run.path}")
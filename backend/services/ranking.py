@@ -0,0 +1,98 @@
+import numpy as np
+
+
+def to_matrix(embeddings):
+    """
+    Stacks chunk embeddings into a float32 matrix with one L2-normalized row per chunk.
+
+    Args:
+        embeddings (list): chunk embeddings, each a vector or a [vector] as returned by `encode_text`
+
+    Returns:
+        np.ndarray: matrix of shape (chunks, dim)
+    """
+    if len(embeddings) == 0:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-8)
+
+
+def rank_files(query_embeddings, db_embeddings):
+    """
+    Ranks files based on similarity to the query embeddings, without torch.
+    Scores match `BugLocalization.rank_files`: the highest cosine similarity between any query chunk and any file chunk.
+
+    Args:
+        query_embeddings (list): chunk embeddings of the query (bug report)
+        db_embeddings (list): tuples of (file_id, chunk embeddings)
+
+    Returns:
+        list: (file_id, max_similarity_score) tuples in descending order of similarity
+    """
+    query = to_matrix(query_embeddings)
+    similarities = []
+
+    for file_id, file_embeddings in db_embeddings:
+        file_matrix = to_matrix(file_embeddings)
+        if query.size == 0 or file_matrix.size == 0:
+            similarities.append((file_id, float('-inf')))
+            continue
+
+        similarities.append((file_id, float((query @ file_matrix.T).max())))
+
+    similarities.sort(key=lambda x: x[1], reverse=True)
+    return similarities
+
+
+def rank_files_batch(queries, db_embeddings, top_k=None, max_block_bytes=64 * 2 ** 20):
+    """
+    Ranks files against many queries at once. The chunks of every file are stacked into one matrix once, and the
+    chunks of the queries are multiplied with it in blocks (of at most `max_block_bytes` of similarities), so all
+    queries are scored by a few matrix-matrix products instead of one product per query and file.
+    Scores match `rank_files`.
+
+    Args:
+        queries (list): the chunk embeddings of each query (bug report)
+        db_embeddings (list): tuples of (file_id, chunk embeddings)
+        top_k (int): the number of files kept per query, defaults to every file
+        max_block_bytes (int): the most memory a block of similarities takes
+
+    Returns:
+        list: per query, (file_id, max_similarity_score) tuples in descending order of similarity
+    """
+    file_ids = [file_id for file_id, _ in db_embeddings]
+    file_matrices = [to_matrix(file_embeddings) for _, file_embeddings in db_embeddings]
+    indexed = [i for i, matrix in enumerate(file_matrices) if matrix.size]
+    scores = np.full((len(queries), len(file_ids)), float('-inf'), dtype=np.float32)
+
+    if indexed:
+        files = np.concatenate([file_matrices[i] for i in indexed])
+        file_offsets = np.cumsum([0] + [len(file_matrices[i]) for i in indexed[:-1]])
+        rows_per_block = max(max_block_bytes // (files.shape[0] * files.itemsize), 1)
+
+        block = []
+        for query, matrix in [(q, to_matrix(e)) for q, e in enumerate(queries)] + [(None, None)]:
+            # Flush the block before it outgrows the budget, and once every query is queued
+            if block and (query is None or sum(len(m) for _, m in block) + len(matrix) > rows_per_block):
+                similarities = np.concatenate([m for _, m in block]) @ files.T
+                # Best chunk of each file, then best chunk of each query
+                per_file = np.maximum.reduceat(similarities, file_offsets, axis=1)
+                query_offsets = np.cumsum([0] + [len(m) for _, m in block[:-1]])
+                scores[np.ix_([q for q, _ in block], indexed)] = np.maximum.reduceat(per_file, query_offsets, axis=0)
+                block = []
+            if query is not None and matrix.size:
+                block.append((query, matrix))
+
+    ranked = []
+    for row in scores:
+        order = np.arange(len(file_ids))
+        if top_k is not None and top_k < len(file_ids):
+            # Keep every file tied with the k-th best score, the sort below picks among them like `rank_files`
+            kth_score = -np.partition(-row, top_k - 1)[top_k - 1]
+            order = np.flatnonzero(row >= kth_score)
+        # Ties keep the order of db_embeddings, like the stable sort of `rank_files`
+        order = order[np.lexsort((order, -row[order]))][:top_k]
+        ranked.append([(file_ids[i], float(row[i])) for i in order])
+    return ranked
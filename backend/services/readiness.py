@@ -0,0 +1,42 @@
+import threading
+
+
+class Readiness:
+    """
+    Tracks the components that have to be ready before the process should receive traffic,
+    i.e. the app itself once it is initialized. The process is ready once every required component is.
+    """
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__components = {}
+
+    def require(self, component, detail=None):
+        """
+        Adds a component that has to be ready, in the pending state.
+        """
+        with self.__lock:
+            self.__components[component] = {'status': Readiness.PENDING, 'detail': detail}
+
+    def mark_ready(self, component, detail=None):
+        with self.__lock:
+            self.__components[component] = {'status': Readiness.READY, 'detail': detail}
+
+    def mark_failed(self, component, detail=None):
+        with self.__lock:
+            self.__components[component] = {'status': Readiness.FAILED, 'detail': detail}
+
+    def is_ready(self):
+        with self.__lock:
+            return all(state['status'] == Readiness.READY for state in self.__components.values())
+
+    def as_dict(self):
+        """
+        Returns:
+            dict: Mapping of component to its status and detail
+        """
+        with self.__lock:
+            return {component: dict(state) for component, state in self.__components.items()}
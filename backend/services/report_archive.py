@@ -0,0 +1,70 @@
+import logging
+import os
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# GitHub owner and repository names, which never need a path separator
+NAME_PATTERN = re.compile(r'[A-Za-z0-9_.-]+')
+
+
+class ReportArchive:
+    """
+    Keeps a copy of every bug report on disk for later inspection. Writes happen on a background
+    thread so report processing never waits on the filesystem, and every report gets its own
+    file so concurrent reports (or repositories sharing a name) never overwrite each other.
+
+    :param archive_dir: The root directory of the archive. Defaults to `'reports'`.
+    """
+
+    def __init__(self, archive_dir='reports'):
+        self.archive_dir = archive_dir
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ladybug-archive')
+
+    def archive(self, owner, repo_name, comment_id, issue_content):
+        """
+        Schedules a bug report to be written to `<archive_dir>/<owner>/<repo_name>/<key>.txt`.
+
+        Args:
+            owner (str): The owner of the repository
+            repo_name (str): The name of the repository
+            comment_id (int): The id of the comment tracking the report
+            issue_content (str): The content of the issue
+
+        Returns:
+            str: The path the report is written to
+
+        Raises:
+            ValueError: If the owner or repository name isn't a GitHub name, so the report would be written
+                outside of `<archive_dir>/<owner>/<repo_name>`
+        """
+        for name in (owner, repo_name):
+            if not isinstance(name, str) or not NAME_PATTERN.fullmatch(name) or name in ('.', '..'):
+                raise ValueError(f"Not a GitHub owner or repository name: {name!r}")
+
+        key = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%fZ')}-{comment_id}-{uuid.uuid4().hex[:8]}"
+        report_file_path = os.path.join(self.archive_dir, owner, repo_name, f"{key}.txt")
+        archive_dir = os.path.realpath(self.archive_dir)
+        if os.path.commonpath([archive_dir, os.path.realpath(report_file_path)]) != archive_dir:
+            raise ValueError(f"Report path {report_file_path} is outside of the archive {self.archive_dir}")
+
+        self.__executor.submit(self.__write, report_file_path, issue_content)
+        return report_file_path
+
+    def flush(self):
+        """
+        Waits until every scheduled report has been written.
+        """
+        self.__executor.submit(lambda: None).result()
+
+    def __write(self, report_file_path, issue_content):
+        try:
+            os.makedirs(os.path.dirname(report_file_path), exist_ok=True)
+            with open(report_file_path, 'w', encoding='utf-8') as report_file:
+                report_file.write(issue_content)
+            logger.info(f"Issue archived to {report_file_path}.")
+        except Exception as e:
+            logger.error(f"Failed to archive issue to {report_file_path}: {e}")
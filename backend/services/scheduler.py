@@ -0,0 +1,191 @@
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from services.encoder import get_encoder_backend
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, lower values are served first
+INTERACTIVE = 0
+INCREMENTAL = 1
+BULK = 2
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', INCREMENTAL: 'incremental', BULK: 'bulk'}
+
+_priority = contextvars.ContextVar('ladybug_priority', default=INCREMENTAL)
+_tenant = contextvars.ContextVar('ladybug_tenant', default=None)
+_holding = contextvars.ContextVar('ladybug_holding_slot', default=False)
+
+_scheduler = None
+_lock = threading.Lock()
+
+
+class _Ticket:
+    def __init__(self):
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+
+
+class PriorityScheduler:
+    """
+    Shares the encoder between interactive reports, incremental updates and bulk initializations.
+
+    Callers take a slot around each unit of model work (one file or one query). Free slots go to the highest
+    priority class with waiters, and within a class to tenants (repository owners) in round-robin order, so a
+    single large install can't hold the encoder: long jobs give the slot back after every file and the next
+    one goes to whoever is most entitled to it. The priority class and tenant come from the caller's context,
+    see `context` and `prioritized`.
+
+    :param slots: Number of units of model work that may run at once. Defaults to `1`.
+    """
+
+    def __init__(self, slots=1):
+        self.slots = slots
+        self.__free = slots
+        self.__condition = threading.Condition()
+        self.__waiting = {priority: OrderedDict() for priority in PRIORITY_NAMES}
+        self.__stats = {priority: {'granted': 0, 'total_wait': 0.0, 'max_wait': 0.0} for priority in PRIORITY_NAMES}
+
+    @contextmanager
+    def slot(self):
+        """
+        Holds a slot for the duration of the block, waiting for one according to the caller's priority and tenant.
+        Nested calls in a context that already holds a slot don't take another one.
+        """
+        if _holding.get():
+            yield
+            return
+
+        priority, tenant = _priority.get(), _tenant.get()
+        ticket = _Ticket()
+
+        with self.__condition:
+            self.__waiting[priority].setdefault(tenant, deque()).append(ticket)
+            self.__dispatch()
+            self.__condition.wait_for(lambda: ticket.granted)
+
+            wait = time.monotonic() - ticket.enqueued_at
+            stats = self.__stats[priority]
+            stats['granted'] += 1
+            stats['total_wait'] += wait
+            stats['max_wait'] = max(stats['max_wait'], wait)
+
+        token = _holding.set(True)
+        try:
+            yield
+        finally:
+            _holding.reset(token)
+            with self.__condition:
+                self.__free += 1
+                self.__dispatch()
+
+    def stats(self):
+        """
+        Gets the waiters and wait times of every priority class.
+
+        Returns:
+            dict: Free slots and, per priority class, the number of waiters, slots granted and wait times in ms
+        """
+        with self.__condition:
+            classes = {}
+            for priority, name in PRIORITY_NAMES.items():
+                stats = self.__stats[priority]
+                classes[name] = {
+                    'waiting': sum(len(tickets) for tickets in self.__waiting[priority].values()),
+                    'granted': stats['granted'],
+                    'average_wait_ms': round(stats['total_wait'] / stats['granted'] * 1000, 1)
+                    if stats['granted'] else 0.0,
+                    'max_wait_ms': round(stats['max_wait'] * 1000, 1)
+                }
+            return {'slots': self.slots, 'free': self.__free, 'classes': classes}
+
+    def __dispatch(self):
+        # Called with the condition held: hands free slots to waiters in priority, then round-robin tenant order
+        granted = False
+        while self.__free > 0:
+            tenants = next((self.__waiting[priority] for priority in sorted(self.__waiting)
+                            if self.__waiting[priority]), None)
+            if tenants is None:
+                break
+
+            tenant, tickets = next(iter(tenants.items()))
+            tickets.popleft().granted = True
+            if tickets:
+                tenants.move_to_end(tenant)
+            else:
+                del tenants[tenant]
+
+            self.__free -= 1
+            granted = True
+
+        if granted:
+            self.__condition.notify_all()
+
+
+@contextmanager
+def context(priority, tenant=None):
+    """
+    Runs the block as work of a priority class on behalf of a tenant.
+
+    Args:
+        priority (int): INTERACTIVE, INCREMENTAL or BULK
+        tenant (str): Who the work is for, i.e. the repository owner
+    """
+    priority_token = _priority.set(priority)
+    tenant_token = _tenant.set(tenant)
+    try:
+        yield
+    finally:
+        _tenant.reset(tenant_token)
+        _priority.reset(priority_token)
+
+
+def prioritized(priority):
+    """
+    Decorates a route handler so it runs in a priority class, with the owner of its `repo_info` (first argument)
+    as tenant.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(repo_info, *args, **kwargs):
+            with context(priority, repo_info.get('owner')):
+                return func(repo_info, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_scheduler():
+    """
+    Gets the process-wide scheduler in front of the encoder, with ENCODER_SLOTS slots (see `default_encoder_slots`).
+
+    Returns:
+        PriorityScheduler: The shared scheduler
+    """
+    global _scheduler
+
+    if _scheduler is None:
+        with _lock:
+            if _scheduler is None:
+                _scheduler = PriorityScheduler(slots=int(os.environ.get("ENCODER_SLOTS", default_encoder_slots())))
+
+    return _scheduler
+
+
+def default_encoder_slots():
+    """
+    Gets the number of encoder slots used when ENCODER_SLOTS isn't set. An in-process model runs one forward pass
+    at a time on all its torch threads, so a single slot keeps the queue (and the priority order) in front of it.
+    The inference sidecar batches the sequences of concurrent requests into one forward pass, so with the sidecar
+    as many texts as fit in a batch (INFERENCE_MAX_BATCH_SIZE) are encoded at once.
+
+    Returns:
+        int: The default slot count
+    """
+    if get_encoder_backend() == 'sidecar':
+        return int(os.environ.get("INFERENCE_MAX_BATCH_SIZE", "32"))
+    return 1
@@ -0,0 +1,89 @@
+import threading
+from contextlib import contextmanager
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the function and every
+    caller that arrives while it is running waits for, and shares, that same result (or exception).
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Runs `func` once per in-flight key.
+
+        Args:
+            key (hashable): Identifies the work, i.e. (owner, repo_name, target_sha)
+            func (callable): The work to run if no call for the key is in flight
+
+        Returns:
+            tuple: (result, shared) where shared is True if the result came from another caller's run
+        """
+        with self.__lock:
+            call = self.__calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.__calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+            call.done.set()
+
+        return call.result, False
+
+    def in_flight(self, key):
+        with self.__lock:
+            return key in self.__calls
+
+
+class KeyedLock:
+    """
+    A set of mutexes indexed by key, i.e. one per repository working directory.
+    Locks are created on demand and dropped once nobody holds or waits on them.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__locks = {}
+
+    @contextmanager
+    def hold(self, key):
+        with self.__lock:
+            lock, waiters = self.__locks.get(key, (threading.Lock(), 0))
+            self.__locks[key] = (lock, waiters + 1)
+
+        lock.acquire()
+        try:
+            yield
+        finally:
+            lock.release()
+            with self.__lock:
+                lock, waiters = self.__locks[key]
+                if waiters == 1:
+                    del self.__locks[key]
+                else:
+                    self.__locks[key] = (lock, waiters - 1)
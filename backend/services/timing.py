@@ -0,0 +1,61 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from services.metrics import STAGE_SECONDS
+
+
+class StageTimer:
+    """
+    Records how long each stage of a pipeline takes, in milliseconds.
+    Stages can be timed from several threads at once, i.e. when they run concurrently.
+
+    :param pipeline: When set, every timed stage is also observed in the `ladybug_stage_seconds` histogram
+        with this pipeline label.
+    """
+
+    def __init__(self, pipeline=None):
+        self.pipeline = pipeline
+        self.__lock = threading.Lock()
+        self.__timings = {}
+        self.__start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the enclosed block as the stage `name`. Timing a stage again adds to its total.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def timed(self, name, func):
+        """
+        Wraps a function so every call to it is timed as the stage `name`.
+        """
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def record(self, name, elapsed_ms):
+        with self.__lock:
+            self.__timings[name] = self.__timings.get(name, 0) + elapsed_ms
+        if self.pipeline:
+            STAGE_SECONDS.observe(elapsed_ms / 1000, pipeline=self.pipeline, stage=name)
+
+    def as_dict(self):
+        """
+        Gets the stage timings, with the time elapsed since the timer was created as 'total'.
+
+        Returns:
+            dict: Mapping of stage name to milliseconds, rounded to 0.1 ms
+        """
+        with self.__lock:
+            timings = {name: round(elapsed_ms, 1) for name, elapsed_ms in self.__timings.items()}
+        timings['total'] = round((time.perf_counter() - self.__start) * 1000, 1)
+        return timings
@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WARMUP_TEXT = "NullPointerException when saving the user profile settings in ProfileController"
+
+
+def warm_up_nltk():
+    from services.preprocess import Preprocessor
+
+    # Loads the tokenizer, the perceptron tagger and the WordNet corpus
+    Preprocessor.lemmatize_tokens(Preprocessor.tokenize_text(Preprocessor.remove_special_characters(WARMUP_TEXT)))
+
+
+def warm_up_model():
+    from services.encoder import get_bug_localizer
+
+    get_bug_localizer()
+
+
+def warm_up_encode_and_rank():
+    from services.encoder import get_bug_localizer
+
+    # Runs the first forward pass and ranking, which set up the kernels and thread pools
+    bug_localizer = get_bug_localizer()
+    embedding = bug_localizer.encode_text(WARMUP_TEXT.lower())
+    bug_localizer.rank_files(embedding, [("Warmup.java", embedding)])
+
+
+DEFAULT_STEPS = (
+    ('nltk', warm_up_nltk),
+    ('model', warm_up_model),
+    ('encode_and_rank', warm_up_encode_and_rank),
+)
+
+
+class Warmup:
+    """
+    Loads the resources the first report would otherwise pay for (NLTK corpora, model weights and tokenizer,
+    first-call setup in torch) in a background thread, and holds the process's readiness until it finishes.
+
+    :param readiness: The `Readiness` the warm-up reports to.
+    :param steps: `(name, function)` pairs run in order. Defaults to NLTK, model loading, then a dummy encode and rank.
+    :param component: The readiness component name. Defaults to `'warmup'`.
+    """
+    IDLE = 'idle'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    def __init__(self, readiness, steps=DEFAULT_STEPS, component='warmup'):
+        self.readiness = readiness
+        self.steps = steps
+        self.component = component
+        self.__lock = threading.Lock()
+        self.__done = threading.Event()
+        self.__done.set()
+        self.__state = {'status': Warmup.IDLE, 'timings': {}, 'error': None}
+
+    def start(self, force=False):
+        """
+        Starts the warm-up in the background unless it is running, or has succeeded and `force` isn't set.
+
+        Returns:
+            bool: True if a warm-up was started
+        """
+        with self.__lock:
+            status = self.__state['status']
+            if status == Warmup.RUNNING or (status == Warmup.SUCCEEDED and not force):
+                return False
+            self.__state = {'status': Warmup.RUNNING, 'timings': {}, 'error': None}
+            self.__done.clear()
+
+        self.readiness.require(self.component, "Warming up")
+        threading.Thread(target=self.__run, name='ladybug-warmup', daemon=True).start()
+        return True
+
+    def wait(self, timeout=None):
+        """
+        Waits for the running warm-up to finish.
+
+        Returns:
+            bool: True if the warm-up succeeded
+        """
+        self.__done.wait(timeout)
+        return self.status()['status'] == Warmup.SUCCEEDED
+
+    def status(self):
+        """
+        Returns:
+            dict: The warm-up status, the duration of each finished step in ms and the error if it failed
+        """
+        with self.__lock:
+            return {'status': self.__state['status'], 'timings': dict(self.__state['timings']),
+                    'error': self.__state['error']}
+
+    def __run(self):
+        start = time.perf_counter()
+        try:
+            for name, step in self.steps:
+                step_start = time.perf_counter()
+                step()
+                with self.__lock:
+                    self.__state['timings'][name] = round((time.perf_counter() - step_start) * 1000, 1)
+        except Exception as e:
+            logger.error(f"Warm-up failed: {e}")
+            with self.__lock:
+                self.__state.update(status=Warmup.FAILED, error=str(e))
+            self.readiness.mark_failed(self.component, str(e))
+        else:
+            logger.info(f"Warm-up finished in {time.perf_counter() - start:.1f}s: {self.status()['timings']}")
+            with self.__lock:
+                self.__state['status'] = Warmup.SUCCEEDED
+            self.readiness.mark_ready(self.component)
+        finally:
+            self.__done.set()
@@ -0,0 +1,149 @@
+import threading
+import time
+
+import pytest
+
+from app.api import routes as routes_module
+from services.admission import AdmissionController, Overloaded
+
+
+def hold_slot(admission, stage, entered, release):
+    with admission.slot(stage):
+        entered.set()
+        release.wait()
+
+
+def test_slots_limit_concurrency_and_queue_waiters():
+    admission = AdmissionController({'encode': (1, 1)})
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=hold_slot, args=(admission, 'encode', entered, release))
+    holder.start()
+    entered.wait()
+
+    waiter_entered = threading.Event()
+    waiter = threading.Thread(target=hold_slot, args=(admission, 'encode', waiter_entered, threading.Event()))
+    waiter.daemon = True
+    waiter.start()
+    while admission.stats()['encode']['queued'] == 0:
+        time.sleep(0.01)
+
+    assert not waiter_entered.is_set()
+    assert admission.stats()['encode']['running'] == 1
+
+    release.set()
+    assert waiter_entered.wait(timeout=5)
+    holder.join()
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    admission = AdmissionController({'clone': (1, 0)}, default_retry_after=7)
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=hold_slot, args=(admission, 'clone', entered, release))
+    holder.start()
+    entered.wait()
+
+    with pytest.raises(Overloaded) as rejected:
+        with admission.slot('clone'):
+            pass
+    with pytest.raises(Overloaded):
+        admission.check('clone')
+
+    release.set()
+    holder.join()
+
+    assert rejected.value.stage == 'clone'
+    assert rejected.value.retry_after == 7
+    stats = admission.stats()['clone']
+    assert stats['rejected'] == 2
+    assert stats['admitted'] == 1
+    # Retry-After is estimated from measured stage durations once there are some
+    assert stats['average_seconds'] is not None
+
+
+def test_waiting_too_long_is_rejected():
+    admission = AdmissionController({'store': (1, 4)}, max_wait=0.05)
+    entered, release = threading.Event(), threading.Event()
+    holder = threading.Thread(target=hold_slot, args=(admission, 'store', entered, release))
+    holder.start()
+    entered.wait()
+
+    with pytest.raises(Overloaded):
+        with admission.slot('store'):
+            pass
+
+    release.set()
+    holder.join()
+    assert admission.stats()['store']['timed_out'] == 1
+    assert admission.stats()['store']['queued'] == 0
+
+
+def test_slot_is_released_when_work_fails():
+    admission = AdmissionController({'clone': (1, 0)})
+
+    with pytest.raises(RuntimeError):
+        with admission.slot('clone'):
+            raise RuntimeError("clone failed")
+
+    with admission.slot('clone'):
+        assert admission.stats()['clone']['running'] == 1
+
+
+class FakeCheckpoint:
+    """
+    Stand-in for `InitializationCheckpoint` that stores nothing.
+    """
+    batch_size = 100
+    full = False
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def begin(self, total_files=None):
+        return set()
+
+    def add(self, route, embedding, terms=None, flush=True):
+        pass
+
+    def complete(self):
+        pass
+
+
+def test_patch_finishes_while_an_initialization_is_encoding(monkeypatch):
+    encoding, release = threading.Event(), threading.Event()
+
+    def iter_preprocessed_source_code(repo_dir, skip=(), with_terms=False):
+        if repo_dir.endswith("big-install"):
+            # A long initialization, still encoding its files
+            encoding.set()
+            release.wait(timeout=10)
+        yield f"{repo_dir}/Main.java", "Main.java", [[[1.0]]], {'main': 1}
+
+    monkeypatch.setattr(routes_module, 'admission', AdmissionController({
+        'clone': (2, 8), 'encode': (1, 8), 'store': (4, 16)}, max_wait=1))
+    monkeypatch.setattr(routes_module, 'iter_preprocessed_source_code', iter_preprocessed_source_code)
+    monkeypatch.setattr(routes_module, 'InitializationCheckpoint', FakeCheckpoint)
+    monkeypatch.setattr(routes_module.db, 'get_repo_collection', lambda: None)
+    monkeypatch.setattr(routes_module.db, 'get_embeddings_collection', lambda: None)
+    monkeypatch.setattr(routes_module, 'clone_repo', lambda repo_url, repo_dir: None)
+    monkeypatch.setattr(routes_module, 'filter_files', lambda repo_dir: ["Main.java"])
+    monkeypatch.setattr(routes_module, 'send_update_to_probot', lambda *args: None)
+    patched = []
+    monkeypatch.setattr(routes_module, 'update_embeddings_in_db',
+                        lambda changed_files, clean_files, repo_info, base_sha: patched.extend(clean_files))
+    monkeypatch.setattr(routes_module, 'update_sha', lambda repo_info, base_sha: None)
+
+    install = {'repo_url': "https://github.com/octocat/big-install", 'owner': "octocat", 'repo_name': "big-install",
+               'latest_commit_sha': "abc123"}
+    initialization = threading.Thread(target=routes_module.process_and_store_embeddings, args=(install, 1))
+    initialization.start()
+    assert encoding.wait(timeout=5)
+
+    try:
+        repo_info = {'owner': "hubot", 'repo_name': "repo", 'latest_commit_sha': "def456"}
+        routes_module.process_and_patch_embeddings({}, repo_info, "abc123")
+
+        assert [file['path'] for file in patched] == ["Main.java"]
+        assert initialization.is_alive()
+    finally:
+        release.set()
+        initialization.join(timeout=10)
@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+
+from app.api import routes as routes_module
+from index import create_app
+from services.admission import Overloaded
+from services.batch_localization import encode_bug_reports, localize_bug_reports
+from services.hashed_encoder import HashedEncoder
+from services.preprocess import Preprocessor
+from services.ranking import rank_files, rank_files_batch
+
+
+class LowercasePreprocessor(Preprocessor):
+    """
+    Skips the NLTK steps, so reports are encoded without the NLTK corpora.
+    """
+
+    def preprocess_tokens(self, text, stop_words_path):
+        return text.lower().split()
+
+
+def random_chunks(rng, max_chunks, dim=16):
+    return [[rng.normal(size=dim).tolist()] for _ in range(rng.integers(0, max_chunks))]
+
+
+@pytest.mark.parametrize("max_block_bytes", [2 ** 30, 256])
+def test_batch_ranking_matches_ranking_each_query(max_block_bytes):
+    rng = np.random.default_rng(3)
+    db_embeddings = [(f"File{i}.java", random_chunks(rng, 4)) for i in range(40)]
+    queries = [random_chunks(rng, 3) for _ in range(12)]
+
+    ranked_lists = rank_files_batch(queries, db_embeddings, max_block_bytes=max_block_bytes)
+    top_lists = rank_files_batch(queries, db_embeddings, top_k=5, max_block_bytes=max_block_bytes)
+
+    for query, ranked, top in zip(queries, ranked_lists, top_lists):
+        expected = rank_files(query, db_embeddings)
+        assert [route for route, _ in ranked] == [route for route, _ in expected]
+        assert [score for _, score in ranked] == pytest.approx([score for _, score in expected], abs=1e-5)
+        assert top == ranked[:5]
+    assert rank_files_batch(queries[:2], [], top_k=3) == [[], []]
+
+
+def test_batch_top_k_breaks_ties_like_ranking_each_query():
+    rng = np.random.default_rng(5)
+    # Few distinct files, so many files tie, also across the top_k boundary
+    distinct = [random_chunks(rng, 3) for _ in range(4)]
+    db_embeddings = [(f"File{i}.java", distinct[rng.integers(0, 4)]) for i in range(30)]
+    queries = [random_chunks(rng, 3) for _ in range(20)]
+
+    for top_k in (1, 3, 7):
+        for query, top in zip(queries, rank_files_batch(queries, db_embeddings, top_k=top_k)):
+            assert [route for route, _ in top] == [route for route, _ in rank_files(query, db_embeddings)[:top_k]]
+
+
+def test_bug_reports_are_localized_together():
+    encoder = HashedEncoder()
+    preprocessor = LowercasePreprocessor(encoder)
+    repo_embeddings = [("Cart.java", encoder.encode_text("cart total price checkout")),
+                       ("Profile.java", encoder.encode_text("profile settings save avatar")),
+                       ("Empty.java", [])]
+
+    ranked_lists = localize_bug_reports(["Checkout total is wrong", "Saving profile settings fails"],
+                                        repo_embeddings, top_k=2, preprocessor=preprocessor)
+
+    assert [ranked[0][0] for ranked in ranked_lists] == ["Cart.java", "Profile.java"]
+    assert all(len(ranked) == 2 for ranked in ranked_lists)
+    assert localize_bug_reports([], repo_embeddings) == []
+
+
+REPOSITORY = {'repo_url': "https://github.com/octocat/repo", 'owner': "octocat", 'repo_name': "repo",
+              'default_branch': "main", 'latest_commit_sha': "def456"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    encoder = HashedEncoder()
+    repo_embeddings = [("Cart.java", encoder.encode_text("cart total price checkout")),
+                       ("Profile.java", encoder.encode_text("profile settings save avatar"))]
+    monkeypatch.setattr(routes_module, 'retrieve_stored_sha', lambda owner, repo_name: "abc123")
+    monkeypatch.setattr(routes_module, 'fetch_repo_embeddings', lambda repo_info: repo_embeddings)
+    monkeypatch.setattr(routes_module, 'encode_bug_reports',
+                        lambda reports: encode_bug_reports(reports, LowercasePreprocessor(encoder)))
+    return create_app({'TESTING': True}).test_client()
+
+
+def test_batch_endpoint_ranks_every_issue(monkeypatch, client):
+    updates = []
+    monkeypatch.setattr(routes_module, 'update_repository_index', updates.append)
+
+    response = client.post('/report/batch', json={'repository': REPOSITORY, 'top_k': 1, 'issues': [
+        {'id': 7, 'body': "Checkout total is wrong"}, {'id': 9, 'body': "Saving profile settings fails"}]})
+
+    body = response.get_json()
+    assert response.status_code == 200 and len(updates) == 1
+    assert body['indexed_sha'] == "def456" and not body['stale']
+    assert [(result['id'], result['ranked_files'][0][0]) for result in body['results']] == \
+           [(7, "Cart.java"), (9, "Profile.java")]
+
+
+def test_batch_endpoint_ranks_against_the_stored_sha_when_busy(monkeypatch, client):
+    def overloaded(repo_info):
+        raise Overloaded('encode', 30)
+    monkeypatch.setattr(routes_module, 'update_repository_index', overloaded)
+
+    response = client.post('/report/batch', json={'repository': REPOSITORY, 'issues': [{'id': 1, 'body': "cart"}]})
+
+    assert response.status_code == 200
+    assert response.get_json()['indexed_sha'] == "abc123" and response.get_json()['stale']
+
+
+def test_batch_endpoint_validates_issues(monkeypatch, client):
+    monkeypatch.setenv("REPORT_BATCH_MAX_ISSUES", "2")
+
+    assert client.post('/report/batch', json={'repository': REPOSITORY, 'issues': []}).status_code == 400
+    assert client.post('/report/batch', json={'repository': REPOSITORY, 'issues': [{'id': 1}]}).status_code == 400
+    assert client.post('/report/batch', json={'repository': REPOSITORY, 'top_k': 0,
+                                              'issues': [{'id': 1, 'body': "x"}]}).status_code == 400
+    assert client.post('/report/batch', json={'repository': REPOSITORY, 'issues': [
+        {'id': i, 'body': "x"} for i in range(3)]}).status_code == 400
+
+
+def test_batch_endpoint_holds_the_encode_slot_only_while_encoding(monkeypatch, client):
+    monkeypatch.setattr(routes_module, 'update_repository_index', lambda repo_info: None)
+    encode_slots_while_ranking = []
+
+    def rank_bug_reports(queries, repo_embeddings, top_k):
+        encode_slots_while_ranking.append(routes_module.admission.stats()['encode']['running'])
+        return [[] for _ in queries]
+    monkeypatch.setattr(routes_module, 'rank_bug_reports', rank_bug_reports)
+
+    response = client.post('/report/batch', json={'repository': REPOSITORY, 'issues': [{'id': 1, 'body': "cart"}]})
+
+    assert response.status_code == 200
+    assert encode_slots_while_ranking == [0]
+    assert routes_module.admission.stats()['encode']['admitted'] >= 1
@@ -0,0 +1,39 @@
+from benchmarks.run import compare, run_benchmarks
+from benchmarks.synthetic_repo import generate_repo
+
+
+def test_generated_repository_is_deterministic(tmp_path):
+    routes, sha = generate_repo(tmp_path / "a", files=12, lines_per_file=40, package_depth=4, seed=7)
+    same_routes, same_sha = generate_repo(tmp_path / "b", files=12, lines_per_file=40, package_depth=4, seed=7,
+                                          init_git=False)
+
+    assert routes == same_routes and len(routes) == 12 and sha
+    assert all(route.startswith("src/main/java/com/") and route.count("/") == 3 + 4 for route in routes)
+    for route in routes:
+        content = (tmp_path / "a" / route).read_text()
+        assert content == (tmp_path / "b" / route).read_text()
+        assert 30 <= content.count("\n") <= 60
+
+
+def test_filter_benchmark_reports_timings(tmp_path):
+    parameters = {'files': 10, 'lines': 30, 'depth': 2, 'seed': 0, 'repeat': 2, 'sample': 2}
+
+    results = run_benchmarks(parameters, ['filter_files'])
+
+    result = results['benchmarks']['filter_files']
+    assert result['runs'] == 2 and result['items'] == 10
+    assert result['min_ms'] <= result['median_ms'] <= result['p95_ms']
+    assert results['parameters'] == parameters
+
+
+def test_compare_flags_slowdowns_beyond_the_tolerance():
+    baseline = {'benchmarks': {'rank_files': {'median_ms': 100.0}, 'filter_files': {'median_ms': 10.0},
+                               'encode_text': {'error': "no model"}}}
+    results = {'benchmarks': {'rank_files': {'median_ms': 150.0}, 'filter_files': {'median_ms': 11.0},
+                              'encode_text': {'median_ms': 5.0}}}
+
+    rows = {row['name']: row for row in compare(results, baseline, tolerance=0.25)}
+
+    assert rows['rank_files']['regression'] and rows['rank_files']['change'] == 0.5
+    assert not rows['filter_files']['regression']
+    assert 'encode_text' not in rows
@@ -0,0 +1,98 @@
+import pytest
+
+from services.bm25 import BM25Index, BM25Indexes, hybrid_scores, term_counts
+from services.embedding_cache import EmbeddingCache
+
+
+def make_index():
+    return BM25Index.from_term_counts([
+        ("Cart.java", term_counts("cart total price checkout cart".split())),
+        ("Profile.java", term_counts("profile setting save profile".split())),
+        ("Invoice.java", term_counts("invoice total print".split())),
+        ("Legacy.java", None),
+    ])
+
+
+def test_rare_and_repeated_terms_score_higher():
+    index = make_index()
+
+    ranked = index.top(["checkout", "total", "total"], k=10)
+
+    assert len(index) == 3 and "Legacy.java" not in index and index.missing_terms == 1
+    assert index.file_count == 4
+    assert [route for route, _ in ranked] == ["Cart.java", "Invoice.java"]
+    assert index.score(["unknown"]) == {}
+
+
+def test_incremental_updates_match_a_rebuild():
+    index = make_index()
+    index.add("Cart.java", term_counts("basket discount".split()))
+    index.remove("Invoice.java")
+    index.remove("Missing.java")
+
+    rebuilt = BM25Index.from_term_counts([
+        ("Cart.java", term_counts("basket discount".split())),
+        ("Profile.java", term_counts("profile setting save profile".split())),
+    ])
+
+    for query in (["total"], ["discount", "profile"], ["save", "basket"]):
+        assert index.score(query) == pytest.approx(rebuilt.score(query))
+
+
+def test_indexes_reload_when_the_stored_sha_moved_on():
+    indexes = BM25Indexes()
+    loads = []
+
+    def load():
+        loads.append(1)
+        return [("A.java", {"alpha": 1})]
+
+    first = indexes.get(("octocat", "repo"), "sha1", load)
+    indexes.update(("octocat", "repo"), "sha1", {"B.java": {"beta": 2}}, removed=["A.java"])
+    indexes.advance(("octocat", "repo"), "sha1", "sha2")
+
+    assert indexes.get(("octocat", "repo"), "sha2", load) is first and len(loads) == 1
+    assert "B.java" in first and "A.java" not in first
+
+    indexes.update(("octocat", "repo"), "sha2", {"C.java": None})
+    assert first.missing_terms == 1
+    indexes.update(("octocat", "repo"), "sha2", {"C.java": {"gamma": 1}})
+    assert first.missing_terms == 0 and "C.java" in first
+    assert indexes.get(("octocat", "repo"), "sha3", load) is not first and len(loads) == 2
+    indexes.update(("octocat", "other"), "sha1", {"C.java": {"gamma": 1}})
+    assert indexes.stats() == {'repositories': 1, 'files': 1}
+
+
+def test_update_from_another_base_discards_the_index():
+    indexes = BM25Indexes()
+    key = ("octocat", "repo")
+    first = indexes.get(key, "x", lambda: [("A.java", {"alpha": 1})])
+
+    # Another worker patched the stored index from x to y, this process applies the y to z patch
+    indexes.update(key, "y", {"B.java": {"beta": 1}})
+    indexes.advance(key, "y", "z")
+
+    assert "B.java" not in first and indexes.stats() == {'repositories': 0, 'files': 0}
+    reloaded = indexes.get(key, "z", lambda: [("A.java", {"alpha": 1}), ("B.java", {"beta": 1})])
+    assert reloaded is not first and len(reloaded) == 2
+
+
+def test_hybrid_scores_combine_normalized_bm25_with_similarity():
+    lexical = [("A.java", 8.0), ("B.java", 2.0)]
+    semantic = [("B.java", 0.9), ("A.java", 0.5)]
+
+    combined = hybrid_scores(lexical, semantic, lexical_weight=0.5)
+
+    assert combined == [("A.java", pytest.approx(0.75)), ("B.java", pytest.approx(0.575))]
+    assert [route for route, _ in hybrid_scores(lexical, semantic, lexical_weight=0.0)] == ["B.java", "A.java"]
+
+
+def test_embedding_cache_keeps_term_counts():
+    cache = EmbeddingCache()
+    content_hash = EmbeddingCache.content_hash("class A {}")
+
+    cache.put(content_hash, [[[1.0, 0.0]]], {"alpha": 2})
+
+    assert cache.get(content_hash) == [[[1.0, 0.0]]]
+    assert cache.get_terms(content_hash) == {"alpha": 2}
+    assert cache.get_terms(EmbeddingCache.content_hash("class B {}")) is None
@@ -0,0 +1,98 @@
+import pytest
+
+from services.cancellation import CancellationRegistry, Cancelled, raise_if_cancelled
+from services.embedding_cache import EmbeddingCache
+
+
+def test_newer_job_cancels_superseded_job():
+    registry = CancellationRegistry()
+
+    with registry.track(("octocat", "repo"), 'patch', "aaa", supersedes={'patch'}) as old:
+        with registry.track(("octocat", "repo"), 'patch', "bbb", supersedes={'patch'}) as new:
+            assert old.cancelled and not new.cancelled
+            # Check points only see the job running in their own context
+            raise_if_cancelled()
+
+        with pytest.raises(Cancelled, match="bbb"):
+            raise_if_cancelled()
+
+    assert registry.stats() == {'active': 0, 'cancelled': 1}
+
+
+def test_jobs_are_only_cancelled_by_the_kinds_that_supersede_them():
+    registry = CancellationRegistry()
+
+    with registry.track(("octocat", "repo"), 'initialization', "aaa", supersedes={'initialization', 'patch'}) as init:
+        with registry.track(("octocat", "repo"), 'patch', "bbb", supersedes={'patch'}):
+            assert not init.cancelled
+        with registry.track(("octocat", "other"), 'initialization', "ccc", supersedes={'initialization'}):
+            assert not init.cancelled
+        with registry.track(("octocat", "repo"), 'initialization', "ddd", supersedes={'initialization'}):
+            assert init.cancelled
+
+
+def test_same_target_does_not_cancel_same_kind():
+    registry = CancellationRegistry()
+
+    with registry.track(("octocat", "repo"), 'patch', "aaa", supersedes={'patch'}) as first:
+        with registry.track(("octocat", "repo"), 'patch', "aaa", supersedes={'patch'}):
+            assert not first.cancelled
+
+
+def test_older_target_does_not_cancel_a_newer_job():
+    registry = CancellationRegistry()
+    history = ["aaa", "bbb", "ccc"]
+
+    def newer_than(target_sha):
+        return lambda other: history.index(target_sha) > history.index(other.target_sha)
+
+    with registry.track(("octocat", "repo"), 'patch', "bbb", supersedes={'patch'}, is_newer=newer_than("bbb")) as new:
+        # A delayed push of an older commit
+        with registry.track(("octocat", "repo"), 'patch', "aaa", supersedes={'patch'}, is_newer=newer_than("aaa")):
+            assert not new.cancelled
+        with registry.track(("octocat", "repo"), 'patch', "ccc", supersedes={'patch'}, is_newer=newer_than("ccc")):
+            assert new.cancelled
+
+    assert registry.stats() == {'active': 0, 'cancelled': 1}
+
+
+def test_raise_if_cancelled_outside_of_a_job_does_nothing():
+    raise_if_cancelled()
+
+
+def test_embedding_cache_keeps_recent_content():
+    cache = EmbeddingCache(max_entries=2)
+    first, second, third = (EmbeddingCache.content_hash(text) for text in ("class A {}", "class B {}", "class C {}"))
+
+    cache.put(first, [[[0.5, 0.25]]])
+    cache.put(second, [[[1.0, 0.0]]])
+    assert cache.get(first) == [[[0.5, 0.25]]]
+    cache.put(third, [[[0.0, 1.0]]])
+
+    # The least recently used entry was evicted
+    assert cache.get(second) is None
+    assert cache.get(third) == [[[0.0, 1.0]]]
+    assert cache.stats() == {'entries': 2, 'bytes': 16, 'hits': 2, 'misses': 1}
+
+
+def test_embedding_cache_evicts_to_stay_within_its_byte_budget():
+    cache = EmbeddingCache(max_bytes=3 * 1024 * 4)
+    small, large, huge = (EmbeddingCache.content_hash(text) for text in ("class A {}", "class B {}", "class C {}"))
+
+    cache.put(small, [[[0.0] * 1024]])
+    cache.put(large, [[[0.0] * 1024], [[0.0] * 1024]])
+    cache.put(huge, [[[0.0] * 1024]] * 4)
+    assert cache.get(small) is not None and cache.get(large) is not None and cache.get(huge) is None
+
+    # A new file of one chunk evicts the least recently used one
+    cache.put(small, [[[1.0] * 1024]])
+    cache.put(huge, [[[0.0] * 1024]])
+    assert cache.get(large) is None
+    assert cache.stats()['bytes'] == 2 * 1024 * 4
+
+
+def test_embedding_cache_ignores_failed_encodings():
+    cache = EmbeddingCache()
+    cache.put("hash", None)
+
+    assert cache.get("hash") is None
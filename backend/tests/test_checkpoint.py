@@ -0,0 +1,314 @@
+import copy
+import itertools
+
+import pytest
+from pymongo import ReturnDocument
+
+from app.api import routes as routes_module
+from database.database import Database
+from services.cancellation import Cancelled
+from services.checkpoint import InitializationCheckpoint, PatchStaging
+
+
+class FakeCollection:
+    """
+    In-memory stand-in for the subset of the pymongo collection API used by the checkpoint.
+    """
+    ids = itertools.count(1)
+
+    def __init__(self):
+        self.documents = []
+        self.bulk_writes = 0
+        self.batch_sizes = []
+
+    def matches(self, document, query):
+        for field, expected in query.items():
+            value = document
+            for key in field.split('.'):
+                value = value.get(key) if isinstance(value, dict) else None
+            if value != expected:
+                return False
+        return True
+
+    def find(self, query, projection=None):
+        return [copy.deepcopy(d) for d in self.documents if self.matches(d, query)]
+
+    def find_one(self, query):
+        return next((copy.deepcopy(d) for d in self.documents if self.matches(d, query)), None)
+
+    def find_one_and_update(self, query, update, upsert=False, return_document=ReturnDocument.BEFORE):
+        before = self.find_one(query)
+        self.update_one(query, update, upsert=upsert)
+        return before if return_document == ReturnDocument.BEFORE else self.find_one(query)
+
+    def update_one(self, query, update, upsert=False):
+        document = next((d for d in self.documents if self.matches(d, query)), None)
+        if document is None:
+            if not upsert:
+                return
+            document = {'_id': next(FakeCollection.ids)}
+            self.documents.append(document)
+
+        for path, value in update.get('$set', {}).items():
+            target, key = self.resolve(document, path)
+            target[key] = copy.deepcopy(value)
+        for path in update.get('$unset', {}):
+            target, key = self.resolve(document, path)
+            target.pop(key, None)
+
+    def bulk_write(self, operations, ordered=True):
+        self.bulk_writes += 1
+        self.batch_sizes.append(len(operations))
+        for operation in operations:
+            self.documents = [d for d in self.documents if not self.matches(d, operation._filter)]
+            self.documents.append(copy.deepcopy(operation._doc))
+
+    def delete_many(self, query):
+        self.documents = [d for d in self.documents if not self.matches(d, query)]
+
+    @staticmethod
+    def resolve(document, path):
+        *parents, key = path.split('.')
+        for parent in parents:
+            document = document.setdefault(parent, {})
+        return document, key
+
+
+@pytest.fixture
+def collections():
+    return FakeCollection(), FakeCollection()
+
+
+def ranked_embeddings(collections):
+    repos, embeddings = collections
+    repo = repos.find_one({'owner': "octocat"})
+    return sorted((d['route'], d['embedding']) for d in embeddings.documents
+                  if d['repo_id'] == Database.get_embeddings_id(repo))
+
+
+def make_checkpoint(collections, target_sha="abc123", batch_size=2):
+    repos, embeddings = collections
+    return InitializationCheckpoint(repos, embeddings, "octocat", "repo", target_sha, batch_size=batch_size)
+
+
+def test_embeddings_are_written_in_batches(collections):
+    repos, embeddings = collections
+    checkpoint = make_checkpoint(collections)
+
+    assert checkpoint.begin(total_files=3) == set()
+    for route in ("A.java", "B.java", "C.java"):
+        checkpoint.add(route, [[[1.0]]])
+
+    # One full batch is stored, the repository isn't ready yet
+    assert embeddings.bulk_writes == 1
+    repo = repos.find_one({'owner': "octocat"})
+    assert sorted(d['route'] for d in embeddings.find({'repo_id': repo['manifest']['embeddings_id']})) == \
+           ["A.java", "B.java"]
+    assert 'commit_sha' not in repo and checkpoint.stored_files == 2
+
+    checkpoint.complete()
+
+    repo = repos.find_one({'owner': "octocat"})
+    assert repo['commit_sha'] == "abc123" and repo['status'] == 'ready'
+    assert 'manifest' not in repo
+    assert sorted(d['route'] for d in embeddings.documents) == ["A.java", "B.java", "C.java"]
+
+
+def test_interrupted_initialization_resumes_from_the_manifest(collections):
+    repos, embeddings = collections
+    first_attempt = make_checkpoint(collections)
+    first_attempt.begin()
+    first_attempt.add("A.java", [[[1.0]]])
+    first_attempt.add("B.java", [[[1.0]]])
+    first_attempt.add("C.java", [[[1.0]]])  # Never flushed, lost in the crash
+
+    resumed = make_checkpoint(collections)
+    assert resumed.begin() == {"A.java", "B.java"}
+    resumed.add("C.java", [[[2.0]]])
+    resumed.complete()
+
+    assert repos.find_one({'owner': "octocat"})['commit_sha'] == "abc123"
+    assert len(embeddings.documents) == 3
+
+
+def test_manifest_that_wrote_to_the_current_set_starts_over(collections):
+    repos, embeddings = collections
+    previous = make_checkpoint(collections, target_sha="old")
+    previous.begin()
+    previous.add("Removed.java", [[[1.0]]])
+    previous.complete()
+    # Left by an interrupted initialization started before embeddings were staged
+    repo = repos.find_one({'owner': "octocat"})
+    repos.update_one({'_id': repo['_id']}, {'$set': {'manifest': {'target_sha': "new"}}})
+
+    checkpoint = make_checkpoint(collections, target_sha="new")
+    assert checkpoint.begin() == set()
+    checkpoint.add("Kept.java", [[[2.0]]])
+    checkpoint.complete()
+
+    assert ranked_embeddings(collections) == [("Kept.java", [[[2.0]]])]
+    assert len(embeddings.documents) == 1
+
+
+def test_new_commit_starts_a_new_manifest_and_drops_removed_files(collections):
+    repos, embeddings = collections
+    previous = make_checkpoint(collections, target_sha="old")
+    previous.begin()
+    previous.add("Removed.java", [[[1.0]]])
+    previous.add("Kept.java", [[[1.0]]])
+    previous.complete()
+
+    checkpoint = make_checkpoint(collections, target_sha="new", batch_size=1)
+    assert checkpoint.begin() == set()
+    checkpoint.add("Kept.java", [[[2.0]]])
+
+    # Reports keep ranking the complete previous index until the new one is complete
+    assert repos.find_one({'owner': "octocat"})['commit_sha'] == "old"
+    assert ranked_embeddings(collections) == [("Kept.java", [[[1.0]]]), ("Removed.java", [[[1.0]]])]
+
+    checkpoint.complete()
+
+    assert repos.find_one({'owner': "octocat"})['commit_sha'] == "new"
+    assert ranked_embeddings(collections) == [("Kept.java", [[[2.0]]])]
+    assert len(embeddings.documents) == 1
+
+
+def test_abandoned_attempt_at_another_commit_is_deleted(collections):
+    repos, embeddings = collections
+    abandoned = make_checkpoint(collections, target_sha="old", batch_size=1)
+    abandoned.begin()
+    abandoned.add("A.java", [[[1.0]]])
+
+    checkpoint = make_checkpoint(collections, target_sha="new")
+    assert checkpoint.begin() == set()
+    assert embeddings.documents == []
+    assert 'commit_sha' not in repos.find_one({'owner': "octocat"})
+
+
+def test_batches_can_be_flushed_by_the_caller(collections):
+    repos, embeddings = collections
+    checkpoint = make_checkpoint(collections)
+    checkpoint.begin()
+
+    checkpoint.add("A.java", [[[1.0]]], flush=False)
+    checkpoint.add("B.java", [[[1.0]]], flush=False)
+    assert checkpoint.full and embeddings.bulk_writes == 0
+
+    checkpoint.flush()
+    assert not checkpoint.full and embeddings.bulk_writes == 1
+
+
+class UnderPressure:
+    """
+    Memory tracker of a job that stays close to its budget, as RSS rarely drops once it has grown.
+    """
+
+    def under_pressure(self):
+        return True
+
+    def checkpoint(self, stage):
+        pass
+
+
+def test_initialization_under_memory_pressure_halves_batches_once_per_stored_batch(monkeypatch, collections):
+    repos, embeddings = collections
+    routes = [f"F{i}.java" for i in range(20)]
+    monkeypatch.setenv("INITIALIZATION_BATCH_SIZE", "8")
+    monkeypatch.setattr(routes_module.db, 'get_repo_collection', lambda: repos)
+    monkeypatch.setattr(routes_module.db, 'get_embeddings_collection', lambda: embeddings)
+    monkeypatch.setattr(routes_module, 'send_update_to_probot', lambda *args: None)
+    monkeypatch.setattr(routes_module, 'clone_repo', lambda repo_url, repo_dir: None)
+    monkeypatch.setattr(routes_module, 'filter_files', lambda repo_dir: routes)
+    monkeypatch.setattr(routes_module, 'iter_preprocessed_source_code', lambda repo_dir, skip, with_terms: (
+        (f"{repo_dir}/{route}", route, [[[1.0]]], {'term': 1}) for route in routes))
+    repo_info = {'repo_url': "https://github.com/octocat/repo", 'owner': "octocat", 'repo_name': "repo",
+                 'latest_commit_sha': "abc123"}
+
+    routes_module.process_and_store_embeddings(repo_info, 1, memory=UnderPressure())
+
+    assert embeddings.batch_sizes == [4, 2] + [1] * 14
+    assert repos.find_one({'owner': "octocat"})['commit_sha'] == "abc123"
+    assert [route for route, _ in ranked_embeddings(collections)] == sorted(routes)
+
+
+class PressureAfter:
+    """
+    Memory tracker of a job that comes close to its budget at its `calls`-th check and stays there.
+    """
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def under_pressure(self):
+        self.calls -= 1
+        return self.calls <= 0
+
+    def checkpoint(self, stage):
+        pass
+
+
+@pytest.fixture
+def indexed_repository(monkeypatch, collections):
+    """
+    A repository initialized at abc123 with Old.java, the database calls of the routes go to the fake collections.
+    """
+    repos, embeddings = collections
+    checkpoint = make_checkpoint(collections)
+    checkpoint.begin()
+    checkpoint.add("Old.java", [[[0.0]]])
+    checkpoint.complete()
+    embeddings.batch_sizes = []
+    monkeypatch.setattr(routes_module.db, 'get_repo_collection', lambda: repos)
+    monkeypatch.setattr(routes_module.db, 'get_embeddings_collection', lambda: embeddings)
+    return {'owner': "octocat", 'repo_name': "repo", 'latest_commit_sha': "def456"}
+
+
+def changed_files(monkeypatch, routes, fail_after=None):
+    def iter_preprocessed_source_code(repo_dir, with_terms):
+        for i, route in enumerate(routes):
+            if i == fail_after:
+                raise Cancelled("superseded by a newer commit")
+            yield f"{repo_dir}/{route}", route, [[[1.0]]], {'term': 1}
+    monkeypatch.setattr(routes_module, 'iter_preprocessed_source_code', iter_preprocessed_source_code)
+
+
+def test_patch_under_memory_pressure_stages_early_and_halves_once_per_staged_batch(monkeypatch, collections,
+                                                                                  indexed_repository):
+    repos, embeddings = collections
+    routes = [f"F{i}.java" for i in range(12)]
+    changed_files(monkeypatch, routes)
+
+    routes_module.process_and_patch_embeddings({}, indexed_repository, "abc123", memory=PressureAfter(6))
+
+    # The 6 files held are staged, then batches of 3, then 1, then the 12 staged files are applied at once
+    assert embeddings.batch_sizes == [6, 3, 1, 1, 1, 12]
+    repo = repos.find_one({'owner': "octocat"})
+    assert repo['commit_sha'] == "def456" and 'patch_staging' not in repo
+    assert [route for route, _ in ranked_embeddings(collections)] == sorted(routes + ["Old.java"])
+    assert len(embeddings.documents) == 13
+
+
+def test_failed_patch_discards_its_staged_embeddings(monkeypatch, collections, indexed_repository):
+    repos, embeddings = collections
+    changed_files(monkeypatch, ["Old.java", "New.java", "Other.java"], fail_after=2)
+
+    with pytest.raises(Cancelled):
+        routes_module.process_and_patch_embeddings({}, indexed_repository, "abc123", memory=PressureAfter(1))
+
+    # Reports keep ranking the index at the stored commit, nothing was staged or applied
+    repo = repos.find_one({'owner': "octocat"})
+    assert repo['commit_sha'] == "abc123" and 'patch_staging' not in repo
+    assert ranked_embeddings(collections) == [("Old.java", [[[0.0]]])]
+    assert len(embeddings.documents) == 1
+
+
+def test_staged_embeddings_of_a_crashed_patch_are_deleted_by_the_next_one(collections, indexed_repository):
+    repos, embeddings = collections
+    crashed = PatchStaging(repos, embeddings, "octocat", "repo")
+    crashed.add([{'path': "New.java", 'embedding_text': [[[1.0]]]}])
+
+    staging = PatchStaging(repos, embeddings, "octocat", "repo")
+    staging.add([{'path': "Other.java", 'embedding_text': [[[1.0]]]}])
+
+    assert sorted(d['route'] for d in embeddings.documents) == ["Old.java", "Other.java"]
+    assert repos.find_one({'owner': "octocat"})['patch_staging']['embeddings_id'] == staging.staging_id
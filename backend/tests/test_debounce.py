@@ -0,0 +1,61 @@
+import threading
+import time
+
+from services.debounce import Debouncer
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_burst_is_merged_into_one_call_with_latest_args():
+    calls = []
+    debouncer = Debouncer(lambda repo_info: calls.append(repo_info['latest_commit_sha']), delay=0.1)
+
+    merged = [debouncer.trigger(("owner", "repo"), {'latest_commit_sha': sha}) for sha in ["a1", "b2", "c3"]]
+
+    assert merged == [1, 2, 3]
+    assert wait_until(lambda: calls)
+    time.sleep(0.15)
+    assert calls == ["c3"]
+    assert debouncer.pending() == []
+
+
+def test_keys_are_debounced_independently():
+    calls = []
+    lock = threading.Lock()
+
+    def record(name):
+        with lock:
+            calls.append(name)
+
+    debouncer = Debouncer(record, delay=0.05)
+    debouncer.trigger(("owner", "repo1"), "repo1")
+    debouncer.trigger(("owner", "repo2"), "repo2")
+
+    assert wait_until(lambda: len(calls) == 2)
+    assert sorted(calls) == ["repo1", "repo2"]
+
+
+def test_max_delay_bounds_postponement():
+    calls = []
+    debouncer = Debouncer(lambda: calls.append(time.monotonic()), delay=0.2, max_delay=0.3)
+
+    start = time.monotonic()
+    # Keep triggering faster than the quiet period
+    while time.monotonic() - start < 0.6 and not calls:
+        debouncer.trigger("repo")
+        time.sleep(0.05)
+
+    assert wait_until(lambda: calls)
+    assert calls[0] - start < 0.5
+
+
+def test_failing_call_is_contained():
+    debouncer = Debouncer(lambda: 1 / 0, delay=0.01)
+    debouncer.trigger("repo")
+
+    assert wait_until(lambda: debouncer.pending() == [])
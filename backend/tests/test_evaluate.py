@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from benchmarks.evaluate import (Engine, average_precision, build_index, evaluate_engine, load_dataset, relevant_ranks,
+                                 summarize)
+
+
+def test_fixed_files_match_route_suffixes():
+    ranked = ["src/main/java/org/app/Cart.java", "src/main/java/org/app/Entry.java", "src/test/EntryTest.java"]
+
+    assert relevant_ranks(ranked, ["org/app/Entry.java"]) == [2]
+    assert relevant_ranks(ranked, ["app/Entry.java", "src/test/EntryTest.java"]) == [2, 3]
+    assert relevant_ranks(ranked, ["Entry.java"]) == [2]
+
+
+def test_summary_metrics():
+    per_bug = [{'ranks': [1, 3], 'relevant': 2},   # AP = (1/1 + 2/3) / 2
+               {'ranks': [4], 'relevant': 2},      # AP = (1/4) / 2, one fixed file was never ranked
+               {'ranks': [], 'relevant': 1}]
+
+    metrics = summarize(per_bug, [0.010, 0.030, 0.020], {'index_bytes': 0})
+
+    assert metrics['top_1'] == round(1 / 3, 4) and metrics['top_5'] == round(2 / 3, 4)
+    assert metrics['mrr'] == round((1 + 1 / 4 + 0) / 3, 4)
+    assert metrics['map'] == round(((1 + 2 / 3) / 2 + 1 / 8 + 0) / 3, 4)
+    assert metrics['latency_p50_ms'] == 20.0 and metrics['latency_p95_ms'] == 30.0
+    assert average_precision([], 0) == 0.0
+
+
+def test_engine_specs():
+    engine = Engine("hashed:ranking=numpy,precision=float16")
+    assert (engine.encoder, engine.ranking, engine.precision) == ("hashed", "numpy", "float16")
+
+    with pytest.raises(ValueError):
+        Engine("hashed:precision=int3")
+
+
+class LowercasePreprocessor:
+    """
+    Skips the NLTK steps, so the evaluation runs without the NLTK corpora.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def preprocess_tokens(self, text, stop_words_path):
+        return text.lower().replace('{', ' ').replace('}', ' ').split()
+
+    def encode_tokens(self, tokens):
+        return self.engine.bug_localizer.encode_text(" ".join(tokens))
+
+    def preprocess_text(self, text, stop_words_path):
+        return self.encode_tokens(self.preprocess_tokens(text, stop_words_path))
+
+
+def test_evaluation_ranks_reports_against_their_snapshot(tmp_path):
+    repo = tmp_path / "snapshots" / "app"
+    (repo / "src" / "org" / "app").mkdir(parents=True)
+    (repo / "src" / "org" / "app" / "ProfileSettings.java").write_text("class ProfileSettings { save profile settings }")
+    (repo / "src" / "org" / "app" / "Cart.java").write_text("class Cart { total price checkout items }")
+    (repo / "README.md").write_text("profile settings profile settings")
+    dataset = tmp_path / "bugs.jsonl"
+    dataset.write_text(json.dumps({'bug_id': 1, 'repo': "snapshots/app", 'report': "saving profile settings fails",
+                                   'fixed_files': ["org/app/ProfileSettings.java"]}) + "\n" +
+                       json.dumps({'bug_id': 2, 'repo': "snapshots/app", 'report': "checkout total price is wrong",
+                                   'fixed_files': ["org/app/Cart.java"]}) + "\n")
+    engine = Engine("hashed:precision=float16")
+
+    metrics = evaluate_engine(engine, load_dataset(dataset), LowercasePreprocessor(engine))
+
+    assert metrics['bugs'] == 2 and metrics['top_1'] == 1.0 and metrics['mrr'] == 1.0
+    assert metrics['index_files'] == 2 and metrics['index_bytes'] == metrics['index_chunks'] * 768 * 2
+
+
+def test_hybrid_engine_only_ranks_lexical_candidates(tmp_path):
+    repo = tmp_path / "app"
+    (repo / "org").mkdir(parents=True)
+    (repo / "org" / "ProfileSettings.java").write_text("class ProfileSettings { save profile settings }")
+    (repo / "org" / "Cart.java").write_text("class Cart { total price checkout items }")
+    (repo / "org" / "Invoice.java").write_text("class Invoice { print invoice lines }")
+    dataset = tmp_path / "bugs.jsonl"
+    dataset.write_text(json.dumps({'bug_id': 1, 'repo': "app", 'report': "checkout total is wrong",
+                                   'fixed_files': ["org/Cart.java"]}) + "\n")
+    engine = Engine("hashed:ranking=hybrid,candidates=1")
+    preprocessor = LowercasePreprocessor(engine)
+
+    metrics = evaluate_engine(engine, load_dataset(dataset), preprocessor)
+    embeddings, lexical_index = build_index(engine, preprocessor, repo)
+    query, tokens = engine.preprocess(preprocessor, "checkout total is wrong")
+
+    assert metrics['top_1'] == 1.0 and len(lexical_index) == 3
+    assert [route for route, _ in engine.rank_files(query, embeddings, tokens, lexical_index)] == ["org/Cart.java"]
@@ -0,0 +1,196 @@
+import io
+import json
+import tempfile
+import threading
+import time
+import zipfile
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from services import github_client
+from services.github_client import GitHubClient, GitHubRateLimitError
+
+COMPARE_PATH = "/repos/owner/repo/compare/abc...def"
+REPO_PATH = "/repos/owner/repo"
+ZIPBALL_PATH = "/repos/owner/repo/zipball/def"
+
+
+def make_zipball():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("owner-repo-def/src/Main.java", "public class Main {}")
+    return buffer.getvalue()
+
+
+class StubGitHub(BaseHTTPRequestHandler):
+    """
+    Serves a compare, a repository and a zipball, with ETags and scripted rate limiting.
+    """
+    requests = []
+    rate_limited = 0
+    zipball = make_zipball()
+
+    def do_GET(self):
+        StubGitHub.requests.append((self.path, dict(self.headers)))
+
+        if StubGitHub.rate_limited > 0:
+            StubGitHub.rate_limited -= 1
+            self.send_response(403)
+            self.send_header("X-RateLimit-Limit", "60")
+            self.send_header("X-RateLimit-Remaining", "0")
+            self.send_header("X-RateLimit-Reset", str(int(time.time())))
+            self.end_headers()
+            return
+
+        if self.path in (COMPARE_PATH, REPO_PATH):
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = json.dumps({"path": self.path, "files": []}).encode()
+            self.send_response(200)
+            self.send_header("ETag", '"v1"')
+            self.send_header("X-RateLimit-Limit", "60")
+            self.send_header("X-RateLimit-Remaining", "59")
+            self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        elif self.path == ZIPBALL_PATH:
+            body = StubGitHub.zipball
+            self.send_response(200)
+        else:
+            body = b'{"message": "Not Found"}'
+            self.send_response(404)
+
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    StubGitHub.requests = []
+    StubGitHub.rate_limited = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGitHub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_compare_is_cached_after_first_request(stub_server, tmp_path):
+    client = GitHubClient(base_url=stub_server, cache_dir=tmp_path)
+
+    first = client.compare("owner", "repo", "abc", "def")
+    second = GitHubClient(base_url=stub_server, cache_dir=tmp_path).compare("owner", "repo", "abc", "def")
+
+    assert first == second == {"path": COMPARE_PATH, "files": []}
+    assert len(StubGitHub.requests) == 1
+    assert client.rate_limit()["remaining"] == 59
+
+
+def test_cache_dir_is_created_on_first_write(stub_server, tmp_path):
+    cache_dir = tmp_path / "github"
+    client = GitHubClient(base_url=stub_server, cache_dir=str(cache_dir))
+    assert not cache_dir.exists()
+
+    client.get_json(REPO_PATH)
+
+    assert len(list(cache_dir.iterdir())) == 1
+
+
+def test_conditional_requests_revalidate_with_etag(stub_server, tmp_path):
+    client = GitHubClient(base_url=stub_server, token="secret", cache_dir=tmp_path)
+
+    assert client.get_json(REPO_PATH)["path"] == REPO_PATH
+    assert client.get_json(REPO_PATH)["path"] == REPO_PATH
+
+    (_, first_headers), (_, second_headers) = StubGitHub.requests
+    assert "If-None-Match" not in first_headers
+    assert second_headers["If-None-Match"] == '"v1"'
+    assert second_headers["Authorization"] == "Bearer secret"
+
+
+def test_rate_limited_requests_wait_and_retry(stub_server):
+    StubGitHub.rate_limited = 1
+    client = GitHubClient(base_url=stub_server, max_rate_limit_wait=5)
+
+    assert client.get_json(REPO_PATH)["path"] == REPO_PATH
+    assert len(StubGitHub.requests) == 2
+
+
+def test_rate_limit_too_far_away_raises(stub_server):
+    StubGitHub.rate_limited = 1
+    client = GitHubClient(base_url=stub_server, max_rate_limit_wait=0)
+
+    with pytest.raises(GitHubRateLimitError):
+        client.get_json(REPO_PATH)
+
+
+def test_missing_resource_returns_none(stub_server):
+    client = GitHubClient(base_url=stub_server)
+
+    assert client.get_json("/repos/owner/missing") is None
+
+
+def test_zipball_is_streamed_to_a_zipfile(stub_server):
+    client = GitHubClient(base_url=stub_server)
+
+    with client.download_zipball("owner", "repo", "def") as archive:
+        assert archive.read("owner-repo-def/src/Main.java") == b"public class Main {}"
+
+    assert client.download_zipball("owner", "repo", "missing") is None
+
+
+def test_closing_the_zipball_closes_its_temporary_file(stub_server, monkeypatch):
+    files = []
+    make_temporary_file = tempfile.TemporaryFile
+
+    def temporary_file():
+        files.append(make_temporary_file())
+        return files[-1]
+
+    monkeypatch.setattr(github_client.tempfile, "TemporaryFile", temporary_file)
+
+    with GitHubClient(base_url=stub_server).download_zipball("owner", "repo", "def") as archive:
+        assert not files[0].closed
+
+    assert files[0].closed
+
+
+def rate_limited_response(**headers):
+    response = requests.Response()
+    response.status_code = 429
+    response.headers.update(headers)
+    return response
+
+
+@pytest.mark.parametrize("retry_after, expected", [
+    ("7", 7),
+    (lambda: formatdate(time.time() + 30, usegmt=True), 30),
+    (lambda: formatdate(time.time() - 30, usegmt=True), 0),
+    ("soon", 60),
+])
+def test_retry_after_accepts_seconds_and_http_dates(retry_after, expected):
+    if callable(retry_after):
+        retry_after = retry_after()
+    wait = github_client._rate_limited_wait(rate_limited_response(**{"Retry-After": retry_after}))
+
+    assert wait == pytest.approx(expected, abs=2)
+
+
+def test_shared_client_is_created_on_first_use(monkeypatch, tmp_path):
+    monkeypatch.setattr(github_client, "_client", None)
+    monkeypatch.setenv("GITHUB_API_URL", "http://127.0.0.1:1/")
+    monkeypatch.setenv("GITHUB_CACHE_DIR", str(tmp_path / "github"))
+
+    client = github_client.get_github_client()
+
+    assert client is github_client.get_github_client()
+    assert client.base_url == "http://127.0.0.1:1"
+    assert not (tmp_path / "github").exists()
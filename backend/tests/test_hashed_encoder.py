@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from services import encoder
+from services.hashed_encoder import HashedEncoder
+
+
+def test_encodings_are_deterministic_and_normalized():
+    text = "null pointer exception profile controller save " * 30
+
+    first = HashedEncoder().encode_text(text)
+    second = HashedEncoder().encode_text(text)
+
+    assert first == second
+    # One [vector] per 500-character chunk, like BugLocalization
+    assert len(first) == -(-len(text) // 500)
+    assert all(len(chunk) == 1 and len(chunk[0]) == 768 for chunk in first)
+    assert np.allclose(np.linalg.norm(np.asarray(first)[:, 0], axis=1), 1.0)
+
+
+def test_files_sharing_words_with_the_query_rank_first():
+    hashed = HashedEncoder(dim=256)
+    query = hashed.encode_text("profile settings save fails")
+    files = [("Cart.java", hashed.encode_text("cart item price total checkout")),
+             ("Profile.java", hashed.encode_text("profile settings save user")),
+             ("Empty.java", hashed.encode_text(""))]
+
+    ranked = hashed.rank_files(query, files)
+
+    assert [route for route, _ in ranked] == ["Profile.java", "Cart.java", "Empty.java"]
+
+
+def test_encoder_backend_selects_the_hashed_encoder(monkeypatch):
+    monkeypatch.setattr(encoder, '_bug_localizer', None)
+    monkeypatch.setenv("ENCODER_BACKEND", "hashed")
+    monkeypatch.setenv("HASHED_ENCODER_DIM", "64")
+
+    bug_localizer = encoder.get_bug_localizer()
+
+    assert isinstance(bug_localizer, HashedEncoder) and bug_localizer.dim == 64
+    monkeypatch.setattr(encoder, '_bug_localizer', None)
+
+
+def test_unknown_encoder_backend_is_rejected(monkeypatch):
+    monkeypatch.setattr(encoder, '_bug_localizer', None)
+    monkeypatch.setenv("ENCODER_BACKEND", "word2vec")
+
+    with pytest.raises(ValueError):
+        encoder.get_bug_localizer()
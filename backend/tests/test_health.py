@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from app.api import routes as routes_module
+from index import create_app
+
+
+@pytest.fixture
+def client():
+    return create_app({'TESTING': True}).test_client()
+
+
+def test_healthz_responds_without_touching_the_database(client):
+    response = client.get('/healthz')
+
+    assert response.status_code == 200
+    assert response.get_json() == {"status": "ok"}
+    assert not routes_module.db.is_connected()
+
+
+def test_readyz_reports_the_app_ready_after_create_app(client):
+    response = client.get('/readyz')
+
+    assert response.status_code == 200
+    assert response.get_json()['components']['app']['status'] == 'ready'
+
+
+def test_readyz_is_unavailable_while_a_component_is_pending(client):
+    routes_module.readiness.require('tests', "Pending component")
+    try:
+        response = client.get('/readyz')
+        assert response.status_code == 503
+        assert response.get_json()['ready'] is False
+    finally:
+        routes_module.readiness.mark_ready('tests')
+
+
+def test_importing_the_app_does_not_load_the_model_or_nltk():
+    # Run in a fresh interpreter, other tests may already have imported them
+    code = "import sys, index; index.create_app(); print(sorted({'torch', 'transformers', 'nltk'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=60,
+                            cwd=Path(__file__).parent.parent, env={**os.environ, "WARMUP_ON_START": "False"})
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_admin_warmup_requires_the_admin_token(client, monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+
+    assert client.post('/admin/warmup').status_code == 403
+
+
+def test_admin_warmup_gates_readiness(client, monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(routes_module.warmup, 'steps', [('model', lambda: None)])
+
+    response = client.post('/admin/warmup?wait=true&force=true', headers={'X-Admin-Token': "secret"})
+
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'succeeded'
+    assert client.get('/readyz').get_json()['components']['warmup']['status'] == 'ready'
@@ -0,0 +1,125 @@
+import threading
+
+import numpy as np
+import pytest
+
+from services import ranking
+from services.inference_sidecar import InferenceServer, SidecarEncoder, SidecarError
+
+DIM = 4
+
+
+def fake_tokenize(texts):
+    return [[len(text), ord(text[0]) if text else 0] for text in texts]
+
+
+class FakeModel:
+    """
+    Encodes a sequence as its normalized first DIM ids (zero padded) and records batch sizes.
+    """
+
+    def __init__(self):
+        self.batches = []
+
+    def encode_batch(self, token_ids):
+        self.batches.append(len(token_ids))
+        vectors = np.zeros((len(token_ids), DIM), dtype=np.float32)
+        for row, ids in enumerate(token_ids):
+            values = ids[:DIM]
+            vectors[row, :len(values)] = values
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-8)
+
+
+@pytest.fixture
+def sidecar(tmp_path):
+    model = FakeModel()
+    server = InferenceServer(str(tmp_path / "encoder.sock"), model.encode_batch, fake_tokenize,
+                             max_batch_size=8, max_batch_wait_ms=50)
+    server.start()
+    yield server, model
+    server.stop()
+
+
+def test_encode_ids_round_trip(sidecar):
+    server, _ = sidecar
+    client = SidecarEncoder(server.socket_path)
+
+    vectors = client.encode_ids([[3, 4], [1, 0, 0, 0]])
+
+    assert vectors.shape == (2, DIM)
+    np.testing.assert_allclose(vectors[0], [0.6, 0.8, 0, 0], atol=1e-6)
+    np.testing.assert_allclose(vectors[1], [1, 0, 0, 0], atol=1e-6)
+    assert client.ping()
+
+
+def test_encode_text_matches_bug_localization_shape(sidecar):
+    server, _ = sidecar
+    client = SidecarEncoder(server.socket_path)
+
+    embeddings = client.encode_text("a" * 1200)
+
+    # Three 500-character chunks, each [vector] like BugLocalization.encode_text
+    assert len(embeddings) == 3
+    assert all(len(embedding) == 1 and len(embedding[0]) == DIM for embedding in embeddings)
+    assert client.encode_text("") == []
+
+
+def test_concurrent_requests_are_batched(sidecar):
+    server, model = sidecar
+    barrier = threading.Barrier(6)
+    results = {}
+
+    def encode(i):
+        client = SidecarEncoder(server.socket_path)
+        barrier.wait()
+        results[i] = client.encode_ids([[i + 1]])
+
+    threads = [threading.Thread(target=encode, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 6
+    assert all(results[i].shape == (1, DIM) for i in range(6))
+    assert len(model.batches) < 6
+    assert sum(model.batches) == 6
+
+
+def test_encoder_errors_are_reported_to_the_client(tmp_path):
+    def failing_encode(token_ids):
+        raise RuntimeError("out of memory")
+
+    server = InferenceServer(str(tmp_path / "encoder.sock"), failing_encode, fake_tokenize)
+    server.start()
+    try:
+        client = SidecarEncoder(server.socket_path)
+        with pytest.raises(SidecarError, match="out of memory"):
+            client.encode_ids([[1, 2]])
+        # The connection stays usable after an error
+        assert client.ping()
+    finally:
+        server.stop()
+
+
+def test_unavailable_sidecar_raises(tmp_path):
+    client = SidecarEncoder(str(tmp_path / "missing.sock"))
+
+    with pytest.raises(SidecarError):
+        client.encode_ids([[1]])
+
+
+def test_rank_files_uses_best_chunk_similarity():
+    query = [[[1.0, 0.0]], [[0.0, 1.0]]]
+    files = [
+        ("a.java", [[[1.0, 1.0]]]),
+        ("b.java", [[[0.0, 2.0]], [[-1.0, 0.0]]]),
+        ("empty.java", []),
+    ]
+
+    ranked = ranking.rank_files(query, files)
+
+    assert [file_id for file_id, _ in ranked] == ["b.java", "a.java", "empty.java"]
+    assert ranked[0][1] == pytest.approx(1.0)
+    assert ranked[1][1] == pytest.approx(np.sqrt(0.5))
+    assert ranked[2][1] == float('-inf')
@@ -0,0 +1,62 @@
+import io
+import zipfile
+
+import pytest
+import requests
+from git import Repo
+
+from benchmarks.loadtest import prepare_fixtures, run_load, synthetic_requests
+from benchmarks.stub_server import StubServer
+
+
+@pytest.fixture
+def stub(tmp_path):
+    fixtures = prepare_fixtures(tmp_path / "fixtures", repos=1, files=20, lines_per_file=30)
+    server = StubServer(tmp_path / "fixtures").start()
+    yield server, fixtures[0]
+    server.stop()
+
+
+def test_stub_serves_compare_and_zipball(stub):
+    server, fixture = stub
+    base = f"{server.url}/repos/{fixture['owner']}/{fixture['repo_name']}"
+
+    compare = requests.get(f"{base}/compare/{fixture['initial_sha']}...{fixture['latest_sha']}").json()
+    zipball = requests.get(f"{base}/zipball/{fixture['latest_sha']}")
+
+    assert len(compare['files']) == 2 and all(f['status'] == 'modified' for f in compare['files'])
+    names = zipfile.ZipFile(io.BytesIO(zipball.content)).namelist()
+    assert any(name.endswith(compare['files'][0]['filename']) for name in names)
+    assert requests.get(f"{server.url}/repos/{fixture['owner']}/missing/zipball/HEAD").status_code == 404
+    assert requests.get(f"{server.url}/git/{fixture['owner']}/{fixture['repo_name']}.git/../../x").status_code == 404
+
+
+def test_stub_repository_can_be_cloned(stub, tmp_path):
+    server, fixture = stub
+
+    clone = Repo.clone_from(server.clone_url(fixture['owner'], fixture['repo_name']), tmp_path / "clone")
+
+    assert clone.head.commit.hexsha == fixture['latest_sha']
+
+
+def test_load_run_measures_every_request(stub):
+    server, fixture = stub
+    messages = [('/post-message', {'owner': fixture['owner'], 'repo': fixture['repo_name'], 'comment_id': i,
+                                   'message': "Working on it"}) for i in range(1, 9)]
+
+    results = run_load(server.url, messages + [('/post-message', {})], concurrency=3)
+
+    assert results['/post-message']['requests'] == 9
+    assert results['/post-message']['errors'] == 1 and results['/post-message']['statuses'] == {'200': 8, '400': 1}
+    assert results['overall']['latency_p50_ms'] <= results['overall']['latency_max_ms']
+    assert server.stats()['messages'] == 8
+
+
+def test_mixed_scenario_points_requests_at_the_stub(stub):
+    server, fixture = stub
+
+    load = synthetic_requests('mixed', [fixture], server, 20)
+
+    assert [endpoint for endpoint, _ in load].count('/initialization') == 2
+    assert load[1][1]['repository']['repo_url'] == server.clone_url(fixture['owner'], fixture['repo_name'])
+    assert load[1][1]['repository']['latest_commit_sha'] == fixture['latest_sha']
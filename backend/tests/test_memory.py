@@ -0,0 +1,41 @@
+import tracemalloc
+
+from services.memory import MemoryTracker, peak_rss_bytes, recent_reports, rss_bytes
+
+
+def test_rss_is_reported():
+    assert rss_bytes() > 0 and peak_rss_bytes() > 0
+
+
+def test_tracker_without_a_budget_is_never_under_pressure():
+    with MemoryTracker('initialization octocat/repo') as memory:
+        ballast = bytearray(32 * 2 ** 20)
+        assert not memory.under_pressure()
+        del ballast
+
+
+def test_growth_past_the_threshold_of_the_budget_is_pressure():
+    with MemoryTracker('initialization octocat/big-repo', budget_bytes=16 * 2 ** 20) as memory:
+        assert not memory.under_pressure()
+        ballast = bytearray(b'x' * (32 * 2 ** 20))
+        assert memory.under_pressure()
+        record = memory.checkpoint('index')
+        assert record['used_bytes'] >= 16 * 2 ** 20
+        del ballast
+
+    report = recent_reports()[-1]
+    assert report['job'] == 'initialization octocat/big-repo'
+    assert [stage['stage'] for stage in report['stages']] == ['index', 'end']
+    assert report['peak_used_bytes'] >= 16 * 2 ** 20
+
+
+def test_top_allocators_are_recorded_while_tracked():
+    with MemoryTracker('patch octocat/repo', trace_top=3) as memory:
+        ballast = [str(i) * 10 for i in range(50000)]
+        record = memory.checkpoint('preprocess')
+        del ballast
+
+    assert len(record['top_allocators']) == 3
+    assert "test_memory.py" in record['top_allocators'][0]['location']
+    assert not tracemalloc.is_tracing()
+
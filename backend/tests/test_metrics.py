@@ -0,0 +1,89 @@
+import json
+import os
+
+import pytest
+
+from index import create_app
+from services.metrics import MetricsRegistry, STAGE_SECONDS, record_repo_size, repo_size_bucket, repo_size_scope
+from services.timing import StageTimer
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('test_seconds', "Test durations.", ('stage',), buckets=(0.1, 1))
+
+    histogram.observe(0.05, stage='clone')
+    histogram.observe(0.5, stage='clone')
+    histogram.observe(5, stage='clone')
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP test_seconds Test durations.", "# TYPE test_seconds histogram"]
+    assert 'test_seconds_bucket{stage="clone",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="clone",le="1"} 2' in lines
+    assert 'test_seconds_bucket{stage="clone",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{stage="clone"} 5.55' in lines
+    assert 'test_seconds_count{stage="clone"} 3' in lines
+
+
+def test_counter_and_gauge_render_and_label_values_are_escaped():
+    registry = MetricsRegistry()
+    counter = registry.counter('test_total', "Test counter.", ('name',))
+    registry.gauge('test_depth', "Test gauge.", lambda: 7)
+
+    counter.inc(name='a "quoted" name')
+    counter.inc(2, name='a "quoted" name')
+
+    output = registry.render()
+    assert 'test_total{name="a \\"quoted\\" name"} 3' in output
+    assert "# TYPE test_depth gauge\ntest_depth 7\n" in output
+
+
+def test_unknown_labels_are_rejected():
+    histogram = MetricsRegistry().histogram('test_seconds', "Test durations.", ('stage',))
+
+    with pytest.raises(ValueError):
+        histogram.observe(1, step='clone')
+
+
+def test_repo_size_label_comes_from_the_repository_scope():
+    record_repo_size("octocat", "sized-repo", 2500)
+    assert repo_size_bucket(2500) == '1000-9999'
+    assert repo_size_bucket(None) == 'unknown'
+
+    with repo_size_scope("octocat", "sized-repo"):
+        StageTimer(pipeline='test').record('rank', 20)
+
+    assert STAGE_SECONDS.count(pipeline='test', stage='rank', repo_size='1000-9999') == 1
+
+
+def test_metrics_endpoint_serves_the_registry():
+    client = create_app({'TESTING': True}).test_client()
+
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert "# TYPE ladybug_stage_seconds histogram" in response.get_data(as_text=True)
+    assert "ladybug_notifier_queue_depth 0" in response.get_data(as_text=True)
+
+
+def test_shared_registry_adds_up_the_workers_and_labels_gauges_by_worker(tmp_path):
+    registry = MetricsRegistry()
+    counter = registry.counter('test_total', "Test counter.", ('name',))
+    histogram = registry.histogram('test_seconds', "Test durations.", buckets=(1,))
+    registry.gauge('test_depth', "Test gauge.", lambda: 7)
+    registry.share(str(tmp_path))
+
+    # Another worker wrote its metrics earlier, then exited
+    (tmp_path / "1.json").write_text(json.dumps({'test_total': [[["a"], 2]], 'test_seconds': [[[], [1, 1], 5.5]],
+                                                 'test_depth': 3}))
+    registry.mark_process_dead(1)
+    counter.inc(name="a")
+    histogram.observe(0.5)
+
+    output = registry.render()
+    assert 'test_total{name="a"} 3' in output
+    assert 'test_seconds_bucket{le="1"} 2' in output
+    assert 'test_seconds_count 3' in output
+    assert f'test_depth{{worker="{os.getpid()}"}} 7' in output
+    assert 'worker="1"' not in output
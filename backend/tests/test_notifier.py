@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from services.notifier import ProbotNotifier
+
+
+class FakeResponse:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error", response=self)
+
+
+class FakeSession:
+    """
+    Records posted payloads, answering with the queued status codes (200 once they run out).
+    """
+
+    def __init__(self, status_codes=(), delay=0):
+        self.status_codes = list(status_codes)
+        self.delay = delay
+        self.posts = []
+        self.lock = threading.Lock()
+
+    def post(self, url, json, timeout):
+        time.sleep(self.delay)
+        with self.lock:
+            self.posts.append((time.monotonic(), json))
+            status_code = self.status_codes.pop(0) if self.status_codes else 200
+        return FakeResponse(status_code)
+
+    def messages(self, comment_id=None):
+        return [payload['message'] for _, payload in self.posts
+                if comment_id is None or payload['comment_id'] == comment_id]
+
+
+def make_notifier(session, **kwargs):
+    notifier = ProbotNotifier("http://localhost:3000/post-message", session=session, **kwargs)
+    notifier.start()
+    return notifier
+
+
+def test_queued_messages_for_same_comment_are_coalesced():
+    session = FakeSession()
+    notifier = ProbotNotifier("http://localhost:3000/post-message", session=session, min_interval=0)
+
+    for step in ["Started", "Preprocessed", "Ranked"]:
+        notifier.notify("owner", "repo", 1, step)
+    assert notifier.stats()['queue_depth'] == 1
+
+    notifier.start()
+    assert notifier.flush(timeout=5)
+
+    assert session.messages() == ["Ranked"]
+    assert notifier.stats()['coalesced'] == 2
+    assert notifier.stats()['sent'] == 1
+
+
+def test_rate_limit_is_per_comment():
+    session = FakeSession()
+    notifier = make_notifier(session, min_interval=0.3)
+
+    notifier.notify("owner", "repo", 1, "first")
+    assert notifier.flush(timeout=5)
+    notifier.notify("owner", "repo", 1, "second")
+    notifier.notify("owner", "other", 2, "other repo")
+
+    # The other comment isn't held back by the rate limit on comment 1
+    deadline = time.time() + 5
+    while "other repo" not in session.messages() and time.time() < deadline:
+        time.sleep(0.01)
+    assert session.messages(comment_id=1) == ["first"]
+
+    assert notifier.flush(timeout=5)
+    first, second = [sent_at for sent_at, payload in session.posts if payload['comment_id'] == 1]
+    assert second - first >= 0.29
+
+
+def test_server_errors_are_retried_with_backoff():
+    session = FakeSession(status_codes=[500, 502])
+    notifier = make_notifier(session, min_interval=0, backoff=0.01)
+
+    notifier.notify("owner", "repo", 1, "Ranked")
+    assert notifier.flush(timeout=5)
+
+    assert session.messages() == ["Ranked"] * 3
+    assert notifier.stats()['retried'] == 2
+    assert notifier.stats()['sent'] == 1
+
+
+@pytest.mark.parametrize("status_codes, retried", [([400], 0), ([500] * 4, 3)])
+def test_failed_deliveries_are_counted(status_codes, retried):
+    session = FakeSession(status_codes=status_codes)
+    notifier = make_notifier(session, min_interval=0, max_retries=3, backoff=0.01)
+
+    notifier.notify("owner", "repo", 1, "Ranked")
+    assert notifier.flush(timeout=5)
+
+    assert notifier.stats()['failed'] == 1
+    assert notifier.stats()['retried'] == retried
+
+
+def test_incomplete_messages_are_ignored():
+    notifier = ProbotNotifier("http://localhost:3000/post-message", session=FakeSession())
+
+    notifier.notify("owner", "repo", None, "Ranked")
+
+    assert notifier.stats()['queue_depth'] == 0
@@ -0,0 +1,102 @@
+import json
+import os
+import time
+
+import pytest
+
+from app.api import routes as routes_module
+from index import create_app
+from services.profiling import RequestProfiler
+
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+def test_sampling_profile_writes_collapsed_stacks(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), interval=0.001)
+
+    with profiler.profile("report-octocat/repo") as run:
+        busy_loop(0.1)
+
+    assert os.path.dirname(run.path) == str(tmp_path) and "report-octocat_repo" in run.path
+    with open(os.path.join(run.path, 'stacks.folded')) as f:
+        stacks = f.read()
+    assert "busy_loop (test_profiling.py:" in stacks
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in stacks.splitlines())
+    with open(os.path.join(run.path, 'summary.json')) as f:
+        summary = json.load(f)
+    assert summary['mode'] == 'sampling' and summary['samples'] > 0
+
+
+def test_cprofile_mode_writes_a_deterministic_profile_even_if_the_run_fails(tmp_path):
+    profiler = RequestProfiler(str(tmp_path))
+
+    with pytest.raises(RuntimeError):
+        with profiler.profile("initialization", mode='cprofile') as run:
+            busy_loop(0.01)
+            raise RuntimeError("failed run")
+
+    assert os.path.exists(os.path.join(run.path, 'profile.pstats'))
+
+
+def test_overlapping_cprofile_runs_fall_back_to_sampling(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), torch_ops=False)
+
+    with profiler.profile("first", mode='cprofile') as first:
+        with profiler.profile("second", mode='cprofile') as second:
+            busy_loop(0.01)
+    with profiler.profile("third", mode='cprofile') as third:
+        busy_loop(0.01)
+
+    assert first.summary['mode'] == 'cprofile' and third.summary['mode'] == 'cprofile'
+    assert second.summary['mode'] == 'sampling' and second.summary['requested_mode'] == 'cprofile'
+    assert not os.path.exists(os.path.join(second.path, 'profile.pstats'))
+
+
+def test_profiled_repositories():
+    profiler = RequestProfiler(repos=["octocat/slow-repo", "acme/*", ""])
+
+    assert profiler.is_profiled_repo("octocat", "slow-repo")
+    assert profiler.is_profiled_repo("acme", "anything")
+    assert not profiler.is_profiled_repo("octocat", "other")
+
+
+REPORT = {
+    'repository': {'repo_url': "https://github.com/octocat/repo", 'owner': "octocat", 'repo_name': "repo",
+                   'default_branch': "main", 'latest_commit_sha': "abc123"},
+    'issue': "App crashes",
+    'comment_id': 1
+}
+
+
+def test_profile_header_profiles_the_report(monkeypatch, tmp_path):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(routes_module.profiler, 'output_dir', str(tmp_path))
+    monkeypatch.setattr(routes_module, 'handle_report', lambda *args: ({"message": "ok"}, 200))
+    client = create_app({'TESTING': True}).test_client()
+
+    response = client.post('/report', json=REPORT, headers={'X-Profile': 'cprofile', 'X-Admin-Token': "secret"})
+
+    assert response.status_code == 200
+    assert response.get_json()['profile'].startswith(str(tmp_path))
+    assert os.path.exists(os.path.join(response.get_json()['profile'], 'profile.pstats'))
+
+
+def test_profile_header_requires_the_admin_token(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(routes_module, 'handle_report', lambda *args: ({"message": "ok"}, 200))
+    client = create_app({'TESTING': True}).test_client()
+
+    assert client.post('/report', json=REPORT, headers={'X-Profile': '1'}).status_code == 403
+    assert 'profile' not in client.post('/report', json=REPORT).get_json()
+
+
+def test_profile_header_is_refused_without_an_admin_token(monkeypatch):
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    monkeypatch.setattr(routes_module, 'handle_report', lambda *args: ({"message": "ok"}, 200))
+    client = create_app({'TESTING': True}).test_client()
+
+    assert client.post('/report', json=REPORT, headers={'X-Profile': 'sampling'}).status_code == 403
@@ -0,0 +1,185 @@
+from concurrent.futures import Future
+
+import pytest
+
+from app.api import routes as routes_module
+from index import create_app
+from services.bm25 import BM25Index, term_counts
+from services.hashed_encoder import HashedEncoder
+
+REPOSITORY = {'repo_url': "https://github.com/octocat/repo", 'owner': "octocat", 'repo_name': "repo",
+              'default_branch': "main", 'latest_commit_sha': "def456"}
+
+FILES = {
+    "Cart.java": "cart total price checkout",
+    "Profile.java": "profile settings save avatar",
+    "Legacy.java": "checkout total discount coupon",
+}
+# Added by the commit after the indexed one
+CHECKOUT_FILES = {"Checkout.java": "checkout payment declined card fails"}
+
+
+@pytest.fixture
+def encoder(monkeypatch):
+    encoder = HashedEncoder(dim=64)
+    monkeypatch.setattr(routes_module, 'get_bug_localizer', lambda: encoder)
+    monkeypatch.setattr(routes_module, 'preprocess_bug_report_text', encoder.encode_text)
+    monkeypatch.setattr(routes_module, 'preprocess_bug_report_with_tokens',
+                        lambda text: (encoder.encode_text(text), text.lower().split()))
+    return encoder
+
+
+@pytest.fixture
+def messages(monkeypatch):
+    messages = []
+    monkeypatch.setattr(routes_module, 'send_update_to_probot',
+                        lambda owner, repo, comment_id, message: messages.append(message))
+    return messages
+
+
+@pytest.fixture
+def client():
+    return create_app({'TESTING': True}).test_client()
+
+
+def post_report(client, issue, **data):
+    return client.post('/report', json={'repository': REPOSITORY, 'issue': issue, 'comment_id': 1, **data})
+
+
+def test_hybrid_ranking_ranks_every_file_of_a_partly_termed_repository(monkeypatch, encoder, messages, client):
+    # Only Cart.java was changed by a push since the repository was indexed without term counts
+    lexical_index = BM25Index.from_term_counts([("Cart.java", term_counts(FILES["Cart.java"].split())),
+                                                ("Profile.java", None), ("Legacy.java", None)])
+    monkeypatch.setenv("HYBRID_RANKING", "True")
+    monkeypatch.setattr(routes_module, 'retrieve_stored_sha', lambda owner, repo_name: "def456")
+    monkeypatch.setattr(routes_module, 'fetch_lexical_index', lambda repo_info: lexical_index)
+    monkeypatch.setattr(routes_module, 'fetch_repo_embeddings',
+                        lambda repo_info: [(route, encoder.encode_text(text)) for route, text in FILES.items()])
+    repo_sizes = []
+    monkeypatch.setattr(routes_module, 'record_repo_size',
+                        lambda owner, repo_name, file_count: repo_sizes.append(file_count))
+
+    response = post_report(client, "Checkout total discount is wrong")
+
+    assert response.status_code == 200
+    assert [route for route, _ in response.get_json()['ranked_files']][:2] == ["Legacy.java", "Cart.java"]
+    # Sized by every file of the repository, also the ones without term counts
+    assert repo_sizes == [3]
+    assert any("Lexical Index Loaded" in message for message in messages)
+    assert not any("Embeddings Fetched" in message for message in messages)
+
+
+def test_async_report_rejects_a_callback_to_another_host(client):
+    response = post_report(client, "Checkout fails", **{'async': True, 'callback_url': "http://10.0.0.1/steal"})
+
+    assert response.status_code == 400
+    assert routes_module.job_queue.stats()[routes_module.JobQueue.QUEUED] == 0
+
+
+@pytest.fixture
+def stored_index(monkeypatch, encoder):
+    """
+    Fakes the stored index: the repository is indexed at abc123, and updating it indexes CHECKOUT_FILES at def456.
+    """
+    index = {'sha': "abc123", 'files': dict(FILES), 'updates': 0}
+
+    def update_repository_index(repo_info):
+        index.update(sha=repo_info['latest_commit_sha'], files={**FILES, **CHECKOUT_FILES},
+                     updates=index['updates'] + 1)
+
+    def fetch_repo_embeddings(repo_info):
+        return [(route, encoder.encode_text(text)) for route, text in index['files'].items()]
+
+    monkeypatch.setattr(routes_module, 'retrieve_stored_sha', lambda owner, repo_name: index['sha'])
+    monkeypatch.setattr(routes_module, 'fetch_repo_embeddings', fetch_repo_embeddings)
+    monkeypatch.setattr(routes_module, 'update_repository_index', update_repository_index)
+    return index
+
+
+@pytest.fixture
+def submitted_jobs(monkeypatch):
+    jobs = []
+    monkeypatch.setattr(routes_module.job_queue, 'submit', lambda kind, func, *args: jobs.append((kind, func, args)))
+    return jobs
+
+
+def test_stale_report_ranks_the_indexed_sha_and_revalidates_in_the_background(monkeypatch, stored_index,
+                                                                             submitted_jobs, messages, client):
+    monkeypatch.setenv("POST_REFRESHED_RANKINGS", "True")
+
+    response = post_report(client, "Checkout payment declined", stale_ok=True)
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['stale'] is True and body['indexed_sha'] == "abc123"
+    assert "Checkout.java" not in [route for route, _ in body['ranked_files']]
+    assert stored_index['updates'] == 0
+
+    # The revalidation job brings the index up to date and posts the ranking, as its top files changed
+    [(kind, func, args)] = submitted_jobs
+    assert kind == 'revalidation'
+    refreshed, status_code = func(*args)
+
+    assert status_code == 200 and refreshed['changed'] is True
+    assert refreshed['indexed_sha'] == "def456" and refreshed['ranked_files'][0][0] == "Checkout.java"
+    assert messages[-1].startswith("🔁 **Ranking Refreshed**: Embeddings are now up to date with `def456`.")
+
+
+def test_unchanged_revalidated_ranking_is_not_posted(monkeypatch, stored_index, submitted_jobs, messages, client):
+    monkeypatch.setenv("POST_REFRESHED_RANKINGS", "True")
+    # The new commit didn't change any file
+    monkeypatch.delitem(CHECKOUT_FILES, "Checkout.java")
+
+    post_report(client, "Profile avatar settings", stale_ok=True)
+    [(_, func, args)] = submitted_jobs
+    refreshed, _ = func(*args)
+
+    assert refreshed['changed'] is False
+    assert not any(message.startswith("🔁") for message in messages)
+
+
+@pytest.mark.parametrize("data, env", [({'stale_ok': False}, "True"), ({}, "False")])
+def test_report_without_stale_while_revalidate_updates_the_index_first(monkeypatch, stored_index, submitted_jobs,
+                                                                       messages, client, data, env):
+    monkeypatch.setenv("STALE_WHILE_REVALIDATE", env)
+
+    response = post_report(client, "Checkout payment declined", **data)
+
+    body = response.get_json()
+    assert body['stale'] is False and body['indexed_sha'] == "def456"
+    assert body['ranked_files'][0][0] == "Checkout.java"
+    assert stored_index['updates'] == 1 and submitted_jobs == []
+
+
+def test_stale_while_revalidate_can_be_enabled_for_every_report(monkeypatch, stored_index, submitted_jobs,
+                                                                 messages, client):
+    monkeypatch.setenv("STALE_WHILE_REVALIDATE", "True")
+
+    body = post_report(client, "Checkout payment declined").get_json()
+
+    assert body['stale'] is True and body['indexed_sha'] == "abc123"
+    assert [kind for kind, _, _ in submitted_jobs] == ['revalidation']
+
+
+class QueuedExecutor:
+    """
+    Executor whose tasks stay queued, like a report executor busy with other reports.
+    """
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, func, *args):
+        self.futures.append(Future())
+        return self.futures[-1]
+
+
+def test_report_that_ends_early_cancels_its_queued_work(monkeypatch, encoder, messages, client):
+    executor = QueuedExecutor()
+    monkeypatch.setattr(routes_module, 'report_executor', executor)
+    monkeypatch.setattr(routes_module, 'retrieve_stored_sha', lambda owner, repo_name: None)
+
+    response = post_report(client, "Checkout fails")
+
+    assert response.status_code == 500
+    assert len(executor.futures) == 2 and all(future.cancelled() for future in executor.futures)
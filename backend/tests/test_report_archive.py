@@ -0,0 +1,48 @@
+import pytest
+
+from services.report_archive import ReportArchive
+
+
+def test_reports_are_archived_under_owner_and_repo(tmp_path):
+    archive = ReportArchive(tmp_path)
+
+    report_file_path = archive.archive("owner", "repo", 123, "App crashes on save")
+    archive.flush()
+
+    assert report_file_path.startswith(str(tmp_path / "owner" / "repo"))
+    assert "-123-" in report_file_path
+    with open(report_file_path, encoding="utf-8") as report_file:
+        assert report_file.read() == "App crashes on save"
+
+
+def test_concurrent_reports_do_not_overwrite_each_other(tmp_path):
+    archive = ReportArchive(tmp_path)
+
+    paths = [archive.archive("owner", "repo", 123, f"report {i}") for i in range(5)]
+    archive.flush()
+
+    assert len(set(paths)) == 5
+    assert sorted(p.read_text() for p in (tmp_path / "owner" / "repo").iterdir()) == [f"report {i}" for i in range(5)]
+
+
+def test_same_repo_name_under_different_owners(tmp_path):
+    archive = ReportArchive(tmp_path)
+
+    archive.archive("alice", "app", 1, "alice's report")
+    archive.archive("bob", "app", 1, "bob's report")
+    archive.flush()
+
+    assert [p.read_text() for p in (tmp_path / "alice" / "app").iterdir()] == ["alice's report"]
+    assert [p.read_text() for p in (tmp_path / "bob" / "app").iterdir()] == ["bob's report"]
+
+
+@pytest.mark.parametrize("owner, repo_name", [("..", "repo"), ("owner", ".."), ("../..", "etc"), ("owner", "a/b"),
+                                              ("/tmp", "repo"), ("owner", "")])
+def test_names_that_are_not_github_names_are_rejected(tmp_path, owner, repo_name):
+    archive = ReportArchive(tmp_path / "reports")
+
+    with pytest.raises(ValueError):
+        archive.archive(owner, repo_name, 1, "report")
+    archive.flush()
+
+    assert list(tmp_path.iterdir()) == []
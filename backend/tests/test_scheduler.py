@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+from services.scheduler import (PriorityScheduler, context, default_encoder_slots, prioritized, INTERACTIVE,
+                                INCREMENTAL, BULK)
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "Condition not met in time"
+        time.sleep(0.005)
+
+
+def enqueue(scheduler, order, priority, tenant, label):
+    """
+    Starts a thread waiting for a slot and returns once it is queued.
+    """
+    waiting = sum(c['waiting'] for c in scheduler.stats()['classes'].values())
+
+    def run():
+        with context(priority, tenant):
+            with scheduler.slot():
+                order.append(label)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    wait_until(lambda: sum(c['waiting'] for c in scheduler.stats()['classes'].values()) == waiting + 1)
+    return thread
+
+
+def test_interactive_work_is_served_before_background_work():
+    scheduler = PriorityScheduler(slots=1)
+    order = []
+    release = threading.Event()
+
+    def hold():
+        with context(BULK, "big-org"):
+            with scheduler.slot():
+                release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    wait_until(lambda: scheduler.stats()['free'] == 0)
+
+    threads = [
+        enqueue(scheduler, order, BULK, "big-org", "bulk"),
+        enqueue(scheduler, order, INCREMENTAL, "other", "incremental"),
+        enqueue(scheduler, order, INTERACTIVE, "other", "interactive"),
+    ]
+    release.set()
+    for thread in [holder] + threads:
+        thread.join()
+
+    assert order == ["interactive", "incremental", "bulk"]
+    assert scheduler.stats()['classes']['interactive']['granted'] == 1
+
+
+def test_tenants_share_a_priority_class_round_robin():
+    scheduler = PriorityScheduler(slots=1)
+    order = []
+    release = threading.Event()
+
+    def hold():
+        with scheduler.slot():
+            release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    wait_until(lambda: scheduler.stats()['free'] == 0)
+
+    threads = [enqueue(scheduler, order, BULK, "big-org", f"big-{i}") for i in range(3)]
+    threads.append(enqueue(scheduler, order, BULK, "small-org", "small-0"))
+    release.set()
+    for thread in [holder] + threads:
+        thread.join()
+
+    assert order == ["big-0", "small-0", "big-1", "big-2"]
+
+
+def test_nested_slots_do_not_deadlock():
+    scheduler = PriorityScheduler(slots=1)
+
+    with scheduler.slot():
+        with scheduler.slot():
+            assert scheduler.stats()['free'] == 0
+
+    assert scheduler.stats()['free'] == 1
+
+
+def test_prioritized_handlers_run_as_the_repository_owner():
+    scheduler = PriorityScheduler(slots=1)
+
+    @prioritized(INTERACTIVE)
+    def handler(repo_info):
+        with scheduler.slot():
+            return "done"
+
+    assert handler({'owner': 'octocat'}) == "done"
+    assert scheduler.stats()['classes']['interactive']['granted'] == 1
+
+
+@pytest.mark.parametrize("env, expected", [
+    ({}, 1),
+    ({"INFERENCE_SOCKET": "/tmp/encoder.sock"}, 32),
+    ({"INFERENCE_SOCKET": "/tmp/encoder.sock", "INFERENCE_MAX_BATCH_SIZE": "8"}, 8),
+    ({"ENCODER_BACKEND": "sidecar", "INFERENCE_SOCKET": "/tmp/encoder.sock"}, 32),
+])
+def test_sidecar_gets_a_batch_of_encoder_slots_by_default(monkeypatch, env, expected):
+    for name in ("ENCODER_BACKEND", "INFERENCE_SOCKET", "INFERENCE_MAX_BATCH_SIZE"):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+
+    assert default_encoder_slots() == expected
@@ -0,0 +1,14 @@
+import serve
+from services import warmup as warmup_module
+
+
+def test_preload_loads_the_model_without_running_it(monkeypatch):
+    monkeypatch.setenv("ENCODER_BACKEND", "hashed")
+    steps = []
+    for name in ('warm_up_nltk', 'warm_up_model', 'warm_up_encode_and_rank'):
+        monkeypatch.setattr(warmup_module, name, lambda name=name: steps.append(name))
+
+    serve.preload_model()
+
+    # The first forward pass starts torch's thread pools, which would be lost in the forked workers
+    assert steps == ['warm_up_nltk', 'warm_up_model']
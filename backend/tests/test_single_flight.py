@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from services.single_flight import SingleFlight, KeyedLock
+
+
+def test_concurrent_calls_share_one_run():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    runs = []
+    results = []
+
+    def reindex():
+        runs.append(1)
+        started.set()
+        release.wait()
+        return "abc123"
+
+    def call():
+        results.append(flight.do(("owner", "repo", "abc123"), reindex))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait()
+
+    followers = [threading.Thread(target=call) for _ in range(4)]
+    for follower in followers:
+        follower.start()
+    # Give the followers time to join the in-flight call
+    time.sleep(0.05)
+    release.set()
+
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert len(runs) == 1
+    assert sorted(results) == [("abc123", False)] + [("abc123", True)] * 4
+    assert not flight.in_flight(("owner", "repo", "abc123"))
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+
+    assert flight.do(("owner", "repo", "sha1"), lambda: 1) == (1, False)
+    assert flight.do(("owner", "repo", "sha2"), lambda: 2) == (2, False)
+
+
+def test_error_is_shared_with_waiting_callers():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def failing_reindex():
+        started.set()
+        release.wait()
+        raise RuntimeError("compare failed")
+
+    def call():
+        try:
+            flight.do("key", failing_reindex)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=call)
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert errors == ["compare failed", "compare failed"]
+
+    # A failed run does not poison later calls
+    assert flight.do("key", lambda: "ok") == ("ok", False)
+
+
+def test_keyed_lock_serializes_same_key():
+    locks = KeyedLock()
+    active = []
+    overlaps = []
+
+    def work():
+        with locks.hold(("owner", "repo")):
+            active.append(1)
+            if len(active) > 1:
+                overlaps.append(1)
+            time.sleep(0.01)
+            active.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert overlaps == []
+
+
+def test_keyed_lock_releases_on_error():
+    locks = KeyedLock()
+
+    with pytest.raises(ValueError):
+        with locks.hold("repo"):
+            raise ValueError
+
+    with locks.hold("repo"):
+        pass
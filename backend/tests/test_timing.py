@@ -0,0 +1,38 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from services.timing import StageTimer
+
+
+def test_stage_records_elapsed_time():
+    timer = StageTimer()
+
+    with timer.stage('retrieve_sha'):
+        time.sleep(0.02)
+
+    timings = timer.as_dict()
+    assert timings['retrieve_sha'] >= 20
+    assert timings['total'] >= timings['retrieve_sha']
+
+
+def test_timed_stages_can_overlap():
+    timer = StageTimer()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        preprocess = executor.submit(timer.timed('preprocess', time.sleep), 0.05)
+        fetch = executor.submit(timer.timed('fetch_embeddings', time.sleep), 0.05)
+        preprocess.result()
+        fetch.result()
+
+    timings = timer.as_dict()
+    assert timings['preprocess'] >= 50 and timings['fetch_embeddings'] >= 50
+    # Both stages ran at the same time, so the total is less than their sum
+    assert timings['total'] < timings['preprocess'] + timings['fetch_embeddings']
+
+
+def test_repeated_stage_accumulates():
+    timer = StageTimer()
+    timer.record('fetch_embeddings', 1.5)
+    timer.record('fetch_embeddings', 2.5)
+
+    assert timer.as_dict()['fetch_embeddings'] == 4.0
@@ -0,0 +1,57 @@
+import threading
+
+from services.readiness import Readiness
+from services.warmup import Warmup
+
+
+def test_readiness_waits_for_the_warmup():
+    readiness = Readiness()
+    release = threading.Event()
+    calls = []
+    warmup = Warmup(readiness, steps=[('model', lambda: release.wait()), ('encode', lambda: calls.append('encode'))])
+
+    assert warmup.start()
+    assert not readiness.is_ready()
+    assert readiness.as_dict()['warmup']['status'] == Readiness.PENDING
+    # A warm-up that is already running isn't started again
+    assert not warmup.start()
+
+    release.set()
+    assert warmup.wait(timeout=5)
+
+    assert readiness.is_ready()
+    assert calls == ['encode']
+    assert set(warmup.status()['timings']) == {'model', 'encode'}
+
+
+def test_failed_warmup_keeps_the_process_unready():
+    readiness = Readiness()
+
+    def missing_corpus():
+        raise LookupError("Resource wordnet not found")
+
+    warmup = Warmup(readiness, steps=[('nltk', missing_corpus)])
+    warmup.start()
+
+    assert not warmup.wait(timeout=5)
+    assert warmup.status()['error'] == "Resource wordnet not found"
+    assert readiness.as_dict()['warmup']['status'] == Readiness.FAILED
+    assert not readiness.is_ready()
+
+
+def test_succeeded_warmup_only_runs_again_when_forced():
+    readiness = Readiness()
+    runs = []
+    warmup = Warmup(readiness, steps=[('model', lambda: runs.append(1))])
+
+    warmup.start()
+    warmup.wait(timeout=5)
+    assert not warmup.start()
+    assert warmup.start(force=True)
+    warmup.wait(timeout=5)
+
+    assert len(runs) == 2
+
+
+def test_wait_without_a_warmup_returns_immediately():
+    assert not Warmup(Readiness(), steps=[]).wait(timeout=5)
@@ -218,6 +218,39 @@ export default (app, {getRouter}) => {
         }
     });
 
+    app.on('push', async (context) => {
+        const {ref, repository} = context.payload;
+
+        // Only pushes to the default branch change the indexed code
+        if (ref !== `refs/heads/${repository.default_branch}`) {
+            return;
+        }
+
+        console.log(`Push to ${ref} in repository ${repository.full_name}`);
+
+        try {
+            const {data: fullRepo} = await context.octokit.repos.get({
+                owner: repository.owner.login,
+                repo: repository.name,
+            });
+
+            const repoData = await sendRepo(fullRepo, context);
+            if (!repoData) {
+                console.error(`sendRepo returned null for ${repository.full_name}. Skipping Axios POST.`);
+                return;
+            }
+
+            await axios.post('http://localhost:5000/push', {repository: repoData, ref}, {
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+            });
+            console.log(`Push for ${repository.full_name} sent to Flask backend.`);
+        } catch (error) {
+            console.error(`Failed to send push for ${repository.full_name}:`, error.message);
+        }
+    });
+
     /**
      * Replies to the issue with an error message.
      *